@@ -1,11 +1,45 @@
 # app.py
 # Main Flask application for simulation backend and SocketIO server.
 # Serves static files, handles real-time events, and loads map data.
+# With SIMULATION_MODE=inprocess the simulation runs as a background task of this server;
+# otherwise it runs in command.py and its output is relayed through the handlers below.
+# command.py may host several towns (TOWNS=...); each has its own room, snapshot and viewers,
+# and browsers pick one with ?town=<id>.
 
 import os
-import json
-from flask import Flask, send_from_directory
-from flask_socketio import SocketIO, emit
+import threading
+from flask import Flask, jsonify, send_from_directory, request
+from flask_socketio import SocketIO, emit, join_room, leave_room
+from simulation.interest import InterestManager
+from simulation.snapshot import SnapshotCache
+from simulation.towns import DEFAULT_TOWN, town_room
+from simulation.transport import OutboundQueue
+from simulation.world import load_map_data
+
+# 'relay' (default): command.py is a separate SocketIO client; 'inprocess': simulate inside this server
+SIMULATION_MODE = os.getenv("SIMULATION_MODE", "relay")
+USE_BINARY_FRAMES = os.getenv("BINARY_FRAMES") == "1"
+# SIM_SPEED runs the in-process simulation faster than real time; BROADCAST_HZ caps state updates per second
+SIM_SPEED = float(os.getenv("SIM_SPEED", "1"))
+BROADCAST_HZ = float(os.getenv("BROADCAST_HZ", "10"))
+# TICK_WORKERS > 1 runs the agents' decide phase on a thread pool of that size. This checks that decisions
+# do not depend on the order agents decide in; under the GIL it is not faster than a serial tick.
+TICK_WORKERS = int(os.getenv("TICK_WORKERS", "0"))
+# REGIONS=<columns>x<rows> splits the map into regions ticked by separate processes (see simulation/regions.py)
+REGIONS = tuple(int(n) for n in os.getenv("REGIONS").split('x')) if os.getenv("REGIONS") else None
+# LOD=1 simulates agents outside every browser's viewport coarsely (see simulation/lod.py)
+USE_LOD = os.getenv("LOD") == "1"
+# SKIP_QUIET=1 jumps the clock over ticks in which every agent is busy (nights, long actions)
+SKIP_QUIET = os.getenv("SKIP_QUIET") == "1"
+# CHECKPOINT=<file> resumes the in-process town from that file and saves it there every CHECKPOINT_INTERVAL ticks
+CHECKPOINT = os.getenv("CHECKPOINT")
+CHECKPOINT_INTERVAL = int(os.getenv("CHECKPOINT_INTERVAL", "150"))
+# SEED=<int> makes the in-process run reproducible (see simulation/rng.py)
+SEED = int(os.getenv("SEED")) if os.getenv("SEED") else None
+# In relay mode, SHM_CHANNEL=1 reads binary frames from the simulation's shared memory ring
+USE_SHM_CHANNEL = os.getenv("SHM_CHANNEL") == "1"
+SHM_POLL_INTERVAL = 0.05
+shm_reattach = threading.Event()  # Set when a (re)started simulation may have recreated the ring
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'a_new_secret_key_for_the_refactor'
@@ -14,61 +48,412 @@ socketio = SocketIO(app, cors_allowed_origins="*")
 STATIC_FOLDER = os.path.join(os.path.dirname(__file__), 'static')
 
 # --- Map Data Loading ---
-MAP_DATA_PATH = os.path.join(STATIC_FOLDER, 'map_data.json')
-with open(MAP_DATA_PATH, 'r') as f:
-    MAP_DATA = json.load(f)
-
+MAP_DATA = load_map_data()
 MAP_LAYOUT = MAP_DATA['layout']
 PLACES = MAP_DATA['places']
 
-# Convert coordinate lists to tuples for hashability
-for place_data in PLACES.values():
-    place_data['coords'] = [tuple(coord) for coord in place_data['coords']]
-
 @app.route('/')
 def index():
     """Serves the main index.html page."""
     return send_from_directory(STATIC_FOLDER, 'index.html')
 
+@app.route('/stats')
+def stats():
+    """Reports per-client send queue metrics, per-town tick metrics and simulation/command client counters."""
+    return jsonify({
+        'mode': SIMULATION_MODE,
+        'clients': {
+            sid: {**queue.stats(), 'town': client_towns.get(sid), 'engineio_depth': engineio_queue_depth(sid)}
+            for sid, queue in list(client_queues.items())
+        },
+        'towns': {
+            town.id: {'viewers': len(town.clients), 'command_client': town.transport, 'metrics': town.metrics}
+            for town in list(towns.values())
+        },
+        'simulation': simulation_runner.stats() if simulation_runner else None,
+    })
+
 @app.route('/<path:filename>')
 def static_files(filename):
     """Serves static files from the static directory."""
     return send_from_directory(STATIC_FOLDER, filename)
 
-# --- SocketIO Event Handlers ---
-def emit_daily_story(story_data):
-    """Emits a new daily story to all connected clients."""
-    socketio.emit('new_daily_story', story_data)
+# --- Simulation Output Delivery ---
+# Used both by the relay handlers (output arriving from command.py) and by the in-process runner.
+# Every browser has a bounded OutboundQueue drained by its own sender task, so publishing never
+# waits on a client: a slow browser has old state frames dropped or merged instead.
+command_client_sid = None
+simulation_runner = None  # Set in in-process mode
+log_subscriptions = {}  # Browser sid -> id of the agent whose log it follows
+client_queues = {}      # Browser sid -> OutboundQueue
+client_towns = {}       # Browser sid -> id of the town it watches
+
+class TownChannel:
+    """
+    Server side of one town: the browsers watching it and what they are sent.
+    Browsers that registered a viewport get per-client filtered state; the rest get everything.
+    The snapshot (map, latest world state and story history) is sent compressed to every new
+    viewer. `interest`, `snapshot` and `clients` are guarded by `lock`.
+    """
+    def __init__(self, town_id, map_data):
+        self.id = town_id
+        self.interest = InterestManager()
+        self.lock = threading.Lock()
+        self.snapshot = SnapshotCache(self.interest, map_data)
+        self.clients = set()
+        self.transport = None  # Latest outbox metrics reported by command.py
+        self.metrics = None    # Latest tick metrics reported by command.py's town workers
+
+towns = {DEFAULT_TOWN: TownChannel(DEFAULT_TOWN, MAP_DATA)}
+
+def get_town(town_id):
+    """The channel of a town the simulation registered, or None."""
+    return towns.get(town_id or DEFAULT_TOWN)
+
+ENGINEIO_HIGH_WATER = 2  # Packets allowed in a client's Engine.IO queue before we hold back
+SEND_BACKOFF = 0.02
+
+def engineio_queue_depth(sid):
+    """Number of packets waiting in a client's outgoing Engine.IO queue."""
+    server = socketio.server
+    eio_sid = server.manager.eio_sid_from_sid(sid, '/')
+    eio_socket = server.eio.sockets.get(eio_sid) if eio_sid else None
+    return eio_socket.queue.qsize() if eio_socket is not None else 0
+
+def deliver_to_client(sid, queue):
+    """Background task: sends one client's queued messages as fast as its connection drains them."""
+    while not queue.closed:
+        if engineio_queue_depth(sid) > ENGINEIO_HIGH_WATER:
+            socketio.sleep(SEND_BACKOFF)  # Newer state frames are coalesced in the meantime
+            continue
+        message = queue.get(timeout=1.0)
+        if message:
+            socketio.emit(message[0], message[1], to=sid)
+
+def send_to_client(sid, event, data, reliable=False):
+    queue = client_queues.get(sid)
+    if queue is not None:
+        queue.put(event, data, reliable)
+
+def emit_daily_story(story_data, town):
+    """Sends a new daily story to the town's clients; stories are never dropped."""
+    with town.lock:
+        town.snapshot.add_story(story_data)
+        clients = list(town.clients)
+    for sid in clients:
+        send_to_client(sid, 'new_daily_story', story_data, reliable=True)
+
+def publish_state(data, town):
+    """Sends a state update to the town's clients, filtered to each viewport where one is set."""
+    with town.lock:
+        town.interest.apply_state(data)
+        town.snapshot.record_state(data)
+        payloads = town.interest.client_payloads(data)
+        clients = list(town.clients)
+    for sid in clients:
+        send_to_client(sid, 'simulation_state_update', payloads.get(sid, data))
+
+def publish_frame(data, town):
+    """Sends a binary agent frame to the town's clients as a binary attachment, filtered like state updates."""
+    with town.lock:
+        frame = town.interest.apply_frame(data)
+        if frame is not None:
+            town.snapshot.record_frame()
+        frames = town.interest.client_frames(frame) if frame is not None else {}
+        clients = list(town.clients)
+    for sid in clients:
+        send_to_client(sid, 'simulation_frame', frames.get(sid, data))
+
+def publish_agent_history(data):
+    """Delivers a log/memory page to the client that asked for it."""
+    client_sid = data.pop('client_sid', None)
+    if client_sid:
+        send_to_client(client_sid, 'agent_history', data, reliable=True)
+
+def publish_log_lines(data, town_id=DEFAULT_TOWN):
+    """Pushes new log lines to the town's clients following that agent."""
+    for sid, agent_id in list(log_subscriptions.items()):
+        if agent_id == data['agent_id'] and client_towns.get(sid) == town_id:
+            send_to_client(sid, 'agent_log_lines', data, reliable=True)
+
+def send_log_subscriptions(town):
+    """Tells the simulation which of the town's agents' logs are currently being followed."""
+    agent_ids = sorted({agent_id for sid, agent_id in list(log_subscriptions.items()) if client_towns.get(sid) == town.id})
+    if simulation_runner:
+        simulation_runner.set_watched_agents(agent_ids)
+    elif command_client_sid:
+        socketio.emit('log_subscriptions', {'agent_ids': agent_ids, 'town': town.id}, to=command_client_sid)
+
+def send_observed_area(town):
+    """
+    Tells the simulation which parts of the town's map browsers are looking at, for level of
+    detail: their viewports, or None while a browser without a viewport sees the whole town.
+    """
+    with town.lock:
+        if all(sid in town.interest.viewports for sid in town.clients):
+            rects = [town.interest.viewports[sid] for sid in town.clients]
+        else:
+            rects = None
+    if simulation_runner:
+        simulation_runner.set_observed(rects)
+    elif command_client_sid:
+        socketio.emit('observed_area', {'rects': rects, 'town': town.id}, to=command_client_sid)
+
+def client_town():
+    """The channel of the town the requesting browser watches."""
+    return towns[client_towns.get(request.sid, DEFAULT_TOWN)]
+
+def detach_client(sid):
+    """Stops sending to a client and forgets its viewport; returns the town it watched, if any."""
+    town = towns.get(client_towns.pop(sid, None))
+    if town is not None:
+        with town.lock:
+            town.interest.remove_client(sid)
+            town.clients.discard(sid)
+    queue = client_queues.pop(sid, None)
+    if queue is not None:
+        queue.close()
+    return town
 
+def relay_to_simulation(event, data, town):
+    """Forwards a browser request to the command client, tagged with the town it is about."""
+    if command_client_sid:
+        socketio.emit(event, {**data, 'town': town.id}, to=command_client_sid)
+
+# --- SocketIO Event Handlers ---
+# Events from command.py carry the town id as a second argument; a single-town simulation leaves it out.
 @socketio.on('connect')
 def handle_connect():
-    """Handles new client connections."""
-    print('Client connected to server.')
+    """Handles new client connections; browsers choose a town with the 'town' query parameter."""
+    town = get_town(request.args.get('town'))
+    if town is None:
+        raise ConnectionRefusedError('unknown town')
+    print(f"Client connected to server (town '{town.id}').")
+    join_room(town_room(town.id))
+    queue = OutboundQueue()
+    with town.lock:
+        # Registered under the lock so every update newer than the snapshot reaches this queue
+        queue.put('world_snapshot', town.snapshot.message(), reliable=True)
+        town.interest.hold_all(request.sid)
+        town.clients.add(request.sid)
+        client_towns[request.sid] = town.id
+        client_queues[request.sid] = queue
+    socketio.start_background_task(deliver_to_client, request.sid, queue)
+    send_observed_area(town)
+    if simulation_runner:
+        emit('command_client_ready', {})
 
 @socketio.on('disconnect')
 def handle_disconnect():
     """Handles client disconnections."""
+    global command_client_sid
     print('Client disconnected from server.')
+    town = detach_client(request.sid)
+    if request.sid == command_client_sid:
+        command_client_sid = None
+        return
+    if town is not None:
+        send_observed_area(town)
+    if log_subscriptions.pop(request.sid, None) and town is not None:
+        send_log_subscriptions(town)
+
+@socketio.on('register_towns')
+def handle_register_towns(data):
+    """Creates a channel for every town the command client hosts; `data` maps town id -> map data."""
+    for town_id, map_data in data.items():
+        if town_id in towns:
+            with towns[town_id].lock:
+                towns[town_id].snapshot.set_map(map_data)
+        else:
+            towns[town_id] = TownChannel(town_id, map_data)
 
 @socketio.on('command_client_ready')
 def handle_command_client_ready():
     """Broadcasts when the command client is ready."""
+    global command_client_sid
+    command_client_sid = request.sid
+    # The command client is a producer, not a viewer
+    town = detach_client(request.sid)
+    if town is not None:
+        leave_room(town_room(town.id))
+    shm_reattach.set()
+    # Rebuilds every town's snapshot world state, e.g. after this server restarted
+    emit('request_keyframe', {})
     emit('command_client_ready', {}, broadcast=True)
+    for town in list(towns.values()):
+        send_log_subscriptions(town)
+        send_observed_area(town)
 
 @socketio.on('simulation_state_update')
-def handle_simulation_state_update(data):
-    """Broadcasts simulation state updates to all clients."""
-    emit('simulation_state_update', data, broadcast=True)
+def handle_simulation_state_update(data, town_id=DEFAULT_TOWN):
+    """Relays state updates from the command client."""
+    publish_state(data, towns[town_id])
+
+@socketio.on('simulation_frame')
+def handle_simulation_frame(data, town_id=DEFAULT_TOWN):
+    """Relays binary agent frames from the command client."""
+    publish_frame(data, towns[town_id])
+
+@socketio.on('transport_stats')
+def handle_transport_stats(data, town_id=DEFAULT_TOWN):
+    """Stores the command client's outbox metrics for /stats."""
+    towns[town_id].transport = data
+
+@socketio.on('town_stats')
+def handle_town_stats(data):
+    """Stores per-town tick metrics reported by one of the command client's town workers."""
+    for town_id, metrics in data['towns'].items():
+        if town_id in towns:
+            towns[town_id].metrics = {**metrics, 'worker': data['worker']}
+
+@socketio.on('new_daily_story')
+def handle_new_daily_story(data, town_id=DEFAULT_TOWN):
+    """Relays daily stories from the command client."""
+    emit_daily_story(data, towns[town_id])
+
+@socketio.on('story_history')
+def handle_story_history(data, town_id=DEFAULT_TOWN):
+    """Restores the story history from a command client that (re)connected with stories compiled."""
+    town = towns[town_id]
+    with town.lock:
+        town.snapshot.set_stories(data['stories'])
+
+@socketio.on('set_viewport')
+def handle_set_viewport(data):
+    """Registers the map rectangle (in cells) a client is looking at; it then only receives agents near it."""
+    town = client_town()
+    with town.lock:
+        change = town.interest.set_viewport(request.sid, data['x'], data['y'], data['width'], data['height'])
+    # Queued with the state updates so the client applies them in order
+    send_to_client(request.sid, 'interest_update', change, reliable=True)
+    send_observed_area(town)
+
+@socketio.on('request_keyframe')
+def handle_request_keyframe(data=None):
+    """Asks the simulation for a full state keyframe of the client's town."""
+    if simulation_runner:
+        simulation_runner.request_keyframe()
+    else:
+        relay_to_simulation('request_keyframe', {}, client_town())
+
+@socketio.on('subscribe_agent_log')
+def handle_subscribe_agent_log(data):
+    """Follows new log lines for one agent; a missing agent_id unsubscribes."""
+    log_subscriptions.pop(request.sid, None)
+    agent_id = (data or {}).get('agent_id')
+    if agent_id:
+        log_subscriptions[request.sid] = agent_id
+    send_log_subscriptions(client_town())
+
+@socketio.on('request_agent_history')
+def handle_request_agent_history(data):
+    """Passes a log/memory page request to the simulation, tagged with the requester."""
+    request_data = {**data, 'client_sid': request.sid}
+    if simulation_runner:
+        simulation_runner.request_history(request_data)
+    else:
+        relay_to_simulation('request_agent_history', request_data, client_town())
+
+@socketio.on('agent_history')
+def handle_agent_history(data, town_id=DEFAULT_TOWN):
+    """Relays a log/memory page from the command client."""
+    publish_agent_history(data)
+
+@socketio.on('agent_log_lines')
+def handle_agent_log_lines(data, town_id=DEFAULT_TOWN):
+    """Relays new log lines from the command client to that town's followers of the agent."""
+    publish_log_lines(data, town_id)
 
 @socketio.on('pause_simulation')
 def handle_pause_simulation(data):
-    """Broadcasts simulation pause events."""
-    emit('pause_simulation', data, broadcast=True)
+    """Pauses the client's town and tells everyone watching it."""
+    town = client_town()
+    if simulation_runner:
+        simulation_runner.pause()
+    else:
+        relay_to_simulation('pause_simulation', data or {}, town)
+    emit('pause_simulation', data, to=town_room(town.id))
 
 @socketio.on('resume_simulation')
 def handle_resume_simulation(data):
-    """Broadcasts simulation resume events."""
-    emit('resume_simulation', data, broadcast=True)
+    """Resumes the client's town and tells everyone watching it."""
+    town = client_town()
+    if simulation_runner:
+        simulation_runner.resume()
+    else:
+        relay_to_simulation('resume_simulation', data or {}, town)
+    emit('resume_simulation', data, to=town_room(town.id))
+
+# --- In-Process Simulation ---
+class ServerPublisher:
+    """SimulationPublisher that delivers output straight to the default town's clients, skipping the relay hop."""
+    def state(self, payload):
+        publish_state(payload, towns[DEFAULT_TOWN])
+
+    def frame(self, data):
+        publish_frame(data, towns[DEFAULT_TOWN])
+
+    def log_lines(self, page):
+        publish_log_lines(page)
+
+    def history(self, page):
+        publish_agent_history(page)
+
+    def daily_story(self, story):
+        emit_daily_story(story, towns[DEFAULT_TOWN])
+
+def run_simulation_in_process():
+    """Background task: runs the simulation loop inside the server process."""
+    global simulation_runner
+    from simulation.runner import SimulationRunner, check_llm_ready
+    if not check_llm_ready():
+        return
+    print("Initializing Agent Manager...")
+    runner = SimulationRunner(
+        ServerPublisher(), MAP_LAYOUT, PLACES, binary_frames=USE_BINARY_FRAMES,
+        speed=SIM_SPEED, broadcast_hz=BROADCAST_HZ, sleep=socketio.sleep, tick_workers=TICK_WORKERS,
+        regions=REGIONS, lod=USE_LOD, skip_quiet=SKIP_QUIET,
+        checkpoint=CHECKPOINT, checkpoint_interval=CHECKPOINT_INTERVAL, seed=SEED,
+    )
+    simulation_runner = runner
+    send_log_subscriptions(towns[DEFAULT_TOWN])
+    send_observed_area(towns[DEFAULT_TOWN])
+    socketio.emit('command_client_ready', {})
+    runner.run()
+
+# --- Shared Memory Frame Channel ---
+def relay_shm_frames():
+    """
+    Background task: polls the shared memory ring written by command.py and fans the newest
+    frame out to clients. Frames that were overwritten before we got to them are skipped.
+    """
+    from simulation.shm_channel import FrameRingReader
+    reader = None
+    while True:
+        if shm_reattach.is_set() and reader is not None:
+            reader.close()
+            reader = None
+        shm_reattach.clear()
+        if reader is None:
+            try:
+                reader = FrameRingReader()
+                print("Reading agent frames from shared memory.")
+            except FileNotFoundError:
+                socketio.sleep(1.0)  # The simulation has not created the ring yet
+                continue
+        latest = reader.read_latest()
+        if latest:
+            seq, view = latest
+            data = bytes(view)  # Outgoing messages need their own buffer
+            view.release()
+            if reader.is_current(seq):
+                publish_frame(data, towns[DEFAULT_TOWN])
+        socketio.sleep(SHM_POLL_INTERVAL)
 
 if __name__ == '__main__':
-    socketio.run(app, debug=True, allow_unsafe_werkzeug=True)
\ No newline at end of file
+    if SIMULATION_MODE == 'inprocess':
+        socketio.start_background_task(run_simulation_in_process)
+    elif USE_SHM_CHANNEL:
+        socketio.start_background_task(relay_shm_frames)
+    # The reloader would start a second copy of an in-process simulation
+    socketio.run(app, debug=True, allow_unsafe_werkzeug=True, use_reloader=SIMULATION_MODE != 'inprocess')
@@ -3,7 +3,7 @@
 # Each node represents a condition or action in the agent's decision-making process.
 
 from .behavior_tree import Node, NodeStatus, Selector, Sequence, StatefulSelector, SimulationSummary
-import random
+from simulation.activities import EXERCISE, HOME, REST, SLEEP
 
 # --- Condition Nodes ---
 
@@ -54,8 +54,8 @@ class HasEnoughMoney(Node):
         super().__init__(name)
 
     def tick(self, agent, world_state):
-        activity_data = world_state['activity_data'].get(agent.current_activity)
-        if not activity_data or agent.money >= activity_data['cost']:
+        activity = agent.activity
+        if not activity or agent.money >= activity.cost:
             return NodeStatus.SUCCESS
         agent.add_log(f"I can't afford to {agent.current_activity.replace('_', ' ')}, I only have ${agent.money:.2f}.", world_state['time'], world_state['day_of_week'])
         return NodeStatus.FAILURE
@@ -72,37 +72,17 @@ class IsAtActivityLocation(Node):
         if not agent.current_activity:
             return NodeStatus.FAILURE
         
-        if "home" in agent.current_activity:
+        world_index = world_state['world_index']
+        activity = agent.activity
+        if activity.flags & HOME:
             # Check if agent is at their specific home location
-            home_locations = self._get_agent_home_locations(agent, world_state)
-            is_at_home = (agent.x, agent.y) in home_locations
+            is_at_home = world_index.is_at_home(agent)
             return NodeStatus.SUCCESS if is_at_home else NodeStatus.FAILURE
 
-        location_name = world_state['activity_data'][agent.current_activity]['location']
-        target_location = world_state['places'].get(location_name)
-        if not target_location:
-            return NodeStatus.FAILURE
-        
-        is_at_location = (agent.x, agent.y) in target_location['coords']
+        location_name = agent.rest_location if activity.flags & REST else activity.location
+        is_at_location = world_index.is_in_place((agent.x, agent.y), location_name)
         return NodeStatus.SUCCESS if is_at_location else NodeStatus.FAILURE
 
-    def _get_agent_home_locations(self, agent, world_state):
-        """Get the appropriate home location coords for the agent"""
-        home_x, home_y = agent.home['x'], agent.home['y']
-        
-        # Map agent home positions to the correct place
-        if home_x <= 5 and home_y <= 5:  # North houses
-            return world_state['places']['north_houses']['coords']
-        elif home_x <= 5 and 13 <= home_y <= 17:  # Central houses  
-            return world_state['places']['central_houses']['coords']
-        elif home_x <= 5 and home_y >= 18:  # South houses
-            return world_state['places']['south_houses']['coords']
-        elif home_x >= 18 and home_y <= 5:  # Student accommodation
-            return world_state['places']['student_accommodation']['coords']
-        else:
-            # Fallback to exact position
-            return [(home_x, home_y)]
-
     def simulate(self, agent, world_state, prev_summary):
         return prev_summary
 
@@ -116,11 +96,11 @@ class ShouldSocialize(Node):
         talkativeness = agent.personality.get('talkativeness', 0.5)
         
         # Extroverts are more likely to socialize even with moderate need
-        if 'extrovert' in agent.personality_names and social_need > 30 and random.random() < (0.4 * talkativeness):
+        if 'extrovert' in agent.personality_names and social_need > 30 and agent.rng.random() < (0.4 * talkativeness):
             agent.add_log(f"I'm feeling social (Social need: {social_need:.1f}). Let me find someone to talk to.", world_state['time'], world_state['day_of_week'])
             return NodeStatus.SUCCESS
         # Introverts only socialize when their need is quite high
-        if 'introvert' in agent.personality_names and social_need > 70 and random.random() < (0.3 * talkativeness):
+        if 'introvert' in agent.personality_names and social_need > 70 and agent.rng.random() < (0.3 * talkativeness):
             agent.add_log(f"I really need some social interaction (Social need: {social_need:.1f}). Maybe I should find someone to chat with.", world_state['time'], world_state['day_of_week'])
             return NodeStatus.SUCCESS
         return NodeStatus.FAILURE
@@ -152,7 +132,7 @@ class FindAgentToTalkTo(Node):
 
         # Prioritize talking to friends and people with good relationships
         friends = [t for t in potential_targets if agent.get_relationship(t.id) and agent.get_relationship(t.id)['affinity'] > 70]
-        target_agent = random.choice(friends) if friends else random.choice(potential_targets)
+        target_agent = agent.rng.choice(friends) if friends else agent.rng.choice(potential_targets)
 
         # Set the intent to interact and the destination for pathfinding
         agent.interacting_with = target_agent.id
@@ -198,7 +178,7 @@ class ExecuteActivity(Node):
                 # The agent will become idle, and the schedule will be re-evaluated in the next manager tick.
                 return NodeStatus.SUCCESS
 
-            park_coords = world_state['places']['central_park']['coords']
+            park_coords = world_state['world_index'].place_coords['central_park']
             
             # Find other idle agents in the park who are also here to socialize
             potential_partners = [
@@ -215,31 +195,19 @@ class ExecuteActivity(Node):
                 # Return SUCCESS so the agent can try again next tick if the schedule is still active
                 return NodeStatus.SUCCESS 
 
-            # Found a partner
-            partner = random.choice(potential_partners)
-            
-            interaction_duration = random.randint(8, 15) # Reduced conversation time
-            
-            # Set both agents to interacting
+            # Found a partner: propose the conversation. Only this agent is changed here; the
+            # manager pairs up both agents when it resolves the tick (see AgentManager._start_conversation),
+            # unless someone else got to the partner first.
+            partner = agent.rng.choice(potential_partners)
             agent.state = 'interacting'
             agent.interacting_with = partner.id
-            agent.action_duration = interaction_duration
-            agent.current_goal = f"Chatting with {partner.name}."
-            agent.add_log(f"I've started a conversation with {partner.name} at the park.", world_state['time'], world_state['day_of_week'])
-            agent.needs['social'] = 0 # Reset social need
-
-            partner.state = 'interacting'
-            partner.interacting_with = agent.id
-            partner.action_duration = interaction_duration
-            partner.current_goal = f"Chatting with {agent.name}."
-            partner.add_log(f"{agent.name} came over to talk. We're having a nice chat.", world_state['time'], world_state['day_of_week'])
-            partner.needs['social'] = 0 # Reset social need
-            
+            agent.action_duration = agent.rng.randint(8, 15) # Reduced conversation time
+
             # This action is now running (the interaction itself)
             return NodeStatus.RUNNING
 
-        activity_data = world_state['activity_data'].get(activity, {})
-        cost = activity_data.get('cost', 0)
+        activity_info = agent.activity
+        cost = activity_info.cost if activity_info else 0
 
         if agent.money >= cost:
             agent.money -= cost
@@ -251,11 +219,11 @@ class ExecuteActivity(Node):
             agent.current_action = action_descriptions['action']
             agent.current_goal = action_descriptions['goal']
             
-            location = activity_data.get('location', 'my destination')
+            location = (activity_info.location if activity_info else None) or 'my destination'
             agent.add_log(f"I've arrived at the {location.replace('_', ' ')}. {action_descriptions['log']}", world_state['time'], world_state['day_of_week'])
             
             # Update needs based on activity type with more realistic values
-            self._update_needs_for_activity(agent, activity)
+            self._update_needs_for_activity(agent, activity_info)
             
             return NodeStatus.RUNNING # Action takes time
         return NodeStatus.FAILURE
@@ -340,48 +308,28 @@ class ExecuteActivity(Node):
 
     def _update_needs_for_activity(self, agent, activity):
         """Update agent needs based on the specific activity"""
-        if "eat" in activity or "lunch" in activity or "dinner" in activity or "breakfast" in activity:
-            agent.needs['hunger'] = max(0, agent.needs['hunger'] - 50)
-            agent.needs['energy'] = max(0, agent.needs['energy'] - 20) # Eating also restores some energy
-        elif "coffee" in activity:
-            agent.needs['hunger'] = max(0, agent.needs['hunger'] - 15)
-            agent.needs['energy'] = max(0, agent.needs['energy'] - 15) # Coffee reduces tiredness
-        
-        if "socialize" in activity or "drinks" in activity or "party" in activity:
-            agent.needs['social'] = max(0, agent.needs['social'] - 60)
-        
-        if "workout" in activity or "gym" in activity or "training" in activity:
-            agent.needs['energy'] = min(100, agent.needs['energy'] + 5) # Workout increases tiredness significantly
-            # Fitness enthusiasts get a mood boost from exercise
-            if 'fitness_enthusiast' in agent.personality_names:
-                agent.needs['social'] = max(0, agent.needs['social'] - 10)
-        
-        if "relax" in activity or "leisure" in activity or "park" in activity:
-            agent.needs['energy'] = max(0, agent.needs['energy'] - 25) # Relaxing reduces tiredness
+        if activity is None:
+            return
+        # Need deltas are precompiled from the activity's tags (see ACTIVITY_TAG_EFFECTS)
+        for need, delta in activity.need_deltas:
+            agent.needs[need] = min(100, max(0, agent.needs[need] + delta))
         
-        if "sleep" in activity:
-            agent.needs['energy'] = max(0, agent.needs['energy'] - 90) # Sleeping greatly reduces tiredness
+        # Fitness enthusiasts get a mood boost from exercise
+        if activity.flags & EXERCISE and 'fitness_enthusiast' in agent.personality_names:
+            agent.needs['social'] = max(0, agent.needs['social'] - 10)
 
     def simulate(self, agent, world_state, prev_summary):
         final_needs = prev_summary.final_needs.copy()
         final_money = prev_summary.final_money
         
-        activity = agent.current_activity
-        activity_data = world_state['activity_data'].get(activity, {})
-        final_money -= activity_data.get('cost', 0)
+        activity = agent.activity
+        if activity is None:
+            return prev_summary
+        final_money -= activity.cost
 
         # Simulate need changes
-        if "eat" in activity or "lunch" in activity or "dinner" in activity:
-            final_needs['hunger'] = max(0, final_needs['hunger'] - 50)
-            final_needs['energy'] = max(0, final_needs['energy'] - 20)
-        if "socialize" in activity or "drinks" in activity:
-            final_needs['social'] = max(0, final_needs['social'] - 60)
-        if "workout" in activity or "gym" in activity:
-            final_needs['energy'] = min(100, final_needs['energy'] + 5)
-        if "relax" in activity or "park" in activity:
-            final_needs['energy'] = max(0, final_needs['energy'] - 25)
-        if "sleep" in activity:
-            final_needs['energy'] = max(0, final_needs['energy'] - 90)
+        for need, delta in activity.need_deltas:
+            final_needs[need] = min(100, max(0, final_needs[need] + delta))
 
         return SimulationSummary(final_needs, final_money)
 
@@ -395,12 +343,12 @@ class PlanPathToActivityLocation(Node):
         if not activity: 
             return NodeStatus.FAILURE
         
-        if "home" in activity or "sleep" in activity:
+        if agent.activity.flags & (HOME | SLEEP):
             agent.destination_name = f"{agent.id}_home"
             agent.current_goal = "Heading home to rest and recharge"
             agent.add_log(f"Time to head home. I need to {activity.replace('_', ' ')}.", world_state['time'], world_state['day_of_week'])
         else:
-            location_name = world_state['activity_data'][activity]['location']
+            location_name = agent.activity.location
             agent.destination_name = location_name
             
             # Create more descriptive goals based on activity
@@ -450,17 +398,13 @@ class PlanPathToRestLocation(Node):
 
     def tick(self, agent, world_state):
         # Only choose a rest location once per rest event
-        if not hasattr(agent, 'rest_location') or agent.rest_location is None:
-            agent.rest_location = random.choice(self.rest_locations)
+        if agent.rest_location is None:
+            agent.rest_location = agent.rng.choice(self.rest_locations)
             agent.rest_ticks = 0
         agent.destination_name = agent.rest_location
         agent.state = 'moving'
         agent.current_goal = f"Going to the {agent.rest_location.replace('_', ' ')} to rest for a bit"
         agent.current_activity = "take_a_short_rest"
-        world_state['activity_data']['take_a_short_rest'] = {
-            "location": agent.rest_location,
-            "cost": 0
-        }
         agent.add_log(f"I'm feeling tired, so I'll head to the {agent.rest_location.replace('_', ' ')} to recharge.", world_state['time'], world_state['day_of_week'])
         return NodeStatus.SUCCESS
 
@@ -507,10 +451,6 @@ class PlanPathToEatLocation(Node):
         agent.state = 'moving'
         agent.current_goal = f"Going to the cafe to eat and refuel"
         agent.current_activity = "eat_at_cafe"
-        world_state['activity_data']['eat_at_cafe'] = {
-            "location": self.eat_location,
-            "cost": 10
-        }
         agent.add_log(f"I'm really hungry, so I'll head to the cafe to eat.", world_state['time'], world_state['day_of_week'])
         return NodeStatus.SUCCESS
 
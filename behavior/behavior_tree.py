@@ -193,4 +193,42 @@ class Sequence(Node):
 
     def reset(self):
         super().reset()
-        self.current_child_index = 0
\ No newline at end of file
+        self.current_child_index = 0
+
+def walk_tree(root):
+    """Yields every node of a tree in pre-order."""
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(reversed(getattr(node, 'children', ())))
+
+def get_run_state(root):
+    """
+    The run state of a tree as a flat list of ints, two per node in pre-order: whether the
+    node is running, and its cursor (the child a Sequence is at, or the index of the child a
+    StatefulSelector committed to, -1 for none; 0 for other nodes).
+    """
+    state = []
+    for node in walk_tree(root):
+        if isinstance(node, Sequence):
+            cursor = node.current_child_index
+        elif isinstance(node, StatefulSelector):
+            cursor = node.children.index(node.selected_child) if node.selected_child is not None else -1
+        else:
+            cursor = 0
+        state.append(int(node.is_running))
+        state.append(cursor)
+    return state
+
+def set_run_state(root, state):
+    """Restores a run state from get_run_state onto a tree of the same shape."""
+    nodes = list(walk_tree(root))
+    if len(state) != 2 * len(nodes):
+        raise ValueError(f"Run state is for a tree of {len(state) // 2} nodes, not {len(nodes)}")
+    for node, is_running, cursor in zip(nodes, state[0::2], state[1::2]):
+        node.is_running = bool(is_running)
+        if isinstance(node, Sequence):
+            node.current_child_index = cursor
+        elif isinstance(node, StatefulSelector):
+            node.selected_child = node.children[cursor] if cursor >= 0 else None
@@ -0,0 +1,149 @@
+# behavior/profiler.py
+# Opt-in profiling layer for the behavior tree runtime.
+# Records per-node-class and per-node-instance tick counts, timings and status histograms,
+# and exports them as a JSON report or a flame-graph-compatible collapsed stack file.
+
+import json
+import threading
+import time
+from .behavior_tree import NodeStatus
+
+class NodeStats:
+    """Accumulated tick statistics for one node class or node instance."""
+    def __init__(self):
+        self.calls = 0
+        self.total_time = 0.0  # Inclusive time in seconds
+        self.self_time = 0.0   # Time spent in the node itself, excluding children
+        self.statuses = {status.name: 0 for status in NodeStatus}
+
+    def record(self, status, elapsed, child_time):
+        self.calls += 1
+        self.total_time += elapsed
+        self.self_time += elapsed - child_time
+        if status is not None:
+            self.statuses[status.name] += 1
+
+    def to_dict(self):
+        ratios = {name: (count / self.calls if self.calls else 0.0) for name, count in self.statuses.items()}
+        return {
+            'calls': self.calls,
+            'total_time_ms': self.total_time * 1000,
+            'self_time_ms': self.self_time * 1000,
+            'mean_time_us': (self.total_time / self.calls * 1e6) if self.calls else 0.0,
+            'statuses': dict(self.statuses),
+            'status_ratios': ratios,
+        }
+
+class BTProfiler:
+    """
+    Instruments behavior trees by wrapping the tick method of every node instance.
+    Trees that are never attached keep their plain class methods, so profiling costs
+    nothing unless it is switched on. Trees may be ticked on several threads at once
+    (TICK_WORKERS): each thread keeps its own stack of open nodes.
+    """
+    def __init__(self):
+        self.by_class = {}
+        self.by_instance = {}
+        self.stacks = {}  # Collapsed stack -> self time in seconds
+        self._local = threading.local()  # Per thread: the open frames and their child times
+        self._lock = threading.Lock()
+        self._attached = []
+
+    def attach(self, root):
+        """Wraps every node in the tree rooted at `root`."""
+        self._wrap(root)
+        self._attached.append(root)
+        return root
+
+    def detach(self):
+        """Restores the original tick methods on every attached tree."""
+        for root in self._attached:
+            self._unwrap(root)
+        self._attached = []
+
+    def _wrap(self, node):
+        if 'tick' not in vars(node):
+            node.tick = self._make_wrapper(node, node.tick)
+        for child in getattr(node, 'children', []):
+            self._wrap(child)
+
+    def _unwrap(self, node):
+        vars(node).pop('tick', None)
+        for child in getattr(node, 'children', []):
+            self._unwrap(child)
+
+    def _make_wrapper(self, node, tick):
+        class_name = type(node).__name__
+        frame = f"{class_name}:{node.name}".replace(';', ',')
+        local = self._local
+        perf_counter = time.perf_counter
+
+        def profiled_tick(agent, world_state):
+            try:
+                stack, child_times = local.stack, local.child_times
+            except AttributeError:
+                stack, child_times = local.stack, local.child_times = [], []
+            stack.append(frame)
+            child_times.append(0.0)
+            start = perf_counter()
+            status = None
+            try:
+                status = tick(agent, world_state)
+                return status
+            finally:
+                elapsed = perf_counter() - start
+                child_time = child_times.pop()
+                path = ';'.join(stack)
+                stack.pop()
+                if child_times:
+                    child_times[-1] += elapsed
+                self._record(class_name, path, status, elapsed, child_time)
+
+        return profiled_tick
+
+    def _record(self, class_name, path, status, elapsed, child_time):
+        with self._lock:
+            stats = self.by_class.get(class_name)
+            if stats is None:
+                stats = self.by_class[class_name] = NodeStats()
+            stats.record(status, elapsed, child_time)
+
+            stats = self.by_instance.get(path)
+            if stats is None:
+                stats = self.by_instance[path] = NodeStats()
+            stats.record(status, elapsed, child_time)
+
+            self.stacks[path] = self.stacks.get(path, 0.0) + (elapsed - child_time)
+
+    def reset(self):
+        """Clears all collected statistics but keeps trees attached."""
+        with self._lock:
+            self.by_class.clear()
+            self.by_instance.clear()
+            self.stacks.clear()
+
+    def report(self):
+        """Returns the collected statistics as a JSON-serializable dictionary."""
+        with self._lock:
+            by_class = sorted(self.by_class.items(), key=lambda item: item[1].total_time, reverse=True)
+            by_instance = sorted(self.by_instance.items(), key=lambda item: item[1].self_time, reverse=True)
+            return {
+                'by_class': {name: stats.to_dict() for name, stats in by_class},
+                'by_instance': {path: stats.to_dict() for path, stats in by_instance},
+            }
+
+    def write_json(self, path):
+        """Writes the report to `path` as JSON."""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, indent=2)
+
+    def write_collapsed(self, path):
+        """
+        Writes self times as collapsed stacks ("root;child;leaf <microseconds>"),
+        the input format of flamegraph.pl, inferno and speedscope.
+        """
+        with self._lock:
+            stacks = sorted(self.stacks.items())
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, self_time in stacks:
+                f.write(f"{stack} {max(0, round(self_time * 1e6))}\n")
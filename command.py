@@ -1,23 +1,118 @@
 # command.py
 # Command client for simulation control and agent management.
 # Connects to Flask server, manages simulation state, and relays updates via SocketIO.
+# To run the simulation inside the server instead, start app.py with SIMULATION_MODE=inprocess.
+# With TOWNS set it hosts several towns on a pool of worker processes and relays each town's output.
 
-import socketio
+import os
 import time
-from simulation.manager import AgentManager
-from app import MAP_LAYOUT, PLACES
+import queue
+import socketio
+from simulation.runner import SimulationPublisher, SimulationRunner, check_llm_ready
+from simulation.towns import TownSupervisor, load_town_specs
+from simulation.transport import OutboundQueue
+from simulation.world import load_map_data
 
 FLASK_SERVER_URL = 'http://127.0.0.1:5000'
+# Set BINARY_FRAMES=1 to send positions, states and needs as packed binary frames
+USE_BINARY_FRAMES = os.getenv("BINARY_FRAMES") == "1"
+# SIM_SPEED runs the simulation faster than real time; BROADCAST_HZ caps state updates per second
+SIM_SPEED = float(os.getenv("SIM_SPEED", "1"))
+BROADCAST_HZ = float(os.getenv("BROADCAST_HZ", "10"))
+# TICK_WORKERS > 1 runs the agents' decide phase on a thread pool of that size. This checks that decisions
+# do not depend on the order agents decide in; under the GIL it is not faster than a serial tick.
+TICK_WORKERS = int(os.getenv("TICK_WORKERS", "0"))
+# REGIONS=<columns>x<rows> splits the map into regions ticked by separate processes (see simulation/regions.py)
+REGIONS = tuple(int(n) for n in os.getenv("REGIONS").split('x')) if os.getenv("REGIONS") else None
+# Set LOD=1 to simulate agents outside every browser's viewport coarsely (see simulation/lod.py)
+USE_LOD = os.getenv("LOD") == "1"
+# Set SKIP_QUIET=1 to jump the clock over ticks in which every agent is busy (nights, long actions)
+SKIP_QUIET = os.getenv("SKIP_QUIET") == "1"
+# CHECKPOINT=<file> resumes the town from that file if it exists and saves it there every
+# CHECKPOINT_INTERVAL ticks (see simulation/checkpoint.py)
+CHECKPOINT = os.getenv("CHECKPOINT")
+CHECKPOINT_INTERVAL = int(os.getenv("CHECKPOINT_INTERVAL", "150"))
+# SEED=<int> makes the run reproducible: the same seed gives the same trajectory (see simulation/rng.py)
+SEED = int(os.getenv("SEED")) if os.getenv("SEED") else None
+# Set SHM_CHANNEL=1 (here and for app.py) to hand binary frames to the server through shared memory
+USE_SHM_CHANNEL = os.getenv("SHM_CHANNEL") == "1"
+# TOWNS=<n> hosts n copies of the default town, TOWNS=<file.json> the towns listed there (see towns.py);
+# TOWN_PROCESSES sets the number of worker processes (default: one per core)
+TOWNS = os.getenv("TOWNS")
+TOWN_PROCESSES = int(os.getenv("TOWN_PROCESSES", "0"))
+
+TRANSPORT_STATS_INTERVAL = 5.0  # Seconds between outbox metric reports to the server
 
 # --- SocketIO Client Setup ---
 sio = socketio.Client()
-simulation_paused = False
+runner = None  # Created once the LLM check passes
+supervisor = None  # Used instead of `runner` when hosting several towns
+town_stories = {}  # Town id -> daily stories relayed so far (supervisor mode)
+
+class ServerRelayPublisher(SimulationPublisher):
+    """
+    Sends simulation output to the Flask server, which forwards it to browsers.
+    Messages go through a bounded outbox drained by a sender task, so the tick loop never
+    waits on the network; if the server falls behind, old state frames are dropped or merged.
+    With a frame ring, binary frames go through shared memory instead of SocketIO.
+    """
+    def __init__(self):
+        self.frame_ring = None
+        self.outbox = OutboundQueue()
+
+    def state(self, payload):
+        self.outbox.put('simulation_state_update', payload)
+
+    def frame(self, data):
+        if self.frame_ring:
+            self.frame_ring.write(data)
+        else:
+            self.outbox.put('simulation_frame', data)
+
+    def log_lines(self, page):
+        self.outbox.put('agent_log_lines', page, reliable=True)
+
+    def history(self, page):
+        self.outbox.put('agent_history', page, reliable=True)
+
+    def daily_story(self, story):
+        self.outbox.put('new_daily_story', story, reliable=True)
+
+def send_outbox(outbox, town_id=None):
+    """
+    Background task: emits queued messages to the server and reports outbox metrics.
+    With a town_id, every message carries it as a second argument so the server can route it.
+    """
+    last_report = time.monotonic()
+    while not outbox.closed:
+        if not sio.connected:
+            time.sleep(0.5)  # Keep messages queued until the connection is back
+            continue
+        message = outbox.get(timeout=1.0)
+        if message:
+            event, data = message
+            sio.emit(event, data if town_id is None else (data, town_id))
+        if time.monotonic() - last_report >= TRANSPORT_STATS_INTERVAL:
+            last_report = time.monotonic()
+            stats = outbox.stats()
+            sio.emit('transport_stats', stats if town_id is None else (stats, town_id))
+
+def send_control(data, command, payload=None):
+    """Passes a server request to the town it names, or to every town."""
+    supervisor.send((data or {}).get('town'), command, payload)
 
 @sio.event
 def connect():
     """Handles connection to the Flask server."""
     print('Connected to Flask server as command client.')
-    sio.emit('command_client_ready')
+    if runner:
+        sio.emit('command_client_ready')  # Reconnected: announce again so the server routes to us
+        sio.emit('story_history', {'stories': list(runner.manager.daily_stories)})
+    elif supervisor:
+        register_towns(supervisor.specs.values())
+        sio.emit('command_client_ready')
+        for town_id, stories in town_stories.items():
+            sio.emit('story_history', ({'stories': stories}, town_id))
 
 @sio.event
 def connect_error(data):
@@ -32,61 +127,161 @@ def disconnect():
 @sio.on('pause_simulation')
 def on_pause_simulation(data):
     """Pauses the simulation when triggered by the server."""
-    global simulation_paused
-    print("--- SIMULATION PAUSED ---")
-    simulation_paused = True
+    if runner:
+        runner.pause()
+    elif supervisor:
+        send_control(data, 'pause')
 
 @sio.on('resume_simulation')
 def on_resume_simulation(data):
     """Resumes the simulation when triggered by the server."""
-    global simulation_paused
-    print("--- SIMULATION RESUMED ---")
-    simulation_paused = False
+    if runner:
+        runner.resume()
+    elif supervisor:
+        send_control(data, 'resume')
+
+@sio.on('request_keyframe')
+def on_request_keyframe(data=None):
+    """Sends a full state keyframe on the next tick, e.g. when a browser connects."""
+    if runner:
+        runner.request_keyframe()
+    elif supervisor:
+        send_control(data, 'request_keyframe')
+
+@sio.on('request_agent_history')
+def on_request_agent_history(data):
+    """Queues a request for a page of an agent's log or memories."""
+    if runner:
+        runner.request_history(data)
+    elif supervisor:
+        send_control(data, 'request_history', data)
+
+@sio.on('log_subscriptions')
+def on_log_subscriptions(data):
+    """Updates which agents' new log lines should be pushed to browsers."""
+    if runner:
+        runner.set_watched_agents(data.get('agent_ids', []))
+    elif supervisor:
+        send_control(data, 'set_watched_agents', data.get('agent_ids', []))
+
+@sio.on('observed_area')
+def on_observed_area(data):
+    """Updates the parts of the map browsers are looking at, for level of detail."""
+    if runner:
+        runner.set_observed(data.get('rects'))
+    elif supervisor:
+        send_control(data, 'set_observed', data.get('rects'))
 
 # --- Main Simulation Logic ---
 def run_simulation():
     """Initializes and runs the agent simulation loop."""
-    from simulation.llm_handler import LLMHandler
-    print("Checking LLM API connectivity...")
-    llm = LLMHandler()
-    ok, msg = llm.check_llm_api()
-    if ok:
-        print(f"LLM API is working: {msg}")
-    else:
-        print(f"LLM API check failed: {msg}")
-        print("Simulation will not start. Please check your API key and network.")
+    global runner
+    if not check_llm_ready():
         return
 
+    # Set BT_PROFILE=1 to record behavior tree timings; reports are written to results/ on exit.
+    bt_profiler = None
+    if os.getenv("BT_PROFILE"):
+        from behavior.profiler import BTProfiler
+        bt_profiler = BTProfiler()
+
     print("Initializing Agent Manager...")
-    manager = AgentManager(world_layout=MAP_LAYOUT, places_data=PLACES)
-    print("Agent Manager initialized. Starting simulation loop.")
-
-    simulation_tick_interval = 0.4
-
-    while True:
-        try:
-            if not simulation_paused:
-                commands, state_payload = manager.tick()
-                if state_payload:
-                    sio.emit('simulation_state_update', state_payload)
-            time.sleep(simulation_tick_interval)
-        except KeyboardInterrupt:
-            print("Simulation stopped by user.")
-            break
-        except Exception as e:
-            print(f"An error occurred in the simulation loop: {e}")
-            break
+    map_data = load_map_data()
+    publisher = ServerRelayPublisher()
+    runner = SimulationRunner(
+        publisher, map_data['layout'], map_data['places'], bt_profiler=bt_profiler, binary_frames=USE_BINARY_FRAMES or USE_SHM_CHANNEL,
+        speed=SIM_SPEED, broadcast_hz=BROADCAST_HZ, tick_workers=TICK_WORKERS,
+        regions=REGIONS, lod=USE_LOD, skip_quiet=SKIP_QUIET,
+        checkpoint=CHECKPOINT, checkpoint_interval=CHECKPOINT_INTERVAL, seed=SEED,
+    )
+    if USE_SHM_CHANNEL:
+        from simulation.frame_codec import frame_size
+        from simulation.shm_channel import FrameRingWriter
+        publisher.frame_ring = FrameRingWriter(slot_size=frame_size(len(runner.manager.agents)))
+        print(f"Writing agent frames to shared memory '{publisher.frame_ring.shm.name}'.")
+    print("Agent Manager initialized.")
+    sio.start_background_task(send_outbox, publisher.outbox)
+    sio.emit('command_client_ready')
+    try:
+        runner.run()
+    finally:
+        publisher.outbox.close()
+        if publisher.frame_ring:
+            publisher.frame_ring.close()
+    if bt_profiler:
+        write_bt_profile(bt_profiler)
     sio.disconnect()
 
+def register_towns(specs):
+    """Sends the server every hosted town's map so it can serve their snapshots."""
+    sio.emit('register_towns', {spec['id']: spec['map_data'] for spec in specs})
+
+def run_towns():
+    """Runs every town in TOWNS on a pool of worker processes and relays their output."""
+    global supervisor
+    if not check_llm_ready():
+        return
+    specs = load_town_specs(TOWNS)
+    if USE_SHM_CHANNEL:
+        print("SHM_CHANNEL is not supported with TOWNS; binary frames are sent over SocketIO.")
+    if CHECKPOINT:
+        print("CHECKPOINT is not supported with TOWNS; the towns start fresh and are not saved.")
+    supervisor = TownSupervisor(
+        specs, processes=TOWN_PROCESSES or None, speed=SIM_SPEED, broadcast_hz=BROADCAST_HZ,
+        binary_frames=USE_BINARY_FRAMES or USE_SHM_CHANNEL, lod=USE_LOD, skip_quiet=SKIP_QUIET, seed=SEED,
+    )
+    outboxes = {spec['id']: OutboundQueue() for spec in specs}
+    for town_id, outbox in outboxes.items():
+        town_stories[town_id] = []
+        sio.start_background_task(send_outbox, outbox, town_id)
+    register_towns(specs)
+    supervisor.start()
+    sio.emit('command_client_ready')
+    try:
+        while supervisor.alive():
+            try:
+                town_id, event, data, reliable = supervisor.output.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            if town_id is None:
+                if event == 'town_stats':
+                    supervisor.record_stats(data)
+                    sio.emit('town_stats', data)
+                continue
+            if event == 'new_daily_story':
+                town_stories[town_id].append(data)
+            outboxes[town_id].put(event, data, reliable)
+    except KeyboardInterrupt:
+        print("Simulation stopped by user.")
+    finally:
+        supervisor.stop()
+        for outbox in outboxes.values():
+            outbox.close()
+    packing = supervisor.suggest_packing()
+    if packing:
+        print(f"Measured town load suggests this packing onto workers: {packing}")
+    sio.disconnect()
+
+def write_bt_profile(bt_profiler):
+    """Writes the behavior tree profile as a JSON report and a collapsed stack file."""
+    results_dir = os.path.join(os.path.dirname(__file__), 'results')
+    os.makedirs(results_dir, exist_ok=True)
+    bt_profiler.write_json(os.path.join(results_dir, 'bt_profile.json'))
+    bt_profiler.write_collapsed(os.path.join(results_dir, 'bt_profile.folded'))
+    print(f"Behavior tree profile written to {results_dir}.")
+
 def main():
     """Entry point for the command client."""
     try:
         sio.connect(FLASK_SERVER_URL)
-        run_simulation()
+        if TOWNS:
+            run_towns()
+        else:
+            run_simulation()
     except socketio.exceptions.ConnectionError as e:
         print(f"Could not connect to Flask server at {FLASK_SERVER_URL}: {e}")
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
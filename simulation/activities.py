@@ -0,0 +1,98 @@
+# simulation/activities.py
+# Compiles ACTIVITY_DATA into integer activity ids with category bitflags, wages and need deltas.
+# Tick code classifies activities with bit tests instead of substring matching on their names.
+
+import numpy as np
+from simulation.config import ACTIVITY_DATA, ACTIVITY_TAG_EFFECTS
+
+# --- Category Bitflags ---
+WORK = 1 << 0       # Paid work, earns the activity's wage at its location
+STRENUOUS = 1 << 1  # Tiredness rises at the working rate
+EAT = 1 << 2
+COFFEE = 1 << 3
+SOCIAL = 1 << 4
+EXERCISE = 1 << 5
+RELAX = 1 << 6
+SLEEP = 1 << 7
+REST = 1 << 8       # Location is chosen per agent (agent.rest_location)
+HOME = 1 << 9       # Takes place in the agent's own home area
+
+TAG_FLAGS = {
+    'work': WORK, 'strenuous': STRENUOUS, 'eat': EAT, 'coffee': COFFEE, 'social': SOCIAL,
+    'exercise': EXERCISE, 'relax': RELAX, 'sleep': SLEEP, 'rest': REST,
+}
+NEEDS = ('hunger', 'social', 'energy')
+
+class Activity:
+    """Compiled metadata for one activity."""
+    __slots__ = ('id', 'name', 'flags', 'cost', 'wage', 'location', 'location_id', 'need_deltas')
+
+    def __init__(self, activity_id, name, flags, cost, wage, location, location_id, need_deltas):
+        self.id = activity_id
+        self.name = name
+        self.flags = flags
+        self.cost = cost
+        self.wage = wage
+        self.location = location
+        self.location_id = location_id
+        self.need_deltas = need_deltas  # Tuple of (need, delta) pairs applied when the activity starts
+
+class ActivityCatalog:
+    """
+    All activities indexed by name and by integer id, plus NumPy columns
+    (flags, cost, wage, location id, need deltas) for vectorized use.
+    """
+    def __init__(self, activity_data, tag_effects):
+        self.activities = []
+        self.by_name = {}
+        self.location_names = sorted({data['location'] for data in activity_data.values() if data['location']})
+        self.location_ids = {name: i for i, name in enumerate(self.location_names)}
+
+        for name, data in activity_data.items():
+            tags = data.get('tags', [])
+            unknown = set(tags) - set(TAG_FLAGS)
+            if unknown:
+                raise ValueError(f"Activity '{name}' has unknown tags: {sorted(unknown)}")
+            flags = 0
+            for tag in tags:
+                flags |= TAG_FLAGS[tag]
+            location = data['location']
+            if location == 'home':
+                flags |= HOME
+
+            deltas = {}
+            for tag in tags:
+                if tag == 'coffee' and 'eat' in tags:
+                    continue
+                for need, delta in tag_effects.get(tag, {}).items():
+                    deltas[need] = deltas.get(need, 0) + delta
+
+            activity = Activity(
+                activity_id=len(self.activities), name=name, flags=flags,
+                cost=data.get('cost', 0), wage=data.get('wage', 0.0),
+                location=location, location_id=self.location_ids.get(location, -1),
+                need_deltas=tuple(deltas.items()),
+            )
+            self.activities.append(activity)
+            self.by_name[name] = activity
+
+        self.flags = np.array([a.flags for a in self.activities], dtype=np.int32)
+        self.cost = np.array([a.cost for a in self.activities], dtype=np.float64)
+        self.wage = np.array([a.wage for a in self.activities], dtype=np.float64)
+        self.location_id = np.array([a.location_id for a in self.activities], dtype=np.int16)
+        self.need_deltas = np.array(
+            [[dict(a.need_deltas).get(need, 0) for need in NEEDS] for a in self.activities], dtype=np.float64
+        )
+
+    def __len__(self):
+        return len(self.activities)
+
+    def get(self, name):
+        """Returns the compiled Activity for a name, or None."""
+        return self.by_name.get(name)
+
+    def __getitem__(self, activity_id):
+        return self.activities[activity_id]
+
+# Compiled once at import time
+ACTIVITIES = ActivityCatalog(ACTIVITY_DATA, ACTIVITY_TAG_EFFECTS)
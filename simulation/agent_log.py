@@ -0,0 +1,78 @@
+# simulation/agent_log.py
+# On-demand access to agent logs and memories.
+# Serves paginated history requests and collects new log lines for subscribed agents,
+# so logs never have to travel with the per-tick state payload.
+
+from bisect import bisect_left, bisect_right
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+HISTORY_KINDS = ('log', 'memories')
+
+def paginate(entries, since=None, before=None, limit=PAGE_SIZE):
+    """
+    Pages through (seq, item) pairs sorted oldest first.
+    With `since`, returns the oldest `limit` entries after that cursor so a client can
+    catch up in order; otherwise returns the newest `limit` entries before `before`
+    (or the newest overall). Entries come back newest first.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    seqs = [seq for seq, _ in entries]
+    lo = bisect_right(seqs, since) if since is not None else 0
+    hi = bisect_left(seqs, before) if before is not None else len(entries)
+    if since is not None:
+        window = entries[lo:min(lo + limit, hi)]
+        has_more = lo + limit < hi
+    else:
+        window = entries[max(lo, hi - limit):hi]
+        has_more = hi - limit > lo
+    return {
+        'entries': [{'seq': seq, 'entry': item} for seq, item in reversed(window)],
+        'newest': window[-1][0] if window else since,
+        'oldest': window[0][0] if window else before,
+        'has_more': has_more,
+    }
+
+def log_entries(agent):
+    """The agent's retained log lines as (seq, text) pairs, oldest first."""
+    # agent.log is newest first; its first line has seq == agent.log_count
+    return [(agent.log_count - i, line) for i, line in reversed(list(enumerate(agent.log)))]
+
+def memory_entries(agent):
+    """The agent's memories as (seq, dict) pairs, oldest first."""
+    return [(memory.seq, memory.to_dict()) for memory in agent.memory_stream.memories]
+
+def get_agent_history(agent, kind='log', since=None, before=None, limit=PAGE_SIZE):
+    """Returns one page of an agent's log or memories."""
+    if kind not in HISTORY_KINDS:
+        raise ValueError(f"Unknown history kind '{kind}', expected one of {HISTORY_KINDS}")
+    entries = log_entries(agent) if kind == 'log' else memory_entries(agent)
+    page = paginate(entries, since=since, before=before, limit=limit)
+    page.update({'agent_id': agent.id, 'kind': kind, 'since': since, 'before': before})
+    return page
+
+class AgentLogFeed:
+    """
+    Pushes new log lines for the agents that clients are currently inspecting.
+    Keeps a cursor per watched agent; agents nobody watches cost nothing.
+    """
+    def __init__(self):
+        self.cursors = {}  # Agent id -> seq of the last line pushed
+
+    def set_watched(self, agent_ids, agents):
+        """Replaces the watched set, starting new agents from their current log position."""
+        self.cursors = {
+            agent_id: self.cursors.get(agent_id, agents[agent_id].log_count)
+            for agent_id in agent_ids if agent_id in agents
+        }
+
+    def collect(self, agents):
+        """Returns a page of new lines for every watched agent that logged something."""
+        updates = []
+        for agent_id, cursor in self.cursors.items():
+            agent = agents[agent_id]
+            if agent.log_count > cursor:
+                page = get_agent_history(agent, 'log', since=cursor, limit=MAX_PAGE_SIZE)
+                self.cursors[agent_id] = agent.log_count
+                updates.append(page)
+        return updates
@@ -0,0 +1,474 @@
+# simulation/checkpoint.py
+# Checkpoint and restore of a whole AgentManager in a compact versioned binary format.
+# A checkpoint file is a full record followed by any number of delta records, each holding only
+# what changed since the record before it, so saving often stays cheap on long runs.
+#
+# Record layout (little-endian):
+#   header  20 bytes  magic b'TC', version u8, kind u8 (FULL or DELTA), tick u32,
+#                     base tick u32 (tick of the previous record, 0 for FULL), body length u32,
+#                     reserved u32
+#   body    zlib-compressed tagged values (see _pack), a dict of sections:
+#           meta, world, rng, timers, occupancy, lod and agents
+#
+# Agents' memory streams and logs only grow at the front or back, so a delta carries just the
+# new memories and log lines. Everything else is diffed key by key against the previous record.
+# Run `python -m simulation.checkpoint` for a round trip that checks a restored town ticks on
+# exactly like the original.
+
+import os
+import struct
+import zlib
+from behavior.behavior_tree import get_run_state, set_run_state
+from simulation.entities import LOG_LENGTH
+from simulation.lod import Dormancy
+from simulation.memory.memory import Memory
+from simulation.occupancy import OccupancyTracker
+from simulation.timers import LEVELS, TimerWheel
+
+CHECKPOINT_MAGIC = b'TC'
+CHECKPOINT_VERSION = 2
+HEADER = struct.Struct('<2sBBIIII')
+FULL = 0
+DELTA = 1
+DELTAS_PER_FULL = 20  # A file is rewritten in full after this many deltas, bounding restore time
+COMPRESSION_LEVEL = 6
+
+# Agent attributes saved as they are; needs, path, behavior tree, memories and log are handled separately
+AGENT_FIELDS = (
+    'x', 'y', 'current_goal', 'current_action', 'current_activity', 'state', 'destination_name', 'path_index',
+    'action_ends', 'wages_from', 'needs_from', 'interacting_with', 'money', 'rest_ticks', 'rest_location',
+    'eat_ticks', 'log_count',
+)
+
+# --- Tagged binary values ---
+REMOVED = type('Removed', (), {'__repr__': lambda self: 'REMOVED'})()  # Marks a key a delta deletes
+_SMALL = struct.Struct('<i')
+_LARGE = struct.Struct('<q')
+_UNSIGNED = struct.Struct('<Q')  # Random stream states and seeds use all 64 bits
+_FLOAT = struct.Struct('<d')
+_COUNT = struct.Struct('<I')
+
+def _pack(value, out):
+    """Appends one value: None, bool, int, float, str, list, tuple, dict or REMOVED."""
+    kind = type(value)
+    if value is None:
+        out += b'N'
+    elif kind is bool:
+        out += b'T' if value else b'F'
+    elif kind is int:
+        if -2 ** 31 <= value < 2 ** 31:
+            out += b'i'
+            out += _SMALL.pack(value)
+        elif -2 ** 63 <= value < 2 ** 63:
+            out += b'q'
+            out += _LARGE.pack(value)
+        else:
+            out += b'u'
+            out += _UNSIGNED.pack(value)
+    elif kind is float:
+        out += b'd'
+        out += _FLOAT.pack(value)
+    elif kind is str:
+        data = value.encode('utf-8')
+        out += b's'
+        out += _COUNT.pack(len(data))
+        out += data
+    elif kind is list or kind is tuple:
+        out += b'l' if kind is list else b't'
+        out += _COUNT.pack(len(value))
+        for item in value:
+            _pack(item, out)
+    elif kind is dict:
+        out += b'm'
+        out += _COUNT.pack(len(value))
+        for key, item in value.items():
+            _pack(key, out)
+            _pack(item, out)
+    elif value is REMOVED:
+        out += b'X'
+    else:
+        raise TypeError(f"Cannot checkpoint a value of type {kind.__name__}")
+
+def _unpack(data, offset):
+    """Reads one value at `offset`; returns (value, next offset)."""
+    tag = data[offset:offset + 1]
+    offset += 1
+    if tag == b'i':
+        return _SMALL.unpack_from(data, offset)[0], offset + 4
+    if tag == b'd':
+        return _FLOAT.unpack_from(data, offset)[0], offset + 8
+    if tag == b's':
+        (length,) = _COUNT.unpack_from(data, offset)
+        offset += 4
+        return bytes(data[offset:offset + length]).decode('utf-8'), offset + length
+    if tag in (b'l', b't'):
+        (count,) = _COUNT.unpack_from(data, offset)
+        offset += 4
+        items = []
+        for _ in range(count):
+            item, offset = _unpack(data, offset)
+            items.append(item)
+        return (items if tag == b'l' else tuple(items)), offset
+    if tag == b'm':
+        (count,) = _COUNT.unpack_from(data, offset)
+        offset += 4
+        result = {}
+        for _ in range(count):
+            key, offset = _unpack(data, offset)
+            result[key], offset = _unpack(data, offset)
+        return result, offset
+    if tag == b'N':
+        return None, offset
+    if tag in (b'T', b'F'):
+        return tag == b'T', offset
+    if tag == b'q':
+        return _LARGE.unpack_from(data, offset)[0], offset + 8
+    if tag == b'u':
+        return _UNSIGNED.unpack_from(data, offset)[0], offset + 8
+    if tag == b'X':
+        return REMOVED, offset
+    raise ValueError(f"Corrupt checkpoint: unknown tag {tag!r} at byte {offset - 1}")
+
+def encode_record(kind, tick, base_tick, body):
+    """Packs a dict of sections into one record."""
+    out = bytearray()
+    _pack(body, out)
+    data = zlib.compress(bytes(out), COMPRESSION_LEVEL)
+    return HEADER.pack(CHECKPOINT_MAGIC, CHECKPOINT_VERSION, kind, tick, base_tick, len(data), 0) + data
+
+def decode_records(data):
+    """
+    Decodes the records in a checkpoint file's contents into (kind, tick, base_tick, body)
+    tuples. A record cut short at the end of the data, e.g. by a crash while it was being
+    appended, is left out.
+    """
+    records = []
+    offset = 0
+    while offset + HEADER.size <= len(data):
+        magic, version, kind, tick, base_tick, length, _ = HEADER.unpack_from(data, offset)
+        if magic != CHECKPOINT_MAGIC or version != CHECKPOINT_VERSION:
+            raise ValueError(f"Unsupported checkpoint (magic={magic!r}, version={version})")
+        start = offset + HEADER.size
+        if start + length > len(data):
+            break
+        body, _ = _unpack(memoryview(zlib.decompress(data[start:start + length])), 0)
+        records.append((kind, tick, base_tick, body))
+        offset = start + length
+    return records
+
+# --- Capturing and applying state ---
+def _memory_tuple(memory):
+    return (memory.event, memory.timestamp, memory.related_agents, memory.details, memory.seq)
+
+def _agent_record(agent, since):
+    """Everything about an agent that changes while ticking. Memories and log lines come from after `since`."""
+    record = {field: getattr(agent, field) for field in AGENT_FIELDS}
+    record['needs'] = dict(agent.needs)
+    record['path'] = None if agent.path is None else list(agent.path)  # None after a route that found no spot
+    record['bt'] = get_run_state(agent.behavior_tree)
+    record['rng'] = agent.rng.state
+    stream = agent.memory_stream
+    memory_from, log_from = since
+    new_memories = min(stream.memory_count - memory_from, len(stream.memories))
+    record['memory_count'] = stream.memory_count
+    record['memories'] = [_memory_tuple(m) for m in stream.memories[len(stream.memories) - new_memories:]] if new_memories > 0 else []
+    new_lines = min(agent.log_count - log_from, len(agent.log))
+    record['log'] = agent.log[:new_lines] if new_lines > 0 else []
+    return record
+
+def _timer_entries(wheel):
+    """Live timers as (level, slot, key, due) in firing order within each slot; level -1 is the overflow."""
+    live = wheel.due
+    entries = [
+        (level, slot, key, due)
+        for level in range(LEVELS) for slot, bucket in enumerate(wheel.wheels[level])
+        for key, due in bucket if live.get(key) == due
+    ]
+    entries.extend((-1, 0, key, due) for key, due in wheel.overflow if live.get(key) == due)
+    return entries
+
+def capture(manager, since=None):
+    """
+    The state of `manager` as a dict of sections. `since` maps agent ids to the
+    (memory_count, log_count) already saved; without it every memory and log line is included.
+    """
+    since = since or {}
+    occupancy = manager.occupancy
+    state = {
+        'meta': {
+            'rows': manager.world_index.rows, 'cols': manager.world_index.cols,
+            'places': list(manager.world_index.place_names), 'config': manager.agent_config,
+        },
+        'world': {
+            'time': manager.world_state['time'], 'day_index': manager.world_state['day_index'],
+            'now': manager.clock.now, 'stories': list(manager.daily_stories),
+        },
+        'rng': {'seed': manager.seed, 'world': manager.rng.state},
+        'timers': {'now': manager.timers.now, 'entries': _timer_entries(manager.timers)},
+        'occupancy': {
+            'agent_cell': dict(occupancy.agent_cell),
+            'agent_target': dict(occupancy.agent_target),
+            'pools': {name: list(pool.cells) for name, pool in occupancy.pools.items()},
+        },
+        'lod': None if manager.lod is None else {'dormant': {
+            agent_id: tuple(dormancy) for agent_id, dormancy in manager.lod.dormant.items()
+        }},
+        'agents': {agent.id: _agent_record(agent, since.get(agent.id, (0, 0))) for agent in manager.agents.values()},
+    }
+    return state
+
+def _check_compatible(manager, state):
+    meta = state['meta']
+    index = manager.world_index
+    if (meta['rows'], meta['cols'], meta['places']) != (index.rows, index.cols, list(index.place_names)):
+        raise ValueError("Checkpoint was taken on a different map")
+    if set(state['agents']) != set(manager.agents):
+        raise ValueError("Checkpoint was taken with a different population")
+    if (state['lod'] is None) != (manager.lod is None):
+        print("Checkpoint was taken with level of detail switched the other way; travelling agents are put back on the map.")
+
+def _apply_agent(agent, record):
+    for field in AGENT_FIELDS:
+        setattr(agent, field, record[field])
+    agent.needs = dict(record['needs'])
+    agent.path = None if record['path'] is None else list(record['path'])
+    set_run_state(agent.behavior_tree, record['bt'])
+    agent.rng.state = record['rng']
+    stream = agent.memory_stream
+    stream.memories = []
+    for event, timestamp, related_agents, details, seq in record['memories']:
+        memory = Memory(event, timestamp=timestamp, related_agents=related_agents, details=details)
+        memory.seq = seq
+        stream.memories.append(memory)
+    stream.memory_count = record['memory_count']
+    agent.log = list(record['log'])
+
+def apply(manager, state):
+    """Puts a manager built for the same map and agents into a captured state."""
+    _check_compatible(manager, state)
+    world = state['world']
+    manager.world_state['time'] = tuple(world['time'])
+    manager.world_state['day_index'] = world['day_index']
+    manager.world_state['day_of_week'] = manager.days[world['day_index'] % 7]
+    manager.clock.now = world['now']
+    manager.daily_stories = list(world['stories'])
+    manager.seed = state['rng']['seed']
+    manager.rng.state = state['rng']['world']
+
+    # Agents in the saved order, since it decides the tick order before shuffling
+    manager.agents = {agent_id: manager.agents[agent_id] for agent_id in state['agents']}
+    manager.world_state['agents'] = manager.agents
+    for agent_id, record in state['agents'].items():
+        _apply_agent(manager.agents[agent_id], record)
+    manager._index_schedules()
+
+    occupancy = OccupancyTracker(manager.world_index)
+    saved = state['occupancy']
+    lifted = state['lod']['dormant'] if state['lod'] is not None and manager.lod is not None else {}
+    for agent_id, agent in manager.agents.items():
+        cell = saved['agent_cell'].get(agent_id)
+        if cell is None and agent_id not in lifted:
+            cell = (agent.x, agent.y)  # Travelling without level of detail to finish the trip
+        if cell is not None:
+            occupancy.place_agent(agent_id, cell)
+    for agent_id, cell in saved['agent_target'].items():
+        occupancy.set_target(agent_id, cell)
+    for name, cells in saved['pools'].items():
+        pool = occupancy.pools[name]
+        if set(cells) == set(pool.cells):
+            # Same free cells in the saved order, so spots are sampled as before
+            pool.cells = list(cells)
+            pool.index = {cell: i for i, cell in enumerate(pool.cells)}
+    manager.occupancy = occupancy
+
+    timers = TimerWheel(state['timers']['now'])
+    for level, slot, key, due in state['timers']['entries']:
+        (timers.overflow if level < 0 else timers.wheels[level][slot]).append((key, due))
+        timers.due[key] = due
+    manager.timers = timers
+
+    if manager.lod is not None:
+        manager.lod.dormant = {agent_id: Dormancy(*dormancy) for agent_id, dormancy in lifted.items()}
+        manager.lod.tick = manager.clock.now
+    manager.state_encoder.request_keyframe()
+
+def _diff(old, new):
+    """Entries of dict `new` that differ from dict `old`, recursing into nested dicts."""
+    changes = {}
+    for key, value in new.items():
+        before = old.get(key, REMOVED)
+        if type(value) is dict and type(before) is dict:
+            nested = _diff(before, value)
+            if nested:
+                changes[key] = nested
+        elif before != value or type(before) is not type(value):
+            changes[key] = value
+    for key in old:
+        if key not in new:
+            changes[key] = REMOVED
+    return changes
+
+def _merge(base, changes):
+    """Applies a _diff result to `base` in place."""
+    for key, value in changes.items():
+        if value is REMOVED:
+            base.pop(key, None)
+        elif type(value) is dict and type(base.get(key)) is dict:
+            _merge(base[key], value)
+        else:
+            base[key] = value
+
+def merge_delta(state, delta):
+    """Applies a delta record's body to a state from earlier records, in place."""
+    agents = delta.pop('agents', {})
+    _merge(state, delta)
+    for agent_id, changes in agents.items():
+        record = state['agents'].setdefault(agent_id, {'memories': [], 'log': []})
+        memories = changes.pop('memories', [])
+        lines = changes.pop('log', [])
+        _merge(record, changes)
+        record['memories'].extend(memories)
+        record['log'] = (lines + record['log'])[:LOG_LENGTH]
+
+# --- Files ---
+def encode_checkpoint(manager):
+    """A full checkpoint of `manager` as one record, e.g. to start other processes from."""
+    return encode_record(FULL, manager.clock.now, 0, capture(manager))
+
+def read_checkpoint(data):
+    """The state held by a checkpoint file (its path) or its contents, with every delta applied."""
+    if isinstance(data, (str, os.PathLike)):
+        with open(data, 'rb') as f:
+            data = f.read()
+    records = decode_records(data)
+    if not records or records[0][0] != FULL:
+        raise ValueError("Checkpoint does not start with a full record")
+    state = records[0][3]
+    tick = records[0][1]
+    for kind, record_tick, base_tick, body in records[1:]:
+        if kind != DELTA or base_tick != tick:
+            break  # Not a continuation of what came before; keep the state so far
+        merge_delta(state, body)
+        tick = record_tick
+    return state
+
+def restore_checkpoint(manager, data):
+    """Restores `manager` from a checkpoint file (its path) or its contents; returns the restored tick."""
+    apply(manager, read_checkpoint(data))
+    return manager.clock.now
+
+def load_manager(data, world_layout, places_data, **kwargs):
+    """Builds an AgentManager with the agents a checkpoint was taken with and restores it."""
+    from simulation.manager import AgentManager
+    state = read_checkpoint(data)
+    manager = AgentManager(world_layout, places_data, agent_config=state['meta']['config'], seed=state['rng']['seed'], **kwargs)
+    apply(manager, state)
+    return manager
+
+class CheckpointWriter:
+    """
+    Saves a manager to a checkpoint file. The first save, and every save after
+    `deltas_per_full` deltas, rewrites the file with a full record (through a temporary file,
+    so a crash never leaves it half written); the others append a delta against the last save.
+    """
+    def __init__(self, manager, path, deltas_per_full=DELTAS_PER_FULL):
+        self.manager = manager
+        self.path = path
+        self.deltas_per_full = deltas_per_full
+        self.deltas = 0
+        self._last = None       # State of the last save without memories and log lines
+        self._last_tick = None
+
+    def save(self):
+        """Writes a checkpoint of the manager's current state; returns (kind, bytes written)."""
+        manager = self.manager
+        full = self._last is None or self.deltas >= self.deltas_per_full
+        since = None if full else {
+            agent_id: (record['memory_count'], record['log_count']) for agent_id, record in self._last['agents'].items()
+        }
+        state = capture(manager, since)
+        appended = {}
+        for agent_id, record in state['agents'].items():
+            appended[agent_id] = (record.pop('memories'), record.pop('log'))
+        if full:
+            body = dict(state, agents={
+                agent_id: dict(record, memories=appended[agent_id][0], log=appended[agent_id][1])
+                for agent_id, record in state['agents'].items()
+            })
+            data = encode_record(FULL, manager.clock.now, 0, body)
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, self.path)
+            self.deltas = 0
+        else:
+            body = _diff(self._last, state)
+            for agent_id, (memories, lines) in appended.items():
+                if memories or lines:
+                    changes = body.setdefault('agents', {}).setdefault(agent_id, {})
+                    changes['memories'], changes['log'] = memories, lines
+            data = encode_record(DELTA, manager.clock.now, self._last_tick, body)
+            with open(self.path, 'ab') as f:
+                f.write(data)
+            self.deltas += 1
+        self._last = state
+        self._last_tick = manager.clock.now
+        return ('full' if full else 'delta'), len(data)
+
+def _round_trip(warmup=200, ticks=200):
+    """Checkpoints a town mid-run, restores it into a fresh manager and checks both tick on alike."""
+    import contextlib
+    import io
+    import tempfile
+    import time
+    from simulation.manager import AgentManager
+    from simulation.world import load_map_data
+
+    def snapshot(manager):
+        for agent in manager.agents.values():
+            manager._settle_needs(agent)
+        return [
+            (a.id, a.x, a.y, a.state, a.current_activity, a.money, tuple(a.needs.values()), a.log_count, list(a.log))
+            for a in manager.agents.values()
+        ]
+
+    map_data = load_map_data()
+    with contextlib.redirect_stdout(io.StringIO()):
+        original = AgentManager(map_data['layout'], map_data['places'])
+    for _ in range(warmup):
+        original.tick(encode=False)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'town.ckpt')
+        writer = CheckpointWriter(original, path)
+        start = time.perf_counter()
+        kind, full_size = writer.save()
+        save_ms = (time.perf_counter() - start) * 1000
+        expected = []
+        delta_sizes = []
+        for _ in range(ticks):
+            original.tick(encode=False)
+            expected.append(snapshot(original))
+            if len(expected) % 10 == 0:
+                delta_sizes.append(writer.save()[1])
+        # Restore from the full record alone, then from the whole chain
+        with open(path, 'rb') as f:
+            data = f.read()
+        first = data[:HEADER.size + HEADER.unpack_from(data, 0)[5]]
+        with contextlib.redirect_stdout(io.StringIO()):
+            restored = load_manager(first, map_data['layout'], map_data['places'])
+        actual = []
+        for _ in range(ticks):
+            restored.tick(encode=False)
+            actual.append(snapshot(restored))
+        assert actual == expected, "Restored town diverged"
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            chained = load_manager(path, map_data['layout'], map_data['places'])
+        restore_ms = (time.perf_counter() - start) * 1000
+    assert snapshot(chained) == expected[-1], "Delta chain restored a different state"
+    print(f"Round trip OK: {ticks} ticks after restore match the original.")
+    print(f"Full checkpoint {full_size} bytes in {save_ms:.1f} ms; deltas every 10 ticks average "
+          f"{sum(delta_sizes) / len(delta_sizes):.0f} bytes; restore with {len(delta_sizes)} deltas {restore_ms:.1f} ms.")
+
+if __name__ == '__main__':
+    _round_trip()
@@ -196,99 +196,131 @@ SCHEDULE_TEMPLATES = {
     },
 }
 
+# --- Sleep Schedules ---
+# Sleep windows as (start_hour, end_hour), wrapping past midnight when end < start.
+# The first trait in this dict's order that an agent has decides its window, whatever the order of
+# the agent's own traits; 'default' applies otherwise.
+SLEEP_SCHEDULES = {
+    'lazy': (22, 10),               # Lazy agents sleep more
+    'workaholic': (1, 6),           # Workaholics sleep less
+    'fitness_enthusiast': (22, 6),  # Fitness enthusiasts have an early bedtime
+    'default': (23, 8),             # Normal sleep schedule
+}
+
 # --- Activity Data ---
-# Maps activities to their required location and cost.
+# Maps activities to their required location, cost, per-tick wage and category tags.
+# Tags classify activities explicitly (see ACTIVITY_TAG_EFFECTS); names are never parsed.
+#   work: paid work, earns "wage" per tick at the activity location
+#   strenuous: tiredness rises at the working rate
+#   eat / coffee / social / exercise / relax / sleep: need changes on arrival
+#   rest: short rest at a location chosen by the agent
 ACTIVITY_DATA = {
     # Work Activities
-    "work_at_office": {"location": "business_office", "cost": 0},
-    "work_at_cafe": {"location": "downtown_cafe", "cost": 0},
-    "morning_shift_at_cafe": {"location": "downtown_cafe", "cost": 0},
-    "afternoon_shift_at_cafe": {"location": "downtown_cafe", "cost": 0},
-    "brunch_shift_at_cafe": {"location": "downtown_cafe", "cost": 0},
-    "overtime_work_at_office": {"location": "business_office", "cost": 0},
-    "focused_work_at_office": {"location": "business_office", "cost": 0},
-    "minimal_work_at_office": {"location": "business_office", "cost": 0},
-    "intensive_work_at_office": {"location": "business_office", "cost": 0},
-    "working_lunch_at_office": {"location": "business_office", "cost": 0},
-    "weekend_work_at_office": {"location": "business_office", "cost": 0},
-    "personal_projects_at_office": {"location": "business_office", "cost": 0},
-    "finish_work_at_office": {"location": "business_office", "cost": 0},
+    "work_at_office": {"location": "business_office", "cost": 0, "wage": 0.5, "tags": ["work", "strenuous"]},
+    "work_at_cafe": {"location": "downtown_cafe", "cost": 0, "wage": 0.5, "tags": ["work", "strenuous"]},
+    "morning_shift_at_cafe": {"location": "downtown_cafe", "cost": 0, "wage": 0.8, "tags": ["work"]},
+    "afternoon_shift_at_cafe": {"location": "downtown_cafe", "cost": 0, "wage": 0.8, "tags": ["work"]},
+    "brunch_shift_at_cafe": {"location": "downtown_cafe", "cost": 0, "wage": 0.8, "tags": ["work"]},
+    "overtime_work_at_office": {"location": "business_office", "cost": 0, "wage": 0.5, "tags": ["work", "strenuous"]},
+    "focused_work_at_office": {"location": "business_office", "cost": 0, "wage": 0.5, "tags": ["work", "strenuous"]},
+    "minimal_work_at_office": {"location": "business_office", "cost": 0, "wage": 0.5, "tags": ["work", "strenuous"]},
+    "intensive_work_at_office": {"location": "business_office", "cost": 0, "wage": 0.5, "tags": ["work", "strenuous"]},
+    "working_lunch_at_office": {"location": "business_office", "cost": 0, "wage": 0.5, "tags": ["work", "strenuous", "eat"]},
+    "weekend_work_at_office": {"location": "business_office", "cost": 0, "wage": 0.5, "tags": ["work", "strenuous"]},
+    "personal_projects_at_office": {"location": "business_office", "cost": 0, "tags": []},
+    "finish_work_at_office": {"location": "business_office", "cost": 0, "wage": 0.5, "tags": ["work", "strenuous"]},
 
     # Education Activities
-    "morning_classes_at_college": {"location": "college_campus", "cost": 0},
-    "afternoon_classes_at_college": {"location": "college_campus", "cost": 0},
-    "study_at_college": {"location": "college_campus", "cost": 0},
-    "study_session_at_college": {"location": "college_campus", "cost": 0},
-    "evening_study_at_accommodation": {"location": "student_accommodation", "cost": 0},
+    "morning_classes_at_college": {"location": "college_campus", "cost": 0, "wage": 0.3, "tags": ["work"]},
+    "afternoon_classes_at_college": {"location": "college_campus", "cost": 0, "wage": 0.3, "tags": ["work"]},
+    "study_at_college": {"location": "college_campus", "cost": 0, "tags": []},
+    "study_session_at_college": {"location": "college_campus", "cost": 0, "tags": []},
+    "evening_study_at_accommodation": {"location": "student_accommodation", "cost": 0, "tags": []},
 
     # Food & Dining
-    "morning_coffee_at_cafe": {"location": "downtown_cafe", "cost": 8},
-    "lunch_break_at_cafe": {"location": "downtown_cafe", "cost": 15},
-    "dinner_at_cafe": {"location": "downtown_cafe", "cost": 20},
-    "late_breakfast_at_cafe": {"location": "downtown_cafe", "cost": 12},
-    "brunch_at_cafe": {"location": "downtown_cafe", "cost": 18},
-    "lunch_at_cafe": {"location": "downtown_cafe", "cost": 15},
-    "early_coffee_at_cafe": {"location": "downtown_cafe", "cost": 6},
-    "coffee_break_at_cafe": {"location": "downtown_cafe", "cost": 5},
-    "protein_breakfast_at_cafe": {"location": "downtown_cafe", "cost": 15},
-    "healthy_lunch_at_cafe": {"location": "downtown_cafe", "cost": 18},
-    "post_workout_meal_at_cafe": {"location": "downtown_cafe", "cost": 20},
-    "networking_at_cafe": {"location": "downtown_cafe", "cost": 25},
-    "dinner_meeting_at_cafe": {"location": "downtown_cafe", "cost": 35},
-    "dinner_with_friends_at_cafe": {"location": "downtown_cafe", "cost": 25},
-    "breakfast_at_accommodation": {"location": "student_accommodation", "cost": 0},
-    "dinner_at_accommodation": {"location": "student_accommodation", "cost": 0},
+    "morning_coffee_at_cafe": {"location": "downtown_cafe", "cost": 8, "tags": ["coffee"]},
+    "lunch_break_at_cafe": {"location": "downtown_cafe", "cost": 15, "tags": ["eat"]},
+    "dinner_at_cafe": {"location": "downtown_cafe", "cost": 20, "tags": ["eat"]},
+    "late_breakfast_at_cafe": {"location": "downtown_cafe", "cost": 12, "tags": ["eat"]},
+    "brunch_at_cafe": {"location": "downtown_cafe", "cost": 18, "tags": ["eat"]},
+    "lunch_at_cafe": {"location": "downtown_cafe", "cost": 15, "tags": ["eat"]},
+    "early_coffee_at_cafe": {"location": "downtown_cafe", "cost": 6, "tags": ["coffee"]},
+    "coffee_break_at_cafe": {"location": "downtown_cafe", "cost": 5, "tags": ["coffee"]},
+    "protein_breakfast_at_cafe": {"location": "downtown_cafe", "cost": 15, "tags": ["eat"]},
+    "healthy_lunch_at_cafe": {"location": "downtown_cafe", "cost": 18, "tags": ["eat"]},
+    "post_workout_meal_at_cafe": {"location": "downtown_cafe", "cost": 20, "tags": ["eat"]},
+    "networking_at_cafe": {"location": "downtown_cafe", "cost": 25, "tags": ["social"]},
+    "dinner_meeting_at_cafe": {"location": "downtown_cafe", "cost": 35, "tags": ["eat"]},
+    "dinner_with_friends_at_cafe": {"location": "downtown_cafe", "cost": 25, "tags": ["eat"]},
+    "breakfast_at_accommodation": {"location": "student_accommodation", "cost": 0, "tags": ["eat"]},
+    "dinner_at_accommodation": {"location": "student_accommodation", "cost": 0, "tags": ["eat"]},
 
     # Home Activities
-    "lazy_morning_at_home": {"location": "home", "cost": 0},
-    "dinner_at_home": {"location": "home", "cost": 0},
-    "relax_at_home": {"location": "home", "cost": 0},
-    "slow_morning_at_home": {"location": "home", "cost": 0},
-    "easy_dinner_at_home": {"location": "home", "cost": 0},
-    "takeout_dinner_at_home": {"location": "home", "cost": 25},
-    "late_evening_at_home": {"location": "home", "cost": 0},
-    "sleep_in_at_home": {"location": "home", "cost": 0},
-    "sleep_in_at_accommodation": {"location": "student_accommodation", "cost": 0},
-    "meal_prep_at_home": {"location": "home", "cost": 0},
-    "healthy_dinner_at_home": {"location": "home", "cost": 0},
-    "planning_at_home": {"location": "home", "cost": 0},
+    "lazy_morning_at_home": {"location": "home", "cost": 0, "tags": []},
+    "dinner_at_home": {"location": "home", "cost": 0, "tags": ["eat"]},
+    "relax_at_home": {"location": "home", "cost": 0, "tags": ["relax"]},
+    "slow_morning_at_home": {"location": "home", "cost": 0, "tags": []},
+    "easy_dinner_at_home": {"location": "home", "cost": 0, "tags": ["eat"]},
+    "takeout_dinner_at_home": {"location": "home", "cost": 25, "tags": ["eat"]},
+    "late_evening_at_home": {"location": "home", "cost": 0, "tags": []},
+    "sleep_in_at_home": {"location": "home", "cost": 0, "tags": ["sleep"]},
+    "sleep_in_at_accommodation": {"location": "student_accommodation", "cost": 0, "tags": ["sleep"]},
+    "meal_prep_at_home": {"location": "home", "cost": 0, "tags": []},
+    "healthy_dinner_at_home": {"location": "home", "cost": 0, "tags": ["eat"]},
+    "planning_at_home": {"location": "home", "cost": 0, "tags": []},
 
     # Fitness & Health
-    "evening_workout_at_gym": {"location": "fitness_gym", "cost": 10},
-    "workout_at_gym": {"location": "fitness_gym", "cost": 10},
-    "exercise_at_gym": {"location": "fitness_gym", "cost": 10},
-    "morning_workout_at_gym": {"location": "fitness_gym", "cost": 10},
-    "evening_training_at_gym": {"location": "fitness_gym", "cost": 10},
-    "intensive_workout_at_gym": {"location": "fitness_gym", "cost": 15},
-    "social_workout_at_gym": {"location": "fitness_gym", "cost": 10},
+    "evening_workout_at_gym": {"location": "fitness_gym", "cost": 10, "tags": ["exercise", "strenuous"]},
+    "workout_at_gym": {"location": "fitness_gym", "cost": 10, "tags": ["exercise", "strenuous"]},
+    "exercise_at_gym": {"location": "fitness_gym", "cost": 10, "tags": ["exercise", "strenuous"]},
+    "morning_workout_at_gym": {"location": "fitness_gym", "cost": 10, "tags": ["exercise", "strenuous"]},
+    "evening_training_at_gym": {"location": "fitness_gym", "cost": 10, "tags": ["exercise", "strenuous"]},
+    "intensive_workout_at_gym": {"location": "fitness_gym", "cost": 15, "tags": ["exercise", "strenuous"]},
+    "social_workout_at_gym": {"location": "fitness_gym", "cost": 10, "tags": ["exercise", "strenuous"]},
 
     # Social Activities
-    "socialize_at_park": {"location": "central_park", "cost": 0},
-    "drinks_at_bar": {"location": "nightlife_bar", "cost": 30},
-    "party_at_bar": {"location": "nightlife_bar", "cost": 50},
-    "evening_drinks_at_bar": {"location": "nightlife_bar", "cost": 25},
-    "nightlife_at_bar": {"location": "nightlife_bar", "cost": 60},
-    "casual_socializing_at_bar": {"location": "nightlife_bar", "cost": 20},
-    "business_drinks_at_bar": {"location": "nightlife_bar", "cost": 40},
-    "lunch_break_at_park": {"location": "central_park", "cost": 0},
-    "relax_at_park": {"location": "central_park", "cost": 0},
-    "social_time_at_park": {"location": "central_park", "cost": 0},
-    "personal_time_at_park": {"location": "central_park", "cost": 0},
-    "recovery_walk_at_park": {"location": "central_park", "cost": 0},
-    "outdoor_activities_at_park": {"location": "central_park", "cost": 0},
-    "leisure_time_at_park": {"location": "central_park", "cost": 0},
-    "lazy_afternoon_at_park": {"location": "central_park", "cost": 0},
-    "relaxation_at_park": {"location": "central_park", "cost": 0},
+    "socialize_at_park": {"location": "central_park", "cost": 0, "tags": ["social", "relax"]},
+    "drinks_at_bar": {"location": "nightlife_bar", "cost": 30, "tags": ["social"]},
+    "party_at_bar": {"location": "nightlife_bar", "cost": 50, "tags": ["social"]},
+    "evening_drinks_at_bar": {"location": "nightlife_bar", "cost": 25, "tags": ["social"]},
+    "nightlife_at_bar": {"location": "nightlife_bar", "cost": 60, "tags": ["social"]},
+    "casual_socializing_at_bar": {"location": "nightlife_bar", "cost": 20, "tags": ["social"]},
+    "business_drinks_at_bar": {"location": "nightlife_bar", "cost": 40, "tags": ["social"]},
+    "lunch_break_at_park": {"location": "central_park", "cost": 0, "tags": ["eat", "relax"]},
+    "relax_at_park": {"location": "central_park", "cost": 0, "tags": ["relax"]},
+    "social_time_at_park": {"location": "central_park", "cost": 0, "tags": ["social", "relax"]},
+    "personal_time_at_park": {"location": "central_park", "cost": 0, "tags": ["relax"]},
+    "recovery_walk_at_park": {"location": "central_park", "cost": 0, "tags": ["relax"]},
+    "outdoor_activities_at_park": {"location": "central_park", "cost": 0, "tags": ["relax"]},
+    "leisure_time_at_park": {"location": "central_park", "cost": 0, "tags": ["relax"]},
+    "lazy_afternoon_at_park": {"location": "central_park", "cost": 0, "tags": ["relax"]},
+    "relaxation_at_park": {"location": "central_park", "cost": 0, "tags": ["relax"]},
 
     # Shopping & Errands
-    "grocery_shopping": {"location": "grocery_store", "cost": 20},
-    "lunch_and_shopping_grocery": {"location": "grocery_store", "cost": 25},
-    "dinner_and_groceries": {"location": "grocery_store", "cost": 25},
-    "grocery_shopping_healthy": {"location": "grocery_store", "cost": 20},
-    "minimal_shopping_grocery": {"location": "grocery_store", "cost": 20},
+    "grocery_shopping": {"location": "grocery_store", "cost": 20, "tags": []},
+    "lunch_and_shopping_grocery": {"location": "grocery_store", "cost": 25, "tags": ["eat"]},
+    "dinner_and_groceries": {"location": "grocery_store", "cost": 25, "tags": ["eat"]},
+    "grocery_shopping_healthy": {"location": "grocery_store", "cost": 20, "tags": []},
+    "minimal_shopping_grocery": {"location": "grocery_store", "cost": 20, "tags": []},
 
     # Sleep
-    "sleep_at_home": {"location": "home", "cost": 0},
+    "sleep_at_home": {"location": "home", "cost": 0, "tags": ["sleep"]},
+
+    # Needs-driven Activities (started by the behavior tree, not the schedule)
+    "take_a_short_rest": {"location": None, "cost": 0, "tags": ["rest"]},
+    "eat_at_cafe": {"location": "downtown_cafe", "cost": 10, "tags": []},
+}
+
+# --- Activity Tag Effects ---
+# Need changes applied when an activity with the tag starts. 'coffee' only applies
+# when the activity is not also tagged 'eat'.
+ACTIVITY_TAG_EFFECTS = {
+    'eat': {'hunger': -50, 'energy': -20},     # Eating also restores some energy
+    'coffee': {'hunger': -15, 'energy': -15},  # Coffee reduces tiredness
+    'social': {'social': -60},
+    'exercise': {'energy': 5},                 # Workout increases tiredness
+    'relax': {'energy': -25},                  # Relaxing reduces tiredness
+    'sleep': {'energy': -90},                  # Sleeping greatly reduces tiredness
 }
 
 
@@ -297,6 +329,8 @@ ACTIVITY_DATA = {
 # ==================================================================================================
 
 # --- Agent Configuration ---
+# An entry may carry its own 'relationships' (in the form of RELATIONSHIPS[agent_id]); entries
+# without one use RELATIONSHIPS. Generated populations do (see simulation/worldgen.py).
 AGENT_CONFIG = [
     {
         'id': 'alex', 'name': 'Alex Rodriguez', 'icon': 'AR', 'color': '#FF6B6B',
@@ -3,14 +3,21 @@
 
 import random
 from simulation.config import PERSONALITY_TRAITS, RELATIONSHIPS
+from simulation.activities import ACTIVITIES, STRENUOUS
+from simulation.timers import TickClock
+
+LOG_LENGTH = 50  # Newest log entries kept on the agent; older ones live on in the memory stream
 
 class Agent:
     """
     Represents an agent in the simulation, holding all its state and attributes.
     Supports personality, relationships, dynamic memory, and simulation needs.
     """
-    def __init__(self, agent_id, name, icon, color, home_pos, personality, schedule_template, work_location, background=None):
+    def __init__(self, agent_id, name, icon, color, home_pos, personality, schedule_template, work_location, background=None,
+                 clock=None, rng=None, relationships=None):
         self.id = agent_id
+        self.clock = clock or TickClock()  # The manager's tick clock; action_duration is counted against it
+        self.rng = rng or random.Random()  # The agent's own random stream (see simulation/rng.py)
         self.name = name
         self.icon = icon
         self.color = color
@@ -23,7 +30,8 @@ class Agent:
         self.personality = {k: v for p in personality for k, v in PERSONALITY_TRAITS.get(p, {}).items()}
         self.schedule_template = schedule_template
         self.work_location = work_location
-        self.relationships = RELATIONSHIPS.get(self.id, {})
+        # Other agent id -> {'type', 'affinity'}; agents without their own come from RELATIONSHIPS
+        self.relationships = RELATIONSHIPS.get(self.id, {}) if relationships is None else relationships
 
         # --- Dynamic State ---
         self.current_goal = "Initializing..."
@@ -33,10 +41,12 @@ class Agent:
         self.destination_name = None
         self.path = []
         self.path_index = 0
-        self.action_duration = 0
+        self.action_ends = 0  # Tick in which the current action or conversation ends
+        self.wages_from = 0   # Last tick the current action's wages were paid up to
+        self.needs_from = 0   # Last tick the needs were brought up to date for
         self.interacting_with = None # ID of agent they are talking to
 
-        self.money = random.randint(100, 150)
+        self.money = self.rng.randint(100, 150)
         self.needs = {
             'hunger': 0,
             'social': 0,
@@ -44,6 +54,7 @@ class Agent:
         }
 
         self.rest_ticks = 0  # Track rest cycles for ExecuteRest
+        self.rest_location = None  # Rest spot chosen by PlanPathToRestLocation
         self.eat_ticks = 0   # Track eat cycles for ExecuteEat
 
         self.background = background or f"{name} grew up in this town and has a unique story."
@@ -51,6 +62,27 @@ class Agent:
         self.memory_stream = AgentMemoryStream()
 
         self.log = []
+        self.log_count = 0  # Total entries ever logged; the newest entry has seq == log_count
+
+    @property
+    def action_duration(self):
+        """Ticks left of the current action or conversation; it ends in the tick this reaches 0."""
+        return self.action_ends - self.clock.now
+
+    @action_duration.setter
+    def action_duration(self, ticks):
+        self.action_ends = self.clock.now + ticks
+
+    @property
+    def current_activity(self):
+        """Name of the agent's current activity, or None."""
+        return self._current_activity
+
+    @current_activity.setter
+    def current_activity(self, name):
+        # Keep the compiled activity metadata in sync so tick code never parses the name
+        self._current_activity = name
+        self.activity = ACTIVITIES.get(name) if name else None
 
     def add_log(self, entry, world_time, day_of_week):
         """Adds a new entry to the agent's personal log with a timestamp."""
@@ -60,8 +92,9 @@ class Agent:
         timestamp = f"[{day_of_week} {display_hour:02d}:{minute:02d} {ampm}]"
         log_entry = f"{timestamp} {entry}"
         self.log.insert(0, log_entry)
+        self.log_count += 1
         # Keep the log from getting too long
-        if len(self.log) > 50:
+        if len(self.log) > LOG_LENGTH:
             self.log.pop()
         # Add to memory stream as well
         from simulation.memory.memory import Memory
@@ -70,6 +103,15 @@ class Agent:
 
     def update_needs(self, world_time):
         """Periodically updates the agent's needs over time, influenced by personality."""
+        self.integrate_needs(1)
+
+    def integrate_needs(self, ticks):
+        """
+        Applies `ticks` ticks of need changes at once, for the current activity.
+        Every rate is constant for a given activity, so this equals `ticks` single updates.
+        """
+        if ticks <= 0:
+            return
         # Base increase rates (higher value = more urgent need)
         hunger_increase = 0.25
         social_increase = 0.15
@@ -79,29 +121,32 @@ class Agent:
 
         # Only update needs if not sleeping
         if self.current_activity != "sleep_at_home":
-            self.needs['hunger'] = min(100, self.needs['hunger'] + hunger_increase)
+            self.needs['hunger'] = min(100, self.needs['hunger'] + ticks * hunger_increase)
             
             # Social need increases faster for extroverts
             social_motivation = self.personality.get('social_motivation', 1.0)
-            self.needs['social'] = min(100, self.needs['social'] + (social_increase * social_motivation))
+            self.needs['social'] = min(100, self.needs['social'] + ticks * (social_increase * social_motivation))
         
-        is_working = "work" in (self.current_activity or "")
+        is_working = self.activity is not None and self.activity.flags & STRENUOUS
         
         if self.current_activity == "sleep_at_home":
-             self.needs['energy'] = max(0, self.needs['energy'] - sleep_energy_decrease)
+             self.needs['energy'] = max(0, self.needs['energy'] - ticks * sleep_energy_decrease)
         elif not is_working:
-            self.needs['energy'] = min(100, self.needs['energy'] + energy_increase)
+            self.needs['energy'] = min(100, self.needs['energy'] + ticks * energy_increase)
         else: # Is working
              # Conscientious agents get tired slower while working
             work_ethic_modifier = self.personality.get('work_ethic', 1.0)
-            self.needs['energy'] = min(100, self.needs['energy'] + (work_energy_increase / work_ethic_modifier))
+            self.needs['energy'] = min(100, self.needs['energy'] + ticks * (work_energy_increase / work_ethic_modifier))
 
     def get_relationship(self, other_agent_id):
         """Retrieves the relationship status with another agent."""
         return self.relationships.get(other_agent_id)
 
     def to_dict(self):
-        """Converts the agent object to a dictionary for JSON serialization."""
+        """
+        Converts the agent object to a dictionary for JSON serialization.
+        The log is not included; clients fetch it on demand (see simulation/agent_log.py).
+        """
         return {
             'id': self.id,
             'name': self.name,
@@ -114,7 +159,6 @@ class Agent:
             'state': self.state,
             'needs': self.needs,
             'money': self.money,
-            'log': self.log,
             'interacting_with': self.interacting_with,
             'personality': self.personality_names, # Send personality names to frontend
         }
\ No newline at end of file
@@ -0,0 +1,121 @@
+# simulation/frame_codec.py
+# Compact binary frame format for per-tick agent positions, states and needs.
+# Frames are sent as SocketIO binary attachments and decoded in the browser with typed arrays.
+#
+# Layout (little-endian, column-major so every column is aligned for a typed array view):
+#   header  16 bytes  magic b'TF', version u8, reserved u8, seq u32, count u32,
+#                     day_index u16, hour u8, minute u8
+#   index   u32 x count  agent index in keyframe order (the `index` field of keyframe records)
+#   x       u16 x count
+#   y       u16 x count
+#   state   u8  x count  index into STATE_CODES
+#   needs   u8  x count x 3  hunger, social, energy quantized to whole percent
+#
+# Run `python -m simulation.frame_codec` for a round-trip check and a throughput
+# comparison against the equivalent JSON payload.
+
+import struct
+import numpy as np
+
+FRAME_MAGIC = b'TF'
+FRAME_VERSION = 1
+HEADER = struct.Struct('<2sBBIIHBB')
+STATE_CODES = ('idle', 'moving', 'doing_action', 'interacting')
+STATE_INDEX = {state: i for i, state in enumerate(STATE_CODES)}
+NEED_NAMES = ('hunger', 'social', 'energy')
+# Fields carried by binary frames, which JSON deltas can leave out
+FRAME_FIELDS = ('x', 'y', 'state', 'needs')
+
+def frame_size(count):
+    """Size in bytes of a frame holding `count` agents."""
+    return HEADER.size + count * (4 + 2 + 2 + 1 + 3)
+
+def encode_arrays(seq, day_index, hour, minute, index, x, y, state, needs):
+    """Packs column arrays into a frame. `needs` has shape (count, 3)."""
+    count = len(index)
+    header = HEADER.pack(FRAME_MAGIC, FRAME_VERSION, 0, seq, count, day_index, hour, minute)
+    return b''.join((
+        header,
+        np.asarray(index, dtype='<u4').tobytes(),
+        np.asarray(x, dtype='<u2').tobytes(),
+        np.asarray(y, dtype='<u2').tobytes(),
+        np.asarray(state, dtype='u1').tobytes(),
+        np.clip(np.rint(needs), 0, 255).astype('u1').tobytes(),
+    ))
+
+def encode_frame(agents, world_state, seq, indices=None):
+    """
+    Encodes agents into a binary frame. `indices` gives each agent's position in the
+    keyframe order and defaults to enumeration order.
+    """
+    agents = list(agents)
+    count = len(agents)
+    if indices is None:
+        indices = range(count)
+    needs = np.array([[agent.needs[need] for need in NEED_NAMES] for agent in agents], dtype=np.float64).reshape(count, 3)
+    hour, minute = world_state['time']
+    return encode_arrays(
+        seq, world_state['day_index'], hour, minute,
+        np.fromiter(indices, dtype='<u4', count=count),
+        np.fromiter((agent.x for agent in agents), dtype='<u2', count=count),
+        np.fromiter((agent.y for agent in agents), dtype='<u2', count=count),
+        np.fromiter((STATE_INDEX[agent.state] for agent in agents), dtype='u1', count=count),
+        needs,
+    )
+
+def decode_frame(data):
+    """Decodes a frame into a dict of header values and zero-copy NumPy column views."""
+    magic, version, _, seq, count, day_index, hour, minute = HEADER.unpack_from(data, 0)
+    if magic != FRAME_MAGIC or version != FRAME_VERSION:
+        raise ValueError(f"Unsupported frame (magic={magic!r}, version={version})")
+    offset = HEADER.size
+    columns = {}
+    for name, dtype, width in (('index', '<u4', 1), ('x', '<u2', 1), ('y', '<u2', 1), ('state', 'u1', 1), ('needs', 'u1', 3)):
+        columns[name] = np.frombuffer(data, dtype=dtype, count=count * width, offset=offset)
+        offset += columns[name].nbytes
+    columns['needs'] = columns['needs'].reshape(count, 3)
+    return {'seq': seq, 'day_index': day_index, 'time': (hour, minute), **columns}
+
+def _benchmark(count=5000, rounds=50):
+    """Round-trips a random frame and compares encode/decode throughput with JSON."""
+    import json
+    import time
+
+    rng = np.random.default_rng(0)
+    index = np.arange(count)
+    x, y = rng.integers(0, 1000, count), rng.integers(0, 1000, count)
+    state = rng.integers(0, len(STATE_CODES), count)
+    needs = rng.uniform(0, 100, (count, 3))
+
+    frame = encode_arrays(7, 3, 14, 42, index, x, y, state, needs)
+    decoded = decode_frame(frame)
+    assert len(frame) == frame_size(count)
+    assert decoded['seq'] == 7 and decoded['day_index'] == 3 and decoded['time'] == (14, 42)
+    assert (decoded['index'] == index).all() and (decoded['x'] == x).all() and (decoded['y'] == y).all()
+    assert (decoded['state'] == state).all()
+    assert (np.abs(decoded['needs'] - needs) <= 0.5).all()
+    print(f"Round trip OK for {count} agents.")
+
+    xs, ys, states, needs_list = x.tolist(), y.tolist(), state.tolist(), needs.tolist()
+
+    def timed(fn):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            result = fn()
+        return (time.perf_counter() - start) / rounds * 1000, result
+
+    json_encode_ms, text = timed(lambda: json.dumps({'agents': [
+        {'id': f"agent_{i}", 'x': xs[i], 'y': ys[i], 'state': STATE_CODES[states[i]],
+         'needs': {'hunger': round(n[0]), 'social': round(n[1]), 'energy': round(n[2])}}
+        for i, n in enumerate(needs_list)
+    ]}))
+    json_decode_ms, _ = timed(lambda: json.loads(text))
+    binary_encode_ms, _ = timed(lambda: encode_arrays(7, 3, 14, 42, index, x, y, state, needs))
+    binary_decode_ms, _ = timed(lambda: decode_frame(frame))
+
+    print(f"{'format':<8}{'bytes':>10}{'encode ms':>12}{'decode ms':>12}")
+    print(f"{'json':<8}{len(text.encode()):>10}{json_encode_ms:>12.3f}{json_decode_ms:>12.3f}")
+    print(f"{'binary':<8}{len(frame):>10}{binary_encode_ms:>12.3f}{binary_decode_ms:>12.3f}")
+
+if __name__ == '__main__':
+    _benchmark()
@@ -0,0 +1,167 @@
+# simulation/interest.py
+# Viewport-based interest management for SocketIO clients.
+# The server mirrors agent positions in a uniform-grid spatial index and sends each client
+# only the agents inside (or near) the map rectangle it is looking at.
+
+import numpy as np
+from simulation.frame_codec import NEED_NAMES, STATE_CODES, decode_frame, encode_arrays
+
+VIEWPORT_MARGIN = 2   # Cells around the viewport that still count as visible
+BUCKET_SIZE = 8       # Side of a spatial index bucket, in map cells
+
+class SpatialGrid:
+    """
+    Uniform grid of buckets holding agent ids.
+    Moving an agent touches at most two buckets; a rectangle query only visits the
+    buckets it overlaps.
+    """
+    def __init__(self, bucket_size=BUCKET_SIZE):
+        self.bucket_size = bucket_size
+        self.buckets = {}    # (bx, by) -> set of agent ids
+        self.positions = {}  # Agent id -> (x, y)
+
+    def _bucket(self, x, y):
+        return (x // self.bucket_size, y // self.bucket_size)
+
+    def move(self, agent_id, x, y):
+        old = self.positions.get(agent_id)
+        if old == (x, y):
+            return
+        self.positions[agent_id] = (x, y)
+        new_bucket = self._bucket(x, y)
+        if old is not None:
+            old_bucket = self._bucket(*old)
+            if old_bucket == new_bucket:
+                return
+            self.buckets[old_bucket].discard(agent_id)
+        self.buckets.setdefault(new_bucket, set()).add(agent_id)
+
+    def clear(self):
+        self.buckets.clear()
+        self.positions.clear()
+
+    def query(self, x0, y0, x1, y1):
+        """Returns the ids of agents inside the inclusive rectangle (x0, y0)-(x1, y1)."""
+        found = set()
+        bx0, by0 = self._bucket(max(x0, 0), max(y0, 0))
+        bx1, by1 = self._bucket(max(x1, 0), max(y1, 0))
+        for bx in range(bx0, bx1 + 1):
+            for by in range(by0, by1 + 1):
+                for agent_id in self.buckets.get((bx, by), ()):
+                    x, y = self.positions[agent_id]
+                    if x0 <= x <= x1 and y0 <= y <= y1:
+                        found.add(agent_id)
+        return found
+
+class InterestManager:
+    """
+    Mirrors the agent state relayed by the command client and filters it per viewer.
+    Clients that registered a viewport receive only their visible agents, plus
+    `entered` (full records) and `left` (ids) lists when their interest set changes.
+    Clients without a viewport are not tracked here and keep receiving everything.
+    """
+    def __init__(self, margin=VIEWPORT_MARGIN, bucket_size=BUCKET_SIZE):
+        self.margin = margin
+        self.grid = SpatialGrid(bucket_size)
+        self.agents = {}     # Agent id -> latest full record
+        self.order = []      # Agent ids by keyframe index, used to read binary frames
+        self.index_of = {}   # Agent id -> keyframe index
+        self.viewports = {}  # Client sid -> inclusive (x0, y0, x1, y1) including the margin
+        self.interest = {}   # Client sid -> set of agent ids the client currently holds
+
+    # --- Viewers ---
+    def set_viewport(self, sid, x, y, width, height):
+        """Registers or moves a client's viewport; returns the resulting interest change."""
+        x, y, width, height = int(x), int(y), max(int(width), 1), max(int(height), 1)
+        self.viewports[sid] = (x - self.margin, y - self.margin,
+                               x + width - 1 + self.margin, y + height - 1 + self.margin)
+        entered, left = self._update_interest(sid)
+        return {'entered': entered, 'left': left}
+
+    def hold_all(self, sid):
+        """Records that a client holds every agent, e.g. after a full snapshot, so its first viewport lists the rest as left."""
+        self.interest[sid] = set(self.agents)
+
+    def remove_client(self, sid):
+        self.viewports.pop(sid, None)
+        self.interest.pop(sid, None)
+
+    def _update_interest(self, sid):
+        visible = self.grid.query(*self.viewports[sid])
+        old = self.interest.get(sid, set())
+        self.interest[sid] = visible
+        entered = [self.agents[agent_id] for agent_id in visible - old]
+        return entered, sorted(old - visible)
+
+    # --- Mirror ---
+    def apply_state(self, payload):
+        """Updates the mirror from a keyframe or delta state payload."""
+        if payload.get('keyframe'):
+            self.agents = {record['id']: dict(record) for record in payload['agents']}
+            self.order = [None] * len(payload['agents'])
+            self.grid.clear()
+            for i, record in enumerate(payload['agents']):
+                self.order[record.get('index', i)] = record['id']
+            self.index_of = {agent_id: i for i, agent_id in enumerate(self.order)}
+        else:
+            for delta in payload['agents']:
+                record = self.agents.get(delta['id'])
+                if record is not None:
+                    record.update(delta)
+        for delta in payload['agents']:
+            record = self.agents.get(delta['id'])
+            if record is not None and ('x' in delta or 'y' in delta):
+                self.grid.move(record['id'], record['x'], record['y'])
+
+    def apply_frame(self, data):
+        """Updates the mirror from a binary frame; returns the decoded frame or None."""
+        if not self.order:
+            return None
+        frame = decode_frame(data)
+        for i, index in enumerate(frame['index'].tolist()):
+            agent_id = self.order[index] if index < len(self.order) else None
+            record = self.agents.get(agent_id)
+            if record is None:
+                continue
+            record['x'], record['y'] = int(frame['x'][i]), int(frame['y'][i])
+            record['state'] = STATE_CODES[frame['state'][i]]
+            record['needs'] = {need: int(value) for need, value in zip(NEED_NAMES, frame['needs'][i].tolist())}
+            self.grid.move(agent_id, record['x'], record['y'])
+        return frame
+
+    # --- Per-client output ---
+    def client_payloads(self, payload):
+        """Builds the filtered state payload for every client with a viewport."""
+        shared = {key: value for key, value in payload.items() if key != 'agents'}
+        payloads = {}
+        for sid in self.viewports:
+            client_payload = dict(shared)
+            if payload.get('keyframe'):
+                visible = self.grid.query(*self.viewports[sid])
+                self.interest[sid] = visible
+                client_payload['agents'] = [record for record in payload['agents'] if record['id'] in visible]
+            else:
+                entered, left = self._update_interest(sid)
+                entered_ids = {record['id'] for record in entered}
+                visible = self.interest[sid]
+                client_payload['agents'] = [
+                    delta for delta in payload['agents']
+                    if delta['id'] in visible and delta['id'] not in entered_ids
+                ]
+                client_payload['entered'] = entered
+                client_payload['left'] = left
+            payloads[sid] = client_payload
+        return payloads
+
+    def client_frames(self, frame):
+        """Re-encodes a decoded binary frame per client, keeping only its visible agents."""
+        frames = {}
+        hour, minute = frame['time']
+        for sid in self.viewports:
+            wanted = np.fromiter((self.index_of[agent_id] for agent_id in self.interest.get(sid, ())), dtype='<u4')
+            mask = np.isin(frame['index'], wanted)
+            frames[sid] = encode_arrays(
+                frame['seq'], frame['day_index'], hour, minute,
+                frame['index'][mask], frame['x'][mask], frame['y'][mask], frame['state'][mask], frame['needs'][mask],
+            )
+        return frames
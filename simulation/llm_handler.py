@@ -1,10 +1,11 @@
 # simulation/llm_handler.py
 # Handles interaction with the OpenAI GPT-4.1 mini API for narrative and embedding generation.
 
-import requests
-from dotenv import load_dotenv
 import os
 
+# requests and dotenv are imported on first use: the simulation core imports this module,
+# and worker processes that never call the API should not pay for them.
+
 class LLMHandler:
     """
     Handles interaction with the OpenAI GPT-4.1 mini API for narrative and embedding generation.
@@ -12,6 +13,7 @@ class LLMHandler:
     """
 
     def __init__(self, api_key=None, model="gpt-4.1-mini"):
+        from dotenv import load_dotenv
         load_dotenv()
         self.api_key = api_key or os.getenv("API_KEY")
         self.model = model
@@ -30,6 +32,7 @@ class LLMHandler:
             "max_tokens": max_tokens,
             "temperature": 0.8
         }
+        import requests
         response = requests.post(self.base_url, headers=headers, json=data)
         try:
             response.raise_for_status()
@@ -48,6 +51,7 @@ class LLMHandler:
             "model": "text-embedding-ada-002",
             "input": text
         }
+        import requests
         response = requests.post(self.embedding_url, headers=headers, json=data)
         try:
             response.raise_for_status()
@@ -69,6 +73,7 @@ class LLMHandler:
             "temperature": 0.0
         }
         try:
+            import requests
             response = requests.post(self.base_url, headers=headers, json=data, timeout=10)
             response.raise_for_status()
             return True, response.json()['choices'][0]['message']['content']
@@ -0,0 +1,124 @@
+# simulation/lod.py
+# Level of detail for agents nobody is watching.
+# Unobserved agents travel by appearing at their destination after the walking time read from a
+# precomputed distance table, instead of walking cell by cell. Like busy agents (see timers.py),
+# a travelling agent is not ticked until it arrives; its needs catch up when it is ticked again.
+
+from collections import deque, namedtuple
+import numpy as np
+from .world import NO_PLACE
+
+LOD_MARGIN = 8  # Cells around an observed rectangle in which agents keep full fidelity
+UNREACHABLE = -1
+
+# A travelling agent: ticked last at `since`, arrives at cell `target` in tick `wake`
+Dormancy = namedtuple('Dormancy', ['since', 'wake', 'target'])
+
+class DistanceTable:
+    """
+    Walking distances from every cell to every place, computed once from the map.
+    One breadth-first search per place, seeded from all of the place's cells, gives the
+    distance to the nearest cell of the place and which cell that is; the walk to a particular
+    spot is that plus the straight distance from the entry cell to the spot. Other agents are
+    ignored, so a crowded route can take a little longer when walked.
+    """
+    def __init__(self, world_layout, world_index):
+        self.world_index = world_index
+        rows, cols = world_index.rows, world_index.cols
+        walkable = np.array([[cell != 'G' for cell in row] for row in world_layout], dtype=bool).reshape(rows, cols)
+        self.distances = []  # Place id -> (rows, cols) steps to the place, UNREACHABLE if none
+        self.entries = []    # Place id -> (rows, cols) index of the nearest place cell
+        for name in world_index.place_names:
+            distances, entries = self._search(walkable, world_index.place_cells[name])
+            self.distances.append(distances.tolist())
+            self.entries.append(entries.tolist())
+
+    @staticmethod
+    def _search(walkable, cells):
+        rows, cols = walkable.shape
+        distances = np.full((rows, cols), UNREACHABLE, dtype=np.int32)
+        entries = np.zeros((rows, cols), dtype=np.int32)
+        queue = deque()
+        for i, (x, y) in enumerate(cells):
+            if 0 <= y < rows and 0 <= x < cols and walkable[y, x] and distances[y, x] == UNREACHABLE:
+                distances[y, x] = 0
+                entries[y, x] = i
+                queue.append((x, y))
+        while queue:
+            x, y = queue.popleft()
+            step = distances[y, x] + 1
+            for nx, ny in ((x, y + 1), (x, y - 1), (x + 1, y), (x - 1, y)):
+                if 0 <= ny < rows and 0 <= nx < cols and walkable[ny, nx] and distances[ny, nx] == UNREACHABLE:
+                    distances[ny, nx] = step
+                    entries[ny, nx] = entries[y, x]
+                    queue.append((nx, ny))
+        return distances, entries
+
+    def travel_ticks(self, start, target):
+        """Ticks needed to walk from `start` to `target`, or None if the target cannot be reached."""
+        (sx, sy), (tx, ty) = start, target
+        place_id = self.world_index.place_id_at(tx, ty)
+        if place_id == NO_PLACE:
+            # Outside any place, e.g. a spot next to another agent: assume a straight walk
+            return abs(tx - sx) + abs(ty - sy)
+        if not (0 <= sy < self.world_index.rows and 0 <= sx < self.world_index.cols):
+            return None
+        steps = self.distances[place_id][sy][sx]
+        if steps == UNREACHABLE:
+            return None
+        ex, ey = self.world_index.place_cells[self.world_index.place_names[place_id]][self.entries[place_id][sy][sx]]
+        return steps + abs(tx - ex) + abs(ty - ey)
+
+class LevelOfDetail:
+    """
+    Decides each tick which agents are simulated coarsely and keeps track of travelling ones.
+    `observed` is None when everything is watched (no coarse agents), or a list of inclusive
+    (x0, y0, x1, y1) map rectangles; an empty list means nobody is watching (headless), so
+    every agent is coarse. Agents inside a rectangle, or walking to a cell inside one, widened
+    by `margin`, are simulated tick by tick.
+    """
+    def __init__(self, world_layout, world_index, margin=LOD_MARGIN):
+        self.distances = DistanceTable(world_layout, world_index)
+        self.margin = margin
+        self.observed = []
+        self.coarse = set()  # Ids of the agents simulated coarsely this tick
+        self.dormant = {}    # Agent id -> Dormancy
+        self.tick = 0        # The manager's clock at the start of the current tick
+
+    def set_observed(self, rects):
+        self.observed = None if rects is None else [tuple(rect) for rect in rects]
+
+    def is_observed(self, x, y):
+        if self.observed is None:
+            return True
+        margin = self.margin
+        return any(
+            x0 - margin <= x <= x1 + margin and y0 - margin <= y <= y1 + margin
+            for x0, y0, x1, y1 in self.observed
+        )
+
+    def begin_tick(self, agents, now):
+        """
+        Starts tick `now`: sorts `agents` (id -> Agent) into full and coarse fidelity and returns
+        the (agent, dormancy) pairs that wake now, because they arrive, are observed again, or
+        were stopped on the way (e.g. by someone arriving to talk to them).
+        """
+        self.tick = now
+        if self.observed is None:
+            self.coarse = set()
+        else:
+            self.coarse = {
+                agent.id for agent in agents.values()
+                if not self.is_observed(agent.x, agent.y)
+                and not (agent.id in self.dormant and self.is_observed(*self.dormant[agent.id].target))
+            }
+        waking = []
+        for agent_id, dormancy in list(self.dormant.items()):
+            agent = agents[agent_id]
+            if dormancy.wake <= self.tick or agent_id not in self.coarse or agent.state != 'moving':
+                waking.append((agent, self.dormant.pop(agent_id)))
+        return waking
+
+    def sleep(self, agent_id, wake, target):
+        """Skips an agent travelling to `target` until tick `wake`; it was ticked last in the current tick."""
+        self.dormant[agent_id] = Dormancy(self.tick, wake, target)
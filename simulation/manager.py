@@ -1,19 +1,59 @@
 # simulation/manager.py
 # Manages agent initialization, simulation ticks, schedules, pathfinding, and daily story generation.
 
-import random
+from collections import Counter, deque, namedtuple
+from itertools import repeat
+import numpy as np
 from .entities import Agent
-from .config import AGENT_CONFIG, ACTIVITY_DATA, SCHEDULE_TEMPLATES
+from .config import AGENT_CONFIG, SCHEDULE_TEMPLATES, SLEEP_SCHEDULES
+from .activities import ACTIVITIES, WORK
+from .world import WorldIndex
+from .occupancy import OccupancyTracker
+from .lod import LevelOfDetail
+from .timers import TickClock, TimerWheel
+from .rng import RandomStream, derive_seed, new_seed
+from .schedule import HOURS_PER_DAY, SLEEP_ACTIVITY, CompiledSchedules
+from .state_encoder import StateDeltaEncoder
+from .agent_log import AgentLogFeed, get_agent_history, PAGE_SIZE
 from behavior.agent_behaviors import create_agent_bt
 from simulation.narrative.narrative_system import NarrativeSystem
 from simulation.llm_handler import LLMHandler
-from app import emit_daily_story
+
+# Intents returned by the decide phase of a tick, applied in the resolve phase
+END_CONVERSATION = 'end_conversation'  # (END_CONVERSATION, partner_id)
+CONVERSE = 'converse'                  # (CONVERSE, partner_id, duration): start a conversation on the spot
+PLAN = 'plan'                          # (PLAN, target_pos, path): claim a destination and follow a path
+BUSY_STATES = ('doing_action', 'interacting')  # States that last until the agent's timer fires
+DECIDE_CHUNK_SIZE = 32  # Agents per executor task
+
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+MINUTES_PER_TICK = 2
+
+# Frozen view of another agent as seen by behavior trees during the decide phase
+AgentView = namedtuple('AgentView', ['id', 'name', 'x', 'y', 'state', 'current_activity'])
+
+def agent_view(agent):
+    """The view other agents decide against; an agent whose conversation ends this tick already looks idle."""
+    state = 'idle' if agent.state == 'interacting' and agent.action_duration <= 0 else agent.state
+    return AgentView(agent.id, agent.name, agent.x, agent.y, state, agent.current_activity)
+
+def next_clock(world_time, day_index):
+    """World time and day index one tick after the given ones."""
+    hour, minute = world_time
+    minute += MINUTES_PER_TICK # BUG FIX: Slow down time progression
+    if minute >= 60:
+        minute %= 60
+        hour += 1
+        if hour >= 24:
+            hour %= 24
+            day_index += 1  # INCREMENT day_index instead of cycling
+    return (hour, int(minute)), day_index
 
 def find_path_bfs(start_x, start_y, target_x, target_y, world_layout, occupied_positions):
     """Finds the shortest path from start to target using Breadth-First Search (BFS)."""
     rows, cols = len(world_layout), len(world_layout[0])
-    queue = [((start_x, start_y), [(start_x, start_y)])]
-    visited = {(start_x, start_y)}
+    queue = deque([(start_x, start_y)])
+    parents = {(start_x, start_y): None}  # Visited cell -> the cell it was reached from
     directions = [(0, 1), (0, -1), (1, 0), (-1, 0)]
     
     def is_traversable(x, y):
@@ -26,16 +66,20 @@ def find_path_bfs(start_x, start_y, target_x, target_y, world_layout, occupied_p
         return True
 
     while queue:
-        (current_x, current_y), path = queue.pop(0)
-        if current_x == target_x and current_y == target_y:
+        current = queue.popleft()
+        if current == (target_x, target_y):
+            path = []
+            while current is not None:
+                path.append(current)
+                current = parents[current]
+            path.reverse()
             return path
+        current_x, current_y = current
         for dx, dy in directions:
             next_x, next_y = current_x + dx, current_y + dy
-            if (next_x, next_y) not in visited and is_traversable(next_x, next_y):
-                visited.add((next_x, next_y))
-                new_path = list(path)
-                new_path.append((next_x, next_y))
-                queue.append(((next_x, next_y), new_path))
+            if (next_x, next_y) not in parents and is_traversable(next_x, next_y):
+                parents[(next_x, next_y)] = current
+                queue.append((next_x, next_y))
     return None
 
 class AgentManager:
@@ -43,326 +87,649 @@ class AgentManager:
     Manages all agents, their schedules, state updates, and simulation ticks.
     Handles daily story generation and agent interactions.
     """
-    def __init__(self, world_layout, places_data):
+    def __init__(self, world_layout, places_data, bt_profiler=None, on_daily_story=None, executor=None,
+                 agent_config=None, lod=False, seed=None):
         self.agents = {}
+        self.agent_config = AGENT_CONFIG if agent_config is None else agent_config  # Agent definitions, see simulation/config.py
         self.world_layout = world_layout
-        self.days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+        self.world_index = WorldIndex(world_layout, places_data)
+        self.occupancy = OccupancyTracker(self.world_index)
+        self.schedules = CompiledSchedules(SCHEDULE_TEMPLATES, SLEEP_SCHEDULES, ACTIVITIES)
+        self.days = DAYS
         self.world_state = { 
             'time': (8, 0),  # Start at 8 AM
             'day_index': 0,
             'day_of_week': self.days[0],
             'places': places_data,
-            'activity_data': ACTIVITY_DATA 
+            'world_index': self.world_index,
+            'activities': ACTIVITIES
         }
         self.llm_handler = LLMHandler()
         self.narrative_system = NarrativeSystem(self.llm_handler)
         self.daily_stories = []
+        self.bt_profiler = bt_profiler
+        self.on_daily_story = on_daily_story  # Called with each compiled story, e.g. to publish it
+        self.state_encoder = StateDeltaEncoder()
+        self.log_feed = AgentLogFeed()
+        # Optional concurrent.futures executor (e.g. a ThreadPoolExecutor) for the decide phase
+        self.executor = executor
+        # Busy agents are left alone until their action or conversation ends (see simulation/timers.py)
+        self.clock = TickClock()
+        self.timers = TimerWheel()
+        # With lod=True, agents outside the observed area are simulated coarsely (see simulation/lod.py)
+        self.lod = LevelOfDetail(world_layout, self.world_index) if lod else None
+        # Every random draw comes from the world stream (tick order) or an agent's own stream (see simulation/rng.py)
+        self.seed = new_seed() if seed is None else seed
+        self.rng = RandomStream(derive_seed(self.seed, 'world'))
+        # Notable events since the manager was built: conversations, replans, no_path, no_space
+        self.counters = Counter()
         self._initialize_agents()
 
+    def get_agent_history(self, agent_id, kind='log', since=None, before=None, limit=PAGE_SIZE):
+        """Returns one page of an agent's log or memories, or None for an unknown agent."""
+        agent = self.agents.get(agent_id)
+        if agent is None:
+            return None
+        return get_agent_history(agent, kind, since=since, before=before, limit=limit)
+
     def _initialize_agents(self):
         """Initializes agents from configuration and sets up their behavior trees."""
-        for config in AGENT_CONFIG:
+        self._agent_schedules = {}  # Agent id -> compiled (7, 24) schedule table
+        for config in self.agent_config:
             agent = Agent(
                 agent_id=config['id'], name=config['name'], icon=config['icon'], color=config['color'],
                 home_pos=config['home_pos'],
                 personality=config['personality'],
                 schedule_template=SCHEDULE_TEMPLATES[config['schedule_template']],
-                work_location=config.get('work_location')
+                work_location=config.get('work_location'), clock=self.clock,
+                rng=RandomStream(derive_seed(self.seed, 'agent', config['id'])),
+                relationships=config.get('relationships'),
             )
             self.agents[agent.id] = agent
-        
+            self.world_index.register_home(agent.id, config['home_pos'])
+            self.occupancy.place_agent(agent.id, (agent.x, agent.y))
+            self._agent_schedules[agent.id] = self.schedules.table_for(config['schedule_template'], config['personality'])
+        self._index_schedules()
+
         self.world_state['agents'] = self.agents
         for agent in self.agents.values():
             agent.behavior_tree = create_agent_bt(agent, self.world_state)
+            if self.bt_profiler:
+                self.bt_profiler.attach(agent.behavior_tree)
         print(f"Initialized {len(self.agents)} agents.")
 
+    def set_schedules(self, schedule_templates, sleep_schedules):
+        """Recompiles every agent's schedule from other templates and sleep rules; it applies from the next tick."""
+        self.schedules = CompiledSchedules(schedule_templates, sleep_schedules, ACTIVITIES)
+        for config in self.agent_config:
+            agent = self.agents[config['id']]
+            agent.schedule_template = schedule_templates[config['schedule_template']]
+            self._agent_schedules[agent.id] = self.schedules.table_for(config['schedule_template'], config['personality'])
+        self._index_schedules()
+
+    def _index_schedules(self):
+        """Stacks every agent's compiled schedule so one gather resolves all agents per tick."""
+        self._schedule_agents = list(self.agents.values())
+        if self._schedule_agents:
+            self._schedule_tables = np.stack([self._agent_schedules[agent.id] for agent in self._schedule_agents])
+        else:
+            self._schedule_tables = np.empty((0, 7, 24), dtype=np.int16)
+
+    def close(self):
+        """Releases what the simulation holds outside this object; nothing for a single process."""
+
     def _update_agent_schedules(self):
         """Updates each agent's activity based on the current time and schedule."""
         hour, minute = self.world_state['time']
-        day_of_week = self.world_state['day_of_week']
-        schedule_type = 'weekdays' if day_of_week not in ['Saturday', 'Sunday'] else 'weekends'
+        scheduled = self._schedule_tables[:, self.world_state['day_index'] % 7, hour].tolist()
+        activity_name = self.schedules.activity_name
+        if minute == 0:
+            self._settle_hour()
 
-        for agent in self.agents.values():
+        for agent, activity_id in zip(self._schedule_agents, scheduled):
             # If agent's activity is over (e.g., socializing after 22:00), force idle and allow schedule update
             if agent.current_activity == "socialize_at_park":
                 hour, _ = self.world_state['time']
                 if hour >= 22:
+                    if agent.state == 'doing_action':
+                        self._settle_needs(agent, self.clock.now - 1)
+                        self._settle_wages(agent, self.clock.now - 1)
                     agent.state = 'idle'
                     agent.current_activity = None
             if agent.state in ['interacting', 'moving']:
                 continue
 
-            current_schedule = agent.schedule_template.get(schedule_type, {})
-            activity_found = False
-            
-            # Sleep schedule - different agents have different sleep patterns
-            if self._is_sleep_time(agent, hour):
-                agent.current_activity = "sleep_at_home"
-                activity_found = True
-            else:
-                # Check scheduled activities
-                for (start_hour, end_hour), activity in current_schedule.items():
-                    if start_hour <= hour < end_hour:
-                        agent.current_activity = activity
-                        activity_found = True
-                        break
-            
-            if not activity_found:
-                agent.current_activity = None
-
-    def _is_sleep_time(self, agent, hour):
-        """Determines if it's sleep time for the agent based on personality."""
-        if 'lazy' in agent.personality_names:
-            # Lazy agents sleep more (10 PM to 10 AM)
-            return hour >= 22 or hour < 10
-        elif 'workaholic' in agent.personality_names:
-            # Workaholics sleep less (1 AM to 6 AM)
-            return hour >= 1 and hour < 6
-        elif 'fitness_enthusiast' in agent.personality_names:
-            # Fitness enthusiasts have early bedtime (10 PM to 6 AM)
-            return hour >= 22 or hour < 6
-        else:
-            # Normal sleep schedule (11 PM to 8 AM)
-            return hour >= 23 or hour < 8
+            # Sleep windows and wrap-around entries are already folded into the compiled table
+            agent.current_activity = activity_name(activity_id)
 
-    def _find_adjacent_spot(self, target_x, target_y, occupied_positions):
+    def _settle_hour(self):
+        """Settles the needs and wages of the hour that just ended at its activities' rates; runs as the hour turns."""
+        for agent in self._schedule_agents:
+            if agent.state in BUSY_STATES:
+                self._settle_needs(agent, self.clock.now - 1)
+            if agent.state == 'doing_action':
+                self._settle_wages(agent, self.clock.now - 1)
+
+    def _next_schedule_change(self, agent):
+        """The tick in which the agent's scheduled activity next changes, at the latest a week from now."""
+        hour, minute = self.world_state['time']
+        week = self._agent_schedules[agent.id].ravel()  # Hours of the week from Monday 00:00
+        ahead = np.roll(week, -((self.world_state['day_index'] % 7) * HOURS_PER_DAY + hour))  # From this hour on
+        changes = np.flatnonzero(ahead != ahead[0])
+        hours = int(changes[0]) if len(changes) else len(week)
+        return self.clock.now + (hours * 60 - minute) // MINUTES_PER_TICK
+
+    def _find_adjacent_spot(self, target_x, target_y, occupied_positions, rng):
         """Finds an available adjacent spot near a target position."""
         directions = [(0, 1), (0, -1), (1, 0), (-1, 0), (1, 1), (1, -1), (-1, 1), (-1, -1)]
-        random.shuffle(directions)
+        rng.shuffle(directions)
         for dx, dy in directions:
             adj_x, adj_y = target_x + dx, target_y + dy
             if (adj_x, adj_y) not in occupied_positions:
                 return (adj_x, adj_y)
         return None
 
-    def _get_agent_home_target(self, agent, occupied_positions):
+    def _get_agent_home_target(self, agent):
         """Gets a target position in the agent's home area."""
-        home_x, home_y = agent.home['x'], agent.home['y']
-        
-        # Map agent home positions to the correct place
-        if home_x <= 5 and home_y <= 5:  # North houses
-            home_coords = self.world_state['places']['north_houses']['coords']
-        elif home_x <= 5 and 13 <= home_y <= 17:  # Central houses  
-            home_coords = self.world_state['places']['central_houses']['coords']
-        elif home_x <= 5 and home_y >= 18:  # South houses
-            home_coords = self.world_state['places']['south_houses']['coords']
-        elif home_x >= 18 and home_y <= 5:  # Student accommodation
-            home_coords = self.world_state['places']['student_accommodation']['coords']
+        home_place = self.world_index.agent_home_place.get(agent.id)
+        target_pos = self.occupancy.sample_free(home_place, agent.rng) if home_place else None
+        # If all spots occupied, return the original home position
+        return target_pos or (agent.home['x'], agent.home['y'])
+
+    def _get_free_spot(self, agent, location_name):
+        """Picks an unclaimed spot for a destination, or None if it is full."""
+        if "home" in location_name:
+            return self._get_agent_home_target(agent)
+        return self.occupancy.sample_free(location_name, agent.rng)
+
+    def _set_agent_path(self, agent, path):
+        """Assigns a path and moves the agent's destination claim to its last cell."""
+        agent.path = path
+        self.occupancy.set_target(agent.id, path[-1] if path else None)
+
+    def _move_agent(self, agent, pos):
+        """Moves an agent to a cell and updates the occupancy counters."""
+        agent.x, agent.y = pos
+        self.occupancy.place_agent(agent.id, pos)
+
+    def _start_conversation(self, agent, partner, duration):
+        """Pairs an agent that proposed a conversation on the spot with its partner."""
+        world_time, day_of_week = self.world_state['time'], self.world_state['day_of_week']
+        agent.state = 'interacting'
+        agent.interacting_with = partner.id
+        agent.action_duration = duration
+        agent.current_goal = f"Chatting with {partner.name}."
+        agent.add_log(f"I've started a conversation with {partner.name} at the park.", world_time, day_of_week)
+        agent.needs['social'] = 0 # Reset social need
+
+        partner.state = 'interacting'
+        partner.interacting_with = agent.id
+        partner.action_duration = duration
+        partner.current_goal = f"Chatting with {agent.name}."
+        partner.add_log(f"{agent.name} came over to talk. We're having a nice chat.", world_time, day_of_week)
+        partner.needs['social'] = 0 # Reset social need
+        self.counters['conversations'] += 1
+        self._start_timer(agent)
+        self._start_timer(partner)
+
+    def _decide_again(self, agent):
+        """Re-runs a decision that lost its claim in the resolve phase, this time against the current state."""
+        agent.behavior_tree.reset()
+        agent.behavior_tree.tick(agent, self.world_state)
+        if agent.state == 'interacting':
+            self._start_conversation(agent, self.agents[agent.interacting_with], agent.action_duration)
+        elif agent.state == 'moving':
+            self._apply_route(agent, *self._plan_route(agent, self.agents))
+
+    def _is_coarse(self, agent):
+        return self.lod is not None and agent.id in self.lod.coarse
+
+    def _plan_route(self, agent, agents):
+        """
+        Picks an unclaimed destination cell and a path to it; returns (target_pos, path). Changes nothing.
+        Coarse agents get no path: they travel by the distance table (see _apply_route).
+        """
+        location_name = agent.destination_name
+        target_pos = None
+        if location_name and location_name.startswith("agent_"):
+            target_agent_id = location_name.split("_")[1]
+            target_agent = agents.get(target_agent_id)
+            if target_agent:
+                # Find an adjacent spot that isn't currently claimed
+                target_pos = self._find_adjacent_spot(target_agent.x, target_agent.y, self.occupancy.claims, agent.rng)
+        elif location_name:
+            # Find a spot in the location (or home area) that isn't currently claimed
+            target_pos = self._get_free_spot(agent, location_name)
+        if not target_pos or self._is_coarse(agent):
+            return target_pos, None
+        # For pathfinding traversal, we only care about the current positions of other agents.
+        # The agent's own cell is the BFS start, so it never needs to be excluded.
+        return target_pos, find_path_bfs(agent.x, agent.y, target_pos[0], target_pos[1], self.world_layout, self.occupancy.positions)
+
+    def _apply_route(self, agent, target_pos, path):
+        """Claims a route planned in the decide phase, planning again if its destination was taken meanwhile."""
+        self._set_agent_path(agent, None)
+        if target_pos and self.occupancy.is_claimed(target_pos):
+            # Claimed by an agent resolved earlier in this tick
+            target_pos, path = self._plan_route(agent, self.agents)
+        location_name = agent.destination_name
+        if target_pos:
+            if self._is_coarse(agent):
+                path = self._travel(agent, target_pos)
+            else:
+                # Claiming the path's last cell keeps other agents from taking the spot.
+                self._set_agent_path(agent, path)
+                agent.path_index = 0
+            if not path:
+                agent.add_log(f"I can't find a path to {location_name}.", self.world_state['time'], self.world_state['day_of_week'])
+                self.counters['no_path'] += 1
+                agent.state = 'idle'
+                agent.behavior_tree.reset()
+        else:
+            agent.state = 'idle'
+            if location_name:
+                agent.add_log(f"I can't go to {location_name}, there's no space.", self.world_state['time'], self.world_state['day_of_week'])
+                self.counters['no_space'] += 1
+
+    def _travel(self, agent, target_pos):
+        """
+        Sends a coarse agent to a destination without a path: it claims the spot now and sleeps
+        for the walking time, then arrives in one step. Returns the claimed path, or None if
+        the destination cannot be reached.
+        """
+        ticks = self.lod.distances.travel_ticks((agent.x, agent.y), target_pos)
+        if ticks is None:
+            return None
+        path = [target_pos]
+        self._set_agent_path(agent, path)
+        agent.path_index = 0
+        if ticks > 0:
+            self._leave_for(agent, target_pos, self.clock.now + ticks)
+        return path
+
+    def _leave_for(self, agent, target_pos, wake):
+        """Puts a coarse agent in transit: off the map (its cell frees up) with its destination still claimed."""
+        agent.path = []
+        self.occupancy.lift_agent(agent.id)
+        self.lod.sleep(agent.id, wake, target_pos)
+
+    def _wake(self, agent, dormancy):
+        """Ends a coarse agent's trip so it can be ticked normally again; its needs catch up when it is."""
+        skipped = self.clock.now - dormancy.since - 1
+        # Back on the map where it set out from; it leaves again with its next step
+        self._move_agent(agent, (agent.x, agent.y))
+        if agent.state != 'moving':
+            self._set_agent_path(agent, [])  # Stopped on the way, e.g. to talk
+        elif dormancy.wake <= self.clock.now:
+            agent.path, agent.path_index = [dormancy.target], 0  # Arrives this tick
         else:
-            # Fallback to exact position
-            home_coords = [(home_x, home_y)]
+            # Observed on the way: put the agent where it would be had it walked
+            path = find_path_bfs(agent.x, agent.y, dormancy.target[0], dormancy.target[1], self.world_layout, self.occupancy.positions)
+            self._set_agent_path(agent, path)
+            if path:
+                index = max(0, min(skipped, len(path) - 2))
+                if index and not self.occupancy.is_occupied(path[index]):
+                    self._move_agent(agent, path[index])
+                else:
+                    index = 0
+                agent.path_index = index + 1 if len(path) > 1 else 0
+            # Without a path the agent is still moving, so it plans again this tick
+
+    def _lod_agents(self):
+        """Ends the trips that arrive or come into view; returns every agent not travelling coarsely."""
+        for agent, dormancy in self.lod.begin_tick(self.agents, self.clock.now):
+            self._wake(agent, dormancy)
+        return [agent for agent in self.agents.values() if agent.id not in self.lod.dormant]
+
+    def _lod_travel(self, agents):
+        """Sends the coarse agents among `agents` that are walking the rest of the way at once, arriving when the walk would have."""
+        for agent in agents:
+            if agent.id not in self.lod.coarse or agent.id in self.lod.dormant:
+                continue
+            if agent.state == 'moving' and agent.path and agent.path_index < len(agent.path):
+                self._leave_for(agent, agent.path[-1], self.clock.now + len(agent.path) - agent.path_index)
+
+    def _step_along_path(self, agent):
+        """Moves a walking agent one cell, replanning around blocked cells and handling arrival."""
+        occupancy = self.occupancy
+        if not (agent.path and agent.path_index < len(agent.path)):
+            return
+        next_pos = agent.path[agent.path_index]
         
-        # Find an available spot in the home area
-        available_spots = [pos for pos in home_coords if pos not in occupied_positions]
-        if available_spots:
-            return random.choice(available_spots)
+        if occupancy.is_occupied(next_pos, exclude_agent_id=agent.id):
+            agent.add_log(f"My path to {agent.destination_name} is blocked, finding a new spot.", self.world_state['time'], self.world_state['day_of_week'])
+            self.counters['replans'] += 1
+            
+            # --- REPLANNING LOGIC ---
+            location_name = agent.destination_name
+            target_pos = None
+            
+            # Find a new spot in the same destination location
+            if location_name:
+                target_pos = self._get_free_spot(agent, location_name)
+
+            if target_pos and self._is_coarse(agent):
+                # Travels to the new spot by the distance table too
+                self._travel(agent, target_pos)
+                return
+            if target_pos:
+                path = find_path_bfs(agent.x, agent.y, target_pos[0], target_pos[1], self.world_layout, occupancy.positions)
+                
+                if path:
+                    self._set_agent_path(agent, path)
+                    agent.path_index = 0
+                    # Move immediately to the first step of the new path if possible
+                    if agent.path and agent.path_index < len(agent.path):
+                        new_next_pos = agent.path[agent.path_index]
+                        if not occupancy.is_occupied(new_next_pos, exclude_agent_id=agent.id):
+                            self._move_agent(agent, new_next_pos)
+                            agent.path_index += 1
+                # If no path to new spot, keep the old claim and wait
+            # --- END REPLANNING ---
         else:
-            # If all spots occupied, return the original home position
-            return (home_x, home_y)
+            self._move_agent(agent, next_pos)
+            agent.path_index += 1
 
-    def tick(self):
-        """Advances the simulation by one tick, updating agent states and generating stories."""
-        hour, minute = self.world_state['time']
-        day_index = self.world_state['day_index']
+        if agent.path_index >= len(agent.path):
+            self._set_agent_path(agent, [])
+            
+            if agent.interacting_with:
+                other_agent = self.agents.get(agent.interacting_with)
+                if other_agent and (other_agent.state == 'idle' or other_agent.interacting_with == agent.id):
+                    if other_agent.state == 'doing_action':
+                        self._settle_wages(other_agent)
+                    agent.state = 'interacting'
+                    other_agent.state = 'interacting'
+                    other_agent.interacting_with = agent.id
+                    agent.current_goal = f"Chatting with {other_agent.name}"
+                    other_agent.current_goal = f"{agent.name} is coming over to talk to me."
+                    interaction_duration = agent.rng.randint(15, 25)
+                    agent.action_duration = interaction_duration
+                    other_agent.action_duration = interaction_duration
+                    self.counters['conversations'] += 1
+                    self._start_timer(agent)
+                    self._start_timer(other_agent)
+                else:
+                    agent.state = 'idle'
+                    agent.add_log("They seemed busy, so I decided not to interrupt.", self.world_state['time'], self.world_state['day_of_week'])
+                    agent.interacting_with = None
+            else:
+                agent.state = 'idle'
+            agent.behavior_tree.reset() # Reset BT upon arrival
+
+    def _start_timer(self, agent):
+        """Schedules the end of the action or conversation an agent just started."""
+        if self.timers.due.get(agent.id) != agent.action_ends:
+            if agent.state == 'doing_action' and agent.current_activity == SLEEP_ACTIVITY:
+                # Sleep lasts until the schedule says otherwise instead of waking every few ticks to sleep on
+                agent.action_ends = self._next_schedule_change(agent)
+            agent.wages_from = self.clock.now
+            self.timers.schedule(agent.id, agent.action_ends)
+
+    def _settle_needs(self, agent, upto=None):
+        """Brings an agent's needs up to date for every tick up to `upto` (default: now) at its current activity."""
+        upto = self.clock.now if upto is None else upto
+        if upto > agent.needs_from:
+            agent.integrate_needs(upto - agent.needs_from)
+            agent.needs_from = upto
+
+    def current_needs(self, agent):
+        """An agent's needs as they stand now, without settling them (which would change how they are summed up)."""
+        needs = agent.needs
+        agent.needs = dict(needs)
+        agent.integrate_needs(self.clock.now - agent.needs_from)
+        current, agent.needs = agent.needs, needs
+        return current
+
+    def _settle_wages(self, agent, upto=None):
+        """Pays an agent doing an action the wages it earned since the last payment, up to tick `upto` (default: now)."""
+        upto = self.clock.now if upto is None else upto
+        if upto > agent.wages_from:
+            self._pay_wages(agent, upto - agent.wages_from)
+            agent.wages_from = upto
+
+    def _pay_wages(self, agent, ticks):
+        """Pays `ticks` ticks of wages to an agent doing its current activity."""
+        # BUG FIX: Only earn money if at the correct work location and doing work activities
+        activity = agent.activity
+        if activity is not None and activity.flags & WORK:
+            # Accept if agent is at any valid spot for the required work location
+            if self.world_index.is_in_place((agent.x, agent.y), activity.location or agent.work_location):
+                agent.money += activity.wage * ticks
+
+    def _decide(self, agent, view_state, order, awaited):
+        """
+        Decide phase for one agent: needs, ending actions, behavior tree evaluation and path
+        planning. Busy agents only get here in the tick their timer fires. Only the agent itself
+        is changed; other agents are read through frozen views in `view_state['agents']` and the
+        occupancy tracker is only read, so agents can decide concurrently. Effects on shared
+        state are returned as an intent (or None).
+
+        `order` maps agent ids to their place in this tick's order. It reproduces what a
+        one-agent-at-a-time tick would do when two agents meet: an agent whose partner comes
+        first and ends their conversation decides again right away, and idle agents in
+        `awaited` wait for someone ahead of them who is arriving to talk to them.
+        """
+        self._settle_needs(agent)
+
+        if (agent.state == 'interacting' and agent.action_duration <= 0
+                and order.get(agent.interacting_with, len(order)) < order[agent.id]):
+            # The partner ends the conversation for both of us before our turn
+            agent.state = 'idle'
+            agent.interacting_with = None
+            agent.behavior_tree.reset()
         
-        minute += 2 # BUG FIX: Slow down time progression
-        day_rolled_over = False
-        if minute >= 60:
-            minute %= 60
-            hour += 1
-            if hour >= 24:
-                hour %= 24
-                day_index += 1  # INCREMENT day_index instead of cycling
-                agent_list = list(self.agents.values())
-                random.shuffle(agent_list)
-                for agent in agent_list: # Reset BTs at the start of a new day
-                    agent.behavior_tree.reset()
-                print(f"A new day has dawned! It is now {self.days[day_index % 7]} (Day {day_index + 1}).")
-                day_rolled_over = True
-                self._pending_narrative_day = self.days[day_index % 7]
-                self._pending_narrative = True
-
-        self.world_state['time'] = (hour, int(minute))
+        if agent.state in BUSY_STATES:
+            if agent.state == 'doing_action':
+                self._settle_wages(agent)  # Wages accrue lazily, paid when the action ends
+            
+            intent = None
+            if agent.action_duration <= 0:
+                if agent.state == 'interacting' and agent.interacting_with:
+                    intent = (END_CONVERSATION, agent.interacting_with)
+                    agent.add_log(f"Finished my conversation.", view_state['time'], view_state['day_of_week'])
+                agent.state = 'idle'
+                agent.interacting_with = None
+                agent.behavior_tree.reset()
+            return intent
+
+        if agent.state == 'idle':
+            if agent.id in awaited:
+                return None
+            agent.behavior_tree.tick(agent, view_state)
+            if agent.state == 'interacting':
+                # A proposal until resolved: the agent stays available to others in the meantime
+                intent = (CONVERSE, agent.interacting_with, agent.action_duration)
+                agent.state = 'idle'
+                agent.interacting_with = None
+                agent.action_duration = 0
+                return intent
+
+        if agent.state == 'moving' and (not agent.path or agent.path_index >= len(agent.path)):
+            target_pos, path = self._plan_route(agent, view_state['agents'])
+            return (PLAN, target_pos, path)
+        return None
+
+    def _decide_chunk(self, agents, view_state, order, awaited):
+        return [self._decide(agent, view_state, order, awaited) for agent in agents]
+
+    def _agent_views(self):
+        """Frozen views of every agent visible to this tick's decisions, by id."""
+        return {other.id: agent_view(other) for other in self.agents.values()}
+
+    def _decide_all(self, agents):
+        """Runs the decide phase for `agents` (in tick order), spread over the executor if there is one."""
+        view_state = {**self.world_state, 'agents': self._agent_views()}
+        order = {agent.id: i for i, agent in enumerate(agents)}
+        awaited = {
+            agent.interacting_with for agent in agents
+            if agent.state == 'moving' and agent.interacting_with and agent.path
+            and agent.path_index == len(agent.path) - 1
+            and order.get(agent.interacting_with, -1) > order[agent.id]
+        }
+        if self.executor is None or len(agents) <= DECIDE_CHUNK_SIZE:
+            return self._decide_chunk(agents, view_state, order, awaited)
+        chunks = [agents[i:i + DECIDE_CHUNK_SIZE] for i in range(0, len(agents), DECIDE_CHUNK_SIZE)]
+        results = self.executor.map(self._decide_chunk, chunks, repeat(view_state), repeat(order), repeat(awaited))
+        return [intent for chunk in results for intent in chunk]
+
+    def _set_clock(self, world_time, day_index):
+        """Sets the world clock; returns True when a new day began, after resetting the agents' behavior trees."""
+        day_rolled_over = day_index != self.world_state['day_index']
+        if day_rolled_over:
+            agent_list = list(self.agents.values())
+            self.rng.shuffle(agent_list)
+            for agent in agent_list: # Reset BTs at the start of a new day
+                agent.behavior_tree.reset()
+            self._pending_narrative_day = self.days[day_index % 7]
+            self._pending_narrative = True
+        self.world_state['time'] = world_time
         self.world_state['day_index'] = day_index
         self.world_state['day_of_week'] = self.days[day_index % 7]
+        return day_rolled_over
 
+    def _tick_agents(self):
+        """Runs the decide and resolve phases for every agent that is not busy, or whose action ends now."""
+        self.clock.now += 1
         self._update_agent_schedules()
         
-        agents_to_process = list(self.agents.values())
-        random.shuffle(agents_to_process)
+        due = self.timers.advance(self.clock.now)
+        awake = self.agents.values() if self.lod is None else self._lod_agents()
+        # Busy agents are left alone until their timer fires; their needs catch up then
+        agents_to_process = [agent for agent in awake if agent.state not in BUSY_STATES]
+        agents_to_process.extend(
+            agent for agent in map(self.agents.get, due) if agent is not None and agent.state in BUSY_STATES
+        )
+        self.rng.shuffle(agents_to_process)
 
-        # Keep track of all spots that are occupied or are the destination of an agent.
-        # This prevents agents from selecting the same destination cell in the same tick.
-        claimed_spots = set((a.x, a.y) for a in self.agents.values())
-        claimed_spots.update(a.path[-1] for a in self.agents.values() if a.path and len(a.path) > 0)
+        # Phase 1: every agent decides from the state at the start of the tick (see _decide)
+        intents = self._decide_all(agents_to_process)
 
-        for agent in agents_to_process:
-            agent.update_needs(self.world_state['time'])
-            
-            if agent.state in ['doing_action', 'interacting']:
-                agent.action_duration -= 1
-                
-                # BUG FIX: Only earn money if at the correct work location and doing work activities
-                is_working = ("work" in (agent.current_activity or "") or 
-                             "shift" in (agent.current_activity or "") or
-                             "classes" in (agent.current_activity or ""))
-                
-                # --- FIX: Accept any valid work activity at the agent's work location ---
-                if agent.state == 'doing_action' and is_working:
-                    # Get required location for current activity
-                    activity_data = self.world_state['activity_data'].get(agent.current_activity, {})
-                    required_location = activity_data.get('location', None)
-                    work_location_data = self.world_state['places'].get(required_location or agent.work_location, {})
-                    # Accept if agent is at any valid spot for the required work location
-                    if work_location_data and (agent.x, agent.y) in work_location_data.get('coords', []):
-                        if "shift" in (agent.current_activity or ""):
-                            agent.money += 0.8  # Cafe workers earn more per hour
-                        elif "classes" in (agent.current_activity or ""):
-                            agent.money += 0.3  # Students earn less (part-time)
-                        else:
-                            agent.money += 0.5  # Office workers standard rate
-                
-                if agent.action_duration <= 0:
-                    if agent.state == 'interacting' and agent.interacting_with:
-                        other_agent = self.agents.get(agent.interacting_with)
-                        if other_agent:
-                            other_agent.state = 'idle'
-                            other_agent.interacting_with = None
-                            other_agent.behavior_tree.reset()
-                        agent.add_log(f"Finished my conversation.", self.world_state['time'], self.world_state['day_of_week'])
-                    agent.state = 'idle'
-                    agent.interacting_with = None
-                    agent.behavior_tree.reset()
-                continue
+        # Phase 2: decisions are applied one agent at a time in the shuffled order. Claims on
+        # destination cells and conversation partners are arbitrated here, first come first served.
+        for agent, intent in zip(agents_to_process, intents):
+            kind = intent[0] if intent else None
+            if kind == END_CONVERSATION:
+                other_agent = self.agents.get(intent[1])
+                if other_agent and other_agent.interacting_with == agent.id:
+                    self._settle_needs(other_agent)
+                    self.timers.cancel(other_agent.id)
+                    other_agent.state = 'idle'
+                    other_agent.interacting_with = None
+                    other_agent.behavior_tree.reset()
+            elif kind == CONVERSE and agent.state == 'idle':
+                # Not idle anymore means someone else started a conversation with this agent first
+                partner = self.agents.get(intent[1])
+                if partner and partner.state == 'idle':
+                    self._start_conversation(agent, partner, intent[2])
+                else:
+                    self._decide_again(agent)
+            elif kind == PLAN and agent.state == 'moving':
+                self._apply_route(agent, intent[1], intent[2])
+            if agent.state == 'moving':
+                self._step_along_path(agent)
+            if agent.state in BUSY_STATES:
+                self._start_timer(agent)
+        if self.lod is not None:
+            self._lod_travel(agents_to_process)
 
-            if agent.state == 'idle':
-                agent.behavior_tree.tick(agent, self.world_state)
+    def _write_diaries(self, day_name, day_number):
+        """Writes every agent's diary for a finished day."""
+        for agent in self.agents.values():
+            self.narrative_system.write_agent_diary(agent, day_name, day_number)
 
-            if agent.state == 'moving':
-                # For pathfinding traversal, we only care about the current positions of other agents.
-                occupied_for_pathing = { (a.x, a.y) for a in self.agents.values() if a.id != agent.id }
-                
-                if not agent.path or agent.path_index >= len(agent.path):
-                    agent.path = None
-                    location_name = agent.destination_name
-                    target_pos = None
-                    
-                    if location_name and location_name.startswith("agent_"):
-                        target_agent_id = location_name.split("_")[1]
-                        target_agent = self.agents.get(target_agent_id)
-                        if target_agent:
-                            # Find an adjacent spot that isn't currently claimed
-                            target_pos = self._find_adjacent_spot(target_agent.x, target_agent.y, claimed_spots)
-                    elif location_name and "home" in location_name:
-                        # Find a home spot that isn't currently claimed
-                        target_pos = self._get_agent_home_target(agent, claimed_spots)
-                    elif location_name:
-                        target_location = self.world_state['places'].get(location_name)
-                        if target_location and target_location.get('coords'):
-                            # Find a spot in the location that isn't currently claimed
-                            available_spots = [p for p in target_location['coords'] if p not in claimed_spots]
-                            if available_spots:
-                                target_pos = random.choice(available_spots)
-                    
-                    if target_pos:
-                        # Claim this spot for the rest of the tick so no other agent takes it.
-                        claimed_spots.add(target_pos)
-                        path = find_path_bfs(agent.x, agent.y, target_pos[0], target_pos[1], self.world_layout, occupied_for_pathing)
-                        agent.path = path
-                        agent.path_index = 0
-                        if not path:
-                            agent.add_log(f"I can't find a path to {location_name}.", self.world_state['time'], self.world_state['day_of_week'])
-                            agent.state = 'idle'
-                            agent.behavior_tree.reset()
-                            # Release the claim if pathfinding fails
-                            claimed_spots.remove(target_pos)
-                    else:
-                        agent.state = 'idle'
-                        if location_name:
-                            agent.add_log(f"I can't go to {location_name}, there's no space.", self.world_state['time'], self.world_state['day_of_week'])
-
-                if agent.path and agent.path_index < len(agent.path):
-                    next_pos = agent.path[agent.path_index]
-                    
-                    current_occupants = { (a.x, a.y) for a in self.agents.values() if a.id != agent.id }
-                    if next_pos in current_occupants:
-                        agent.add_log(f"My path to {agent.destination_name} is blocked, finding a new spot.", self.world_state['time'], self.world_state['day_of_week'])
-                        
-                        # --- REPLANNING LOGIC ---
-                        location_name = agent.destination_name
-                        target_pos = None
-                        
-                        # Find a new spot in the same destination location
-                        if location_name and "home" in location_name:
-                            target_pos = self._get_agent_home_target(agent, claimed_spots)
-                        elif location_name:
-                            target_location = self.world_state['places'].get(location_name)
-                            if target_location and target_location.get('coords'):
-                                available_spots = [p for p in target_location['coords'] if p not in claimed_spots]
-                                if available_spots:
-                                    target_pos = random.choice(available_spots)
-
-                        if target_pos:
-                            claimed_spots.add(target_pos)
-                            occupied_for_pathing = { (a.x, a.y) for a in self.agents.values() if a.id != agent.id }
-                            path = find_path_bfs(agent.x, agent.y, target_pos[0], target_pos[1], self.world_layout, occupied_for_pathing)
-                            
-                            if path:
-                                agent.path = path
-                                agent.path_index = 0
-                                # Move immediately to the first step of the new path if possible
-                                if agent.path and agent.path_index < len(agent.path):
-                                    new_next_pos = agent.path[agent.path_index]
-                                    if new_next_pos not in current_occupants:
-                                        agent.x, agent.y = new_next_pos
-                                        agent.path_index += 1
-                            else:
-                                # If no path to new spot, release claim and wait
-                                claimed_spots.remove(target_pos)
-                        # --- END REPLANNING ---
-                    else:
-                        agent.x, agent.y = next_pos
-                        agent.path_index += 1
-
-                    if agent.path_index >= len(agent.path):
-                        agent.path = []
-                        
-                        if agent.interacting_with:
-                            other_agent = self.agents.get(agent.interacting_with)
-                            if other_agent and (other_agent.state == 'idle' or other_agent.interacting_with == agent.id):
-                                agent.state = 'interacting'
-                                other_agent.state = 'interacting'
-                                other_agent.interacting_with = agent.id
-                                agent.current_goal = f"Chatting with {other_agent.name}"
-                                other_agent.current_goal = f"{agent.name} is coming over to talk to me."
-                                interaction_duration = random.randint(15, 25)
-                                agent.action_duration = interaction_duration
-                                other_agent.action_duration = interaction_duration
-                            else:
-                                agent.state = 'idle'
-                                agent.add_log("They seemed busy, so I decided not to interrupt.", self.world_state['time'], self.world_state['day_of_week'])
-                                agent.interacting_with = None
-                        else:
-                            agent.state = 'idle'
-                        agent.behavior_tree.reset() # Reset BT upon arrival
-                        
-        state_payload = {
-            'agents': [agent.to_dict() for agent in self.agents.values()],
-            'time': self.world_state['time'],
-            'day_of_week': self.world_state['day_of_week']
-        }
+    def _compile_story(self, agent_ids, day_name, day_number):
+        """Compiles the town story of a finished day from the diaries, keeps it and hands it to on_daily_story."""
+        story = self.narrative_system.compile_daily_story(agent_ids, day_name, day_number)
+        story_data = {'day': f"Day {day_number} ({day_name})", 'text': story}
+        self.daily_stories.append(story_data)
+        self.narrative_system.reset_agent_diaries(agent_ids, day_name, day_number)
+        if self.on_daily_story:
+            self.on_daily_story(story_data)
+
+    def tick(self, encode=True):
+        """
+        Advances the simulation by one tick, updating agent states and generating stories.
+        With encode=False no state payload is built; the next encoded payload then covers
+        every change since the last one.
+        """
+        world_time, day_index = next_clock(self.world_state['time'], self.world_state['day_index'])
+        if self._set_clock(world_time, day_index):
+            print(f"A new day has dawned! It is now {self.days[day_index % 7]} (Day {day_index + 1}).")
+        self._tick_agents()
+
+        # Only fields that changed since the last payload are sent, with periodic keyframes
+        state_payload = None
+        if encode:
+            for agent in self.agents.values():
+                self._settle_needs(agent)  # Busy and travelling agents' needs are otherwise brought up to date lazily
+            state_payload = self.state_encoder.encode(self.agents.values(), self.world_state, self.occupancy.occupancy)
 
         # Write daily logs and story at 3 AM for the previous day
-        if hour == 3 and minute == 0:
+        if world_time == (3, 0):
             prev_day_index = day_index - 1
             prev_day_name = self.days[prev_day_index % 7]
             day_number = prev_day_index + 1
-            agent_ids = [agent.id for agent in self.agents.values()]
-            for agent in self.agents.values():
-                self.narrative_system.write_agent_diary(agent, prev_day_name, day_number)
-            story = self.narrative_system.compile_daily_story(agent_ids, prev_day_name, day_number)
-            self.daily_stories.append({'day': f"Day {day_number} ({prev_day_name})", 'text': story})
-            self.narrative_system.reset_agent_diaries(agent_ids, prev_day_name, day_number)
-            emit_daily_story({'day': f"Day {day_number} ({prev_day_name})", 'text': story})
+            self._write_diaries(prev_day_name, day_number)
+            self._compile_story([agent.id for agent in self.agents.values()], prev_day_name, day_number)
+
+        return [], state_payload
 
-        return [], state_payload
\ No newline at end of file
+    def quiet_ticks(self):
+        """
+        Number of upcoming ticks in which no agent can decide anything: every agent is busy
+        with an action or conversation that lasts beyond them (or is travelling under level
+        of detail). A stretch may cross hours in which nobody's scheduled activity changes.
+        It ends before the first hour in which someone's does, before midnight and the 3 AM
+        diaries, and before 22:00 while someone is at the park, which everyone leaves then.
+        Such ticks change nothing but needs and wages, which busy agents settle lazily anyway.
+        """
+        hour, minute = self.world_state['time']
+        dormant = self.lod.dormant if self.lod is not None else {}
+        quiet = None
+        at_park = False
+        for agent in self.agents.values():
+            dormancy = dormant.get(agent.id)
+            if dormancy is not None:
+                ends = dormancy.wake - self.clock.now - 1
+            elif agent.state not in BUSY_STATES:
+                return 0
+            else:
+                ends = agent.action_duration - 1
+                at_park = at_park or agent.current_activity == "socialize_at_park"
+            quiet = ends if quiet is None else min(quiet, ends)
+            if quiet <= 0:
+                return 0
+        if quiet is None or (at_park and hour >= 22):
+            return 0
+        tables = self._schedule_tables[:, self.world_state['day_index'] % 7]
+        changed = np.flatnonzero((tables[:, hour + 1:] != tables[:, hour, None]).any(axis=0))
+        stops = [HOURS_PER_DAY, 3] + ([22] if at_park else []) + [hour + 1 + int(i) for i in changed[:1]]
+        stop = min(h for h in stops if h > hour)
+        # The first tick of that hour runs normally
+        return max(0, min(quiet, ((stop - hour) * 60 - minute) // MINUTES_PER_TICK - 1))
+
+    def skip_quiet(self, max_ticks=None):
+        """
+        Jumps over the quiet ticks ahead (see quiet_ticks) in one step: only the clock moves
+        on, and needs and wages catch up in closed form when the agents are next settled.
+        No day starts and the 3 AM diaries are left to a regular tick. Returns the number of
+        ticks skipped.
+        """
+        ticks = self.quiet_ticks()
+        if max_ticks is not None:
+            ticks = min(ticks, max_ticks)
+        if ticks <= 0:
+            return 0
+        world_time, day_index = self.world_state['time'], self.world_state['day_index']
+        for _ in range(ticks):
+            world_time, day_index = next_clock(world_time, day_index)
+            self.clock.now += 1
+            if world_time[1] == 0:
+                # Settled where a regular tick settles them, so the sums come out the same
+                self._settle_hour()
+        self._set_clock(world_time, day_index)
+        self.timers.advance(self.clock.now)  # Nothing is due before the stretch ends
+        # Nobody's activity changed, so the activities now are the ones of every skipped tick
+        self._update_agent_schedules()
+        return ticks
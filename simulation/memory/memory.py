@@ -13,9 +13,11 @@ class Memory:
         self.timestamp = timestamp or datetime.datetime.now().isoformat()
         self.related_agents = related_agents or []
         self.details = details or {}
+        self.seq = None  # Position in the owning stream, assigned by add_memory
 
     def to_dict(self):
         return {
+            'seq': self.seq,
             'event': self.event,
             'timestamp': self.timestamp,
             'related_agents': self.related_agents,
@@ -29,8 +31,11 @@ class AgentMemoryStream:
     """
     def __init__(self):
         self.memories = []
+        self.memory_count = 0  # Total memories ever added; gives each one a stable seq
 
     def add_memory(self, memory):
+        self.memory_count += 1
+        memory.seq = self.memory_count
         self.memories.append(memory)
 
     def get_memories_for_day(self, day):
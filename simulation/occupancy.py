@@ -0,0 +1,134 @@
+# simulation/occupancy.py
+# Incremental per-place occupancy counters and free-spot pools.
+# Tracks which cells are occupied or claimed as destinations so spot selection is O(1).
+
+import random
+
+class FreeSpotPool:
+    """
+    Set of unclaimed cells for one place with O(1) add, remove and random sampling.
+    Cells live in a list; removal swaps the last element into the freed slot.
+    """
+    def __init__(self, cells):
+        self.cells = list(cells)
+        self.index = {cell: i for i, cell in enumerate(self.cells)}
+
+    def __len__(self):
+        return len(self.cells)
+
+    def __contains__(self, cell):
+        return cell in self.index
+
+    def add(self, cell):
+        if cell not in self.index:
+            self.index[cell] = len(self.cells)
+            self.cells.append(cell)
+
+    def remove(self, cell):
+        i = self.index.pop(cell, None)
+        if i is None:
+            return
+        last = self.cells.pop()
+        if i < len(self.cells):
+            self.cells[i] = last
+            self.index[last] = i
+
+    def sample(self, rng=random):
+        return rng.choice(self.cells) if self.cells else None
+
+class OccupancyTracker:
+    """
+    Keeps claim counts per cell, a free-spot pool per place and live agent counts per place.
+    A cell is claimed while an agent stands on it or while it is the end of an agent's path.
+    All updates are incremental: moving an agent or changing its destination touches
+    at most two cells.
+    """
+    def __init__(self, world_index):
+        self.world_index = world_index
+        self.claims = {}      # Cell -> number of agents standing on it or heading to it
+        self.positions = {}   # Cell -> number of agents standing on it
+        self.pools = {name: FreeSpotPool(cells) for name, cells in world_index.place_cells.items()}
+        self.occupancy = {name: 0 for name in world_index.place_names}
+        self.agent_cell = {}
+        self.agent_target = {}
+
+    def _claim(self, cell):
+        count = self.claims.get(cell, 0)
+        self.claims[cell] = count + 1
+        if count == 0:
+            place = self.world_index.place_at(*cell)
+            if place:
+                self.pools[place].remove(cell)
+
+    def _release(self, cell):
+        count = self.claims.get(cell, 0) - 1
+        if count > 0:
+            self.claims[cell] = count
+            return
+        self.claims.pop(cell, None)
+        place = self.world_index.place_at(*cell)
+        if place:
+            self.pools[place].add(cell)
+
+    def _leave(self, cell):
+        """Undoes one agent standing on `cell`."""
+        self._release(cell)
+        count = self.positions[cell] - 1
+        if count:
+            self.positions[cell] = count
+        else:
+            del self.positions[cell]
+        place = self.world_index.place_at(*cell)
+        if place:
+            self.occupancy[place] -= 1
+
+    def place_agent(self, agent_id, cell):
+        """Records the agent standing on `cell`, releasing its previous cell."""
+        old = self.agent_cell.get(agent_id)
+        if old == cell:
+            return
+        if old is not None:
+            self._leave(old)
+        self.agent_cell[agent_id] = cell
+        self._claim(cell)
+        self.positions[cell] = self.positions.get(cell, 0) + 1
+        place = self.world_index.place_at(*cell)
+        if place:
+            self.occupancy[place] += 1
+
+    def set_target(self, agent_id, cell):
+        """Claims `cell` as the agent's destination, releasing any previous one. None clears it."""
+        old = self.agent_target.pop(agent_id, None)
+        if old is not None:
+            self._release(old)
+        if cell is not None:
+            self.agent_target[agent_id] = cell
+            self._claim(cell)
+
+    def lift_agent(self, agent_id):
+        """Takes an agent off the cell it stands on, e.g. while it is between places; its destination stays claimed."""
+        cell = self.agent_cell.pop(agent_id, None)
+        if cell is not None:
+            self._leave(cell)
+
+    def remove_agent(self, agent_id):
+        """Forgets an agent, releasing the cell it stands on and its destination."""
+        self.set_target(agent_id, None)
+        cell = self.agent_cell.pop(agent_id, None)
+        if cell is not None:
+            self._leave(cell)
+
+    def is_claimed(self, cell):
+        return cell in self.claims
+
+    def is_occupied(self, cell, exclude_agent_id=None):
+        """Checks whether another agent is standing on `cell`."""
+        count = self.positions.get(cell, 0)
+        if exclude_agent_id is not None and self.agent_cell.get(exclude_agent_id) == cell:
+            count -= 1
+        return count > 0
+
+    def sample_free(self, place_name, rng=random):
+        """Returns a random unclaimed cell in the place, or None if it is full."""
+        pool = self.pools.get(place_name)
+        return pool.sample(rng) if pool is not None else None
@@ -0,0 +1,419 @@
+# simulation/regions.py
+# Spatial domain decomposition: one large town ticked by several worker processes.
+# The map is cut into rectangular regions, each owned by a worker that ticks the agents standing
+# in it. An agent that steps across a border migrates to the neighbouring worker, and after every
+# tick the workers exchange a halo: the agents near each border, so pathfinding and neighbour
+# queries see across it. A coordinator keeps the one world clock and merges the regions' output.
+
+import multiprocessing
+from collections import deque, namedtuple
+from simulation.agent_log import PAGE_SIZE, get_agent_history
+from simulation.config import AGENT_CONFIG
+from simulation.manager import BUSY_STATES, DAYS, AgentManager, agent_view, next_clock
+from simulation.rng import RandomStream, derive_seed, new_seed
+from simulation.state_encoder import StateDeltaEncoder
+from simulation.world import WorldIndex
+from behavior.agent_behaviors import create_agent_bt
+
+# Cells of the neighbouring regions mirrored each tick. FindAgentToTalkTo looks for partners
+# fewer than 6 cells away, so every candidate it could pick is visible.
+HALO = 6
+
+class Region(namedtuple('Region', ['id', 'x0', 'y0', 'x1', 'y1'])):
+    """The cells x0 <= x < x1, y0 <= y < y1 of the map, owned by one worker."""
+    __slots__ = ()
+
+    def contains(self, x, y):
+        return self.x0 <= x < self.x1 and self.y0 <= y < self.y1
+
+    def near(self, x, y, margin):
+        """Whether a cell lies in this region or within `margin` cells of it."""
+        return self.x0 - margin <= x < self.x1 + margin and self.y0 - margin <= y < self.y1 + margin
+
+    def on_border(self, x, y, margin):
+        """Whether a cell of this region lies within `margin` cells of its edge."""
+        return not (self.x0 + margin <= x < self.x1 - margin and self.y0 + margin <= y < self.y1 - margin)
+
+def _balanced_cuts(weights, parts):
+    """Cut positions splitting `weights` into at most `parts` runs of about equal total."""
+    total = sum(weights) or 1
+    cuts, running = [0], 0
+    for i, weight in enumerate(weights[:-1]):
+        running += weight
+        if len(cuts) < parts and running >= total * len(cuts) / parts:
+            cuts.append(i + 1)
+    cuts.append(len(weights))
+    return cuts
+
+def partition_map(world_layout, columns, rows):
+    """
+    Cuts the map into `columns` vertical strips, then each strip into `rows` regions, so that
+    regions hold about the same number of walkable cells. Returns the regions in id order.
+    """
+    walkable = [[cell != 'G' for cell in row] for row in world_layout]
+    height, width = len(walkable), len(walkable[0])
+    x_cuts = _balanced_cuts([sum(walkable[y][x] for y in range(height)) for x in range(width)], columns)
+    regions = []
+    for x0, x1 in zip(x_cuts, x_cuts[1:]):
+        y_cuts = _balanced_cuts([sum(walkable[y][x0:x1]) for y in range(height)], rows)
+        for y0, y1 in zip(y_cuts, y_cuts[1:]):
+            regions.append(Region(len(regions), x0, y0, x1, y1))
+    return regions
+
+def region_at(regions, x, y):
+    """The region owning a cell; cells off the map belong to the nearest region."""
+    for region in regions:
+        if region.contains(x, y):
+            return region
+    return min(regions, key=lambda r: max(r.x0 - x, x - r.x1 + 1, 0) + max(r.y0 - y, y - r.y1 + 1, 0))
+
+class RegionManager(AgentManager):
+    """
+    AgentManager for the agents standing in one region.
+    The world clock is set by the coordinator instead of advanced here. Agents near the edges of
+    the neighbouring regions are mirrored as ghosts: they block cells, hold their destination
+    claims and are seen by behavior trees, but are not ticked here. Conversations start only
+    between agents of the same region, so a ghost never accepts one; an agent walking over to
+    talk to a ghost usually crosses into its region on the way.
+
+    Destination spots are sampled from what this region knows. Two regions may pick the same
+    distant spot; the later arrival finds it taken and picks another, as a blocked agent does.
+    """
+    def __init__(self, world_layout, places_data, region, agent_config, halo=HALO, seed=None):
+        self.region = region
+        self.halo = halo
+        self.ghosts = {}  # Agent id -> AgentView of a neighbouring region's agent
+        super().__init__(world_layout, places_data, agent_config=agent_config, seed=seed)
+        # Agents' streams come from the town's seed and travel with them; the tick order is per region
+        self.rng = RandomStream(derive_seed(self.seed, 'region', region.id))
+
+    def _agent_views(self):
+        views = dict(self.ghosts)
+        views.update(super()._agent_views())
+        return views
+
+    def set_ghosts(self, ghosts):
+        """Replaces the mirrored agents with (view, destination) pairs from the neighbours' last tick."""
+        for agent_id in self.ghosts:
+            if agent_id not in self.agents:  # A migrant adopted here was mirrored until now
+                self.occupancy.remove_agent(agent_id)
+        self.ghosts = {}
+        for view, target in ghosts:
+            self.ghosts[view.id] = view
+            self.occupancy.place_agent(view.id, (view.x, view.y))
+            if target is not None:
+                self.occupancy.set_target(view.id, target)
+
+    def border(self):
+        """(view, destination) of the agents the neighbouring regions mirror in their halo."""
+        return [
+            (agent_view(agent), self.occupancy.agent_target.get(agent.id))
+            for agent in self.agents.values() if self.region.on_border(agent.x, agent.y, self.halo)
+        ]
+
+    def _free_cell_near(self, pos):
+        """The nearest walkable cell of this region nobody stands on."""
+        queue, seen = deque([pos]), {pos}
+        while queue:
+            x, y = queue.popleft()
+            if self.world_layout[y][x] != 'G' and not self.occupancy.is_occupied((x, y)):
+                return (x, y)
+            for dx, dy in ((0, 1), (0, -1), (1, 0), (-1, 0)):
+                cell = (x + dx, y + dy)
+                if cell not in seen and self.region.contains(*cell):
+                    seen.add(cell)
+                    queue.append(cell)
+        return pos
+
+    def adopt(self, migrant):
+        """Takes over an agent that stepped into this region (see release)."""
+        agent = migrant['agent']
+        pos = (agent.x, agent.y)
+        if self.occupancy.is_occupied(pos):
+            # An agent of this region stepped onto the same cell in the same tick
+            agent.x, agent.y = pos = self._free_cell_near(pos)
+            agent.path, agent.path_index = [], 0  # Planned again from here in the decide phase
+        agent.behavior_tree = create_agent_bt(agent, self.world_state)
+        agent.clock = self.clock  # Every region counts the same ticks
+        self.agents[agent.id] = agent
+        self._agent_schedules[agent.id] = migrant['schedule']
+        self.world_index.register_home(agent.id, (agent.home['x'], agent.home['y']))
+        self.occupancy.place_agent(agent.id, pos)
+        if agent.path:
+            self.occupancy.set_target(agent.id, agent.path[-1])
+        if agent.state in BUSY_STATES:
+            self.timers.schedule(agent.id, agent.action_ends)
+
+    def release(self, agent):
+        """Hands an agent over to another region; returns what its new owner needs to adopt it."""
+        del self.agents[agent.id]
+        self.occupancy.remove_agent(agent.id)
+        self.timers.cancel(agent.id)
+        # Trees hold references to this region's world state; the new owner builds a fresh one.
+        # Walking agents do not tick their tree, and a tree is reset on arrival anyway.
+        agent.behavior_tree = None
+        return {'agent': agent, 'schedule': self._agent_schedules.pop(agent.id)}
+
+    def step(self, world_time, day_index, ghosts, migrants, watched, encode):
+        """
+        One tick of this region at the coordinator's clock. Returns the agents that left the
+        region, the border agents for the neighbours' halos, new log lines of watched agents
+        and, with `encode`, the client records of every agent ticked here.
+        """
+        self._set_clock(world_time, day_index)
+        # Ghosts first: adopt must see the neighbours' agents where they stand now
+        self.set_ghosts(ghosts)
+        for migrant in migrants:
+            self.adopt(migrant)
+        if migrants:
+            self._index_schedules()
+        self.log_feed.set_watched(watched, self.agents)
+
+        self._tick_agents()
+
+        log_pages = self.log_feed.collect(self.agents)
+        if world_time == (3, 0):
+            # The coordinator compiles the story once every region has written its diaries
+            self._write_diaries(DAYS[(day_index - 1) % 7], day_index)
+        records = None
+        if encode:
+            for agent in self.agents.values():
+                self._settle_needs(agent)
+            records = [agent.to_dict() for agent in self.agents.values()]
+        emigrants = [
+            self.release(agent) for agent in list(self.agents.values())
+            if not self.region.contains(agent.x, agent.y)
+        ]
+        if emigrants:
+            self._index_schedules()
+        return {'emigrants': emigrants, 'border': self.border(), 'log_pages': log_pages, 'records': records}
+
+def run_region_worker(conn, world_layout, places_data, region, agent_config, halo, seed):
+    """Worker process: owns one region and answers the coordinator's tick and history requests."""
+    manager = RegionManager(world_layout, places_data, region, agent_config, halo, seed)
+    conn.send({'records': [agent.to_dict() for agent in manager.agents.values()], 'border': manager.border()})
+    while True:
+        command, args = conn.recv()
+        if command == 'tick':
+            conn.send(manager.step(**args))
+        elif command == 'history':
+            try:
+                conn.send((manager.get_agent_history(**args), None))
+            except (TypeError, ValueError) as e:
+                conn.send((None, e))
+        elif command == 'stop':
+            break
+    conn.close()
+
+class AgentRecord:
+    """An agent's client-visible fields as its region last reported them."""
+    def __init__(self, record):
+        self.update(record)
+
+    def update(self, record):
+        self.record = record
+        self.__dict__.update(record)
+
+    def to_dict(self):
+        return dict(self.record)
+
+class RegionLogFeed:
+    """
+    Log feed of a town split into regions. The regions follow the watched agents they own;
+    their new lines arrive with every tick and are handed out on the next collect().
+    """
+    def __init__(self):
+        self.watched = []
+        self.pages = []
+
+    def set_watched(self, agent_ids, agents):
+        self.watched = [agent_id for agent_id in agent_ids if agent_id in agents]
+
+    def collect(self, agents):
+        pages, self.pages = self.pages, []
+        return pages
+
+class RegionCoordinator:
+    """
+    Runs a town split into regions (see partition_map) with the interface of an AgentManager.
+    Keeps the world clock and steps every region worker in lock-step once per tick, then routes
+    migrating agents to their new region and each region's border agents to the neighbours whose
+    halo they fall in. Agent records are kept in the town's agent order, so state payloads and
+    binary frames look the same as a single process's. The daily story is compiled here after
+    every region has written its agents' diaries.
+    """
+    def __init__(self, world_layout, places_data, columns, rows, halo=HALO, agent_config=None, on_daily_story=None, seed=None):
+        from simulation.llm_handler import LLMHandler
+        from simulation.narrative.narrative_system import NarrativeSystem
+        agent_config = AGENT_CONFIG if agent_config is None else agent_config
+        self.regions = partition_map(world_layout, columns, rows)
+        self.halo = halo
+        self.world_index = WorldIndex(world_layout, places_data)
+        self.world_state = {
+            'time': (8, 0),  # Start at 8 AM
+            'day_index': 0,
+            'day_of_week': DAYS[0],
+            'places': places_data,
+            'world_index': self.world_index,
+        }
+        self.state_encoder = StateDeltaEncoder()
+        self.log_feed = RegionLogFeed()
+        self.narrative_system = NarrativeSystem(LLMHandler())
+        self.daily_stories = []
+        self.on_daily_story = on_daily_story
+        self.seed = new_seed() if seed is None else seed
+
+        # Spawned, not forked: the parent may be a server with sockets and threads
+        context = multiprocessing.get_context('spawn')
+        self.workers = []  # (process, connection) per region, in region id order
+        for region in self.regions:
+            configs = [config for config in agent_config if region_at(self.regions, *config['home_pos']) is region]
+            conn, child_conn = context.Pipe()
+            process = context.Process(
+                target=run_region_worker, name=f'region-{region.id}', daemon=True,
+                args=(child_conn, world_layout, places_data, region, configs, halo, self.seed),
+            )
+            process.start()
+            self.workers.append((process, conn))
+
+        self.agents = {config['id']: None for config in agent_config}  # Agent id -> AgentRecord
+        self.owner = {}  # Agent id -> id of the region ticking it
+        borders = []
+        for region, (_, conn) in zip(self.regions, self.workers):
+            ready = conn.recv()
+            for record in ready['records']:
+                self.agents[record['id']] = AgentRecord(record)
+                self.owner[record['id']] = region.id
+            borders.append(ready['border'])
+        self._migrants = [[] for _ in self.regions]
+        self._ghosts = self._route_halos(borders)
+        print(f"Split the town into {len(self.regions)} regions.")
+
+    def _route_halos(self, borders):
+        """Sends every region's border agents to the other regions whose halo they fall in."""
+        ghosts = [[] for _ in self.regions]
+        for source, border in zip(self.regions, borders):
+            for view, target in border:
+                for region in self.regions:
+                    if region is not source and region.near(view.x, view.y, self.halo):
+                        ghosts[region.id].append((view, target))
+        return ghosts
+
+    def _occupancy(self):
+        occupancy = {name: 0 for name in self.world_index.place_names}
+        for record in self.agents.values():
+            place = self.world_index.place_at(record.x, record.y)
+            if place:
+                occupancy[place] += 1
+        return occupancy
+
+    def get_agent_history(self, agent_id, kind='log', since=None, before=None, limit=PAGE_SIZE):
+        """Returns one page of an agent's log or memories, or None for an unknown agent."""
+        if agent_id not in self.owner:
+            return None
+        region_id = self.owner[agent_id]
+        for migrant in self._migrants[region_id]:
+            if migrant['agent'].id == agent_id:
+                # Between regions until the next tick
+                return get_agent_history(migrant['agent'], kind, since=since, before=before, limit=limit)
+        conn = self.workers[region_id][1]
+        conn.send(('history', {'agent_id': agent_id, 'kind': kind, 'since': since, 'before': before, 'limit': limit}))
+        page, error = conn.recv()
+        if error is not None:
+            raise error
+        return page
+
+    def tick(self, encode=True):
+        """Advances every region by one tick; returns the same ([], state payload) as AgentManager.tick."""
+        world_time, day_index = next_clock(self.world_state['time'], self.world_state['day_index'])
+        if day_index != self.world_state['day_index']:
+            print(f"A new day has dawned! It is now {DAYS[day_index % 7]} (Day {day_index + 1}).")
+        self.world_state['time'] = world_time
+        self.world_state['day_index'] = day_index
+        self.world_state['day_of_week'] = DAYS[day_index % 7]
+
+        for region, (_, conn) in zip(self.regions, self.workers):
+            conn.send(('tick', {
+                'world_time': world_time, 'day_index': day_index,
+                'ghosts': self._ghosts[region.id], 'migrants': self._migrants[region.id],
+                'watched': self.log_feed.watched, 'encode': encode,
+            }))
+        replies = [conn.recv() for _, conn in self.workers]
+
+        self._migrants = [[] for _ in self.regions]
+        for reply in replies:
+            self.log_feed.pages.extend(reply['log_pages'])
+            for record in reply['records'] or ():
+                self.agents[record['id']].update(record)
+            for migrant in reply['emigrants']:
+                agent = migrant['agent']
+                destination = region_at(self.regions, agent.x, agent.y)
+                self.owner[agent.id] = destination.id
+                self._migrants[destination.id].append(migrant)
+        self._ghosts = self._route_halos([reply['border'] for reply in replies])
+
+        state_payload = None
+        if encode:
+            state_payload = self.state_encoder.encode(self.agents.values(), self.world_state, self._occupancy())
+
+        # Every region wrote its diaries for the previous day during this tick
+        if world_time == (3, 0):
+            day_name = DAYS[(day_index - 1) % 7]
+            agent_ids = list(self.agents)
+            story = self.narrative_system.compile_daily_story(agent_ids, day_name, day_index)
+            story_data = {'day': f"Day {day_index} ({day_name})", 'text': story}
+            self.daily_stories.append(story_data)
+            self.narrative_system.reset_agent_diaries(agent_ids, day_name, day_index)
+            if self.on_daily_story:
+                self.on_daily_story(story_data)
+        return [], state_payload
+
+    def close(self, timeout=5.0):
+        """Stops the region workers."""
+        for process, conn in self.workers:
+            try:
+                conn.send(('stop', None))
+            except (BrokenPipeError, OSError):
+                pass
+        for process, _ in self.workers:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+
+def _migration_check(agents=48, columns=2, rows=1, seed=5, ticks=420):
+    """Ticks a split town past many border crossings and checks no two agents of a region share a cell."""
+    import contextlib
+    import io
+    from simulation.trajectory import population
+    from simulation.world import load_map_data
+
+    map_data = load_map_data()
+    agent_config = population(agents, map_data)
+    homes = {config['id']: tuple(config['home_pos']) for config in agent_config}
+    with contextlib.redirect_stdout(io.StringIO()):
+        coordinator = RegionCoordinator(map_data['layout'], map_data['places'], columns, rows, agent_config=agent_config, seed=seed)
+    migrations = 0
+    try:
+        owner = dict(coordinator.owner)
+        for tick in range(1, ticks + 1):
+            with contextlib.redirect_stdout(io.StringIO()):
+                coordinator.tick(encode=True)
+            migrations += sum(1 for agent_id, region_id in coordinator.owner.items() if owner[agent_id] != region_id)
+            owner = dict(coordinator.owner)
+            # A migrant may have stepped onto a cell its new region's agent took in the same tick;
+            # it is moved aside when adopted at the start of the next tick.
+            pending = {migrant['agent'].id for migrants in coordinator._migrants for migrant in migrants}
+            cells = {}
+            for record in coordinator.agents.values():
+                if record.id not in pending:
+                    cells.setdefault((record.x, record.y), []).append(record.id)
+            for cell, agent_ids in cells.items():
+                # Clones of a bundled agent may share its home cell
+                if len(agent_ids) > 1 and any(homes[agent_id] != cell for agent_id in agent_ids):
+                    raise SystemExit(f"Tick {tick}: {', '.join(agent_ids)} share the cell {cell}.")
+    finally:
+        coordinator.close()
+    print(f"No shared cells in {ticks} ticks with {migrations} migrations between {columns * rows} regions.")
+
+if __name__ == '__main__':
+    _migration_check()
@@ -0,0 +1,272 @@
+# simulation/runner.py
+# Simulation loop shared by the standalone command client and the in-process server mode.
+# Owns the AgentManager together with the control state clients can change
+# (pause, keyframe requests, log subscriptions and history requests).
+
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from simulation.manager import AgentManager
+from simulation.agent_log import PAGE_SIZE
+from simulation.checkpoint import CheckpointWriter, restore_checkpoint
+from simulation.frame_codec import FRAME_FIELDS, encode_frame
+from simulation.state_encoder import StateDeltaEncoder
+
+TICK_INTERVAL = 0.4   # Seconds between ticks at normal speed
+BROADCAST_HZ = 10     # Most state updates sent to clients per second, whatever the tick rate
+CHECKPOINT_INTERVAL = 150  # Ticks between checkpoints (five hours of simulated time)
+
+def check_llm_ready():
+    """Checks LLM API connectivity; the simulation should not start without it."""
+    from simulation.llm_handler import LLMHandler
+    print("Checking LLM API connectivity...")
+    llm = LLMHandler()
+    ok, msg = llm.check_llm_api()
+    if ok:
+        print(f"LLM API is working: {msg}")
+    else:
+        print(f"LLM API check failed: {msg}")
+        print("Simulation will not start. Please check your API key and network.")
+    return ok
+
+class SimulationPublisher:
+    """
+    Receives everything the simulation sends to clients.
+    The command client forwards to the server over SocketIO; the in-process server
+    mode delivers straight to connected browsers.
+    """
+    def state(self, payload):
+        """A keyframe or delta state payload, once per broadcast."""
+
+    def frame(self, data):
+        """A binary agent frame (see frame_codec.py), once per broadcast when enabled."""
+
+    def log_lines(self, page):
+        """New log lines for an agent someone is following."""
+
+    def history(self, page):
+        """A page of agent history answering a request; `page['client_sid']` names the requester."""
+
+    def daily_story(self, story):
+        """A newly compiled daily story."""
+
+class SimulationRunner:
+    """
+    Ticks the AgentManager at a fixed interval and hands all output to a publisher.
+    Client requests may arrive from other threads; they are queued or flagged here and
+    applied between ticks, so the manager is only ever touched by the loop.
+
+    Broadcasting is decoupled from ticking: state is encoded and published at most
+    `broadcast_hz` times per second. The delta encoder diffs against the last payload it
+    sent, so skipped ticks coalesce into the next update, and the log feed hands over every
+    line logged since the previous broadcast. `speed` runs the simulation faster than
+    real time by shortening the tick interval. With `tick_workers` > 1 the agents' decide
+    phase runs on a thread pool of that size; this is not faster under the GIL, and it is
+    ignored with a `bt_profiler`. With `regions=(columns, rows)` the map is split
+    into that many regions, each ticked by its own process (see regions.py). With `lod=True`
+    agents outside the area browsers are looking at are simulated coarsely (see lod.py);
+    until `set_observed` is called nobody is watching. With `skip_quiet=True` each step
+    first jumps over ticks in which every agent is busy (see AgentManager.skip_quiet), so
+    the world clock runs ahead through nights and long actions. With a `checkpoint` path the
+    town is restored from that file if it exists and saved to it every `checkpoint_interval`
+    ticks and when the loop is stopped (see checkpoint.py). The same `seed` gives the same
+    run (see rng.py); without one a fresh seed is drawn and printed.
+    """
+    def __init__(self, publisher, world_layout, places_data, bt_profiler=None, binary_frames=False,
+                 tick_interval=TICK_INTERVAL, speed=1.0, broadcast_hz=BROADCAST_HZ,
+                 sleep=time.sleep, clock=time.monotonic, tick_workers=0, agent_config=None, regions=None,
+                 lod=False, skip_quiet=False, checkpoint=None, checkpoint_interval=CHECKPOINT_INTERVAL, seed=None):
+        self.publisher = publisher
+        self.executor = None
+        if regions:
+            from simulation.regions import RegionCoordinator
+            self.manager = RegionCoordinator(
+                world_layout, places_data, *regions, agent_config=agent_config, on_daily_story=publisher.daily_story,
+                seed=seed,
+            )
+            if lod:
+                print("Level of detail is not supported with regions; every agent is simulated in full.")
+            if skip_quiet:
+                print("Skipping quiet ticks is not supported with regions; every tick is run.")
+                skip_quiet = False
+        else:
+            if bt_profiler and tick_workers > 1:
+                # Node timings taken on competing threads would include time spent waiting for the GIL
+                print("Behavior tree profiling is not supported with tick workers; the decide phase runs serially.")
+                tick_workers = 0
+            self.executor = ThreadPoolExecutor(tick_workers, thread_name_prefix='decide') if tick_workers > 1 else None
+            self.manager = AgentManager(
+                world_layout=world_layout, places_data=places_data,
+                bt_profiler=bt_profiler, on_daily_story=publisher.daily_story, executor=self.executor,
+                agent_config=agent_config, lod=lod, seed=seed,
+            )
+        print(f"World seed: {self.manager.seed}")
+        self.checkpoint = None
+        self.checkpoint_interval = checkpoint_interval
+        if checkpoint and regions:
+            print("Checkpoints are not supported with regions; the town starts fresh and is not saved.")
+        elif checkpoint:
+            if os.path.exists(checkpoint):
+                restore_checkpoint(self.manager, checkpoint)
+                print(f"Resumed from checkpoint {checkpoint} at {self.manager.world_state['day_of_week']} "
+                      f"{self.manager.world_state['time'][0]:02d}:{self.manager.world_state['time'][1]:02d}.")
+            self.checkpoint = CheckpointWriter(self.manager, checkpoint)
+            self._checkpoint_tick = self.manager.clock.now
+        self.binary_frames = binary_frames
+        self.skip_quiet = skip_quiet
+        if binary_frames:
+            # Binary frames carry these fields every tick, so JSON deltas can leave them out
+            self.manager.state_encoder = StateDeltaEncoder(skip_fields=FRAME_FIELDS)
+        self.tick_interval = tick_interval / speed
+        self.broadcast_interval = 1.0 / broadcast_hz if broadcast_hz else 0.0
+        self.sleep = sleep
+        self.clock = clock
+        self._last_broadcast = None
+        self.tick_count = 0
+        self.broadcast_count = 0
+
+        self.paused = False
+        self.running = True
+        self.keyframe_requested = False
+        self.history_requests = deque()  # Log/memory page requests, answered between ticks
+        self.watched_agent_ids = None    # Latest set of followed agents, applied on the next step
+        self.observed_area = None        # (rects,) last reported by the server, applied on the next step
+
+    # --- Client requests ---
+    def pause(self):
+        print("--- SIMULATION PAUSED ---")
+        self.paused = True
+
+    def resume(self):
+        print("--- SIMULATION RESUMED ---")
+        self.paused = False
+
+    def stop(self):
+        self.running = False
+
+    def request_keyframe(self):
+        """Sends a full state keyframe with the next broadcast, e.g. when a browser connects."""
+        self.keyframe_requested = True
+
+    def request_history(self, request):
+        """Queues a request for a page of an agent's log or memories."""
+        self.history_requests.append(request)
+
+    def set_watched_agents(self, agent_ids):
+        """Updates which agents' new log lines should be pushed."""
+        self.watched_agent_ids = list(agent_ids)
+
+    def set_observed(self, rects):
+        """
+        Updates the map rectangles browsers are looking at, for level of detail: a list of
+        inclusive (x0, y0, x1, y1) tuples, or None when a browser is watching the whole town.
+        """
+        self.observed_area = (None if rects is None else [tuple(rect) for rect in rects],)
+
+    def stats(self):
+        """Tick and broadcast counters, e.g. for a status endpoint."""
+        return {
+            'ticks': self.tick_count,
+            'broadcasts': self.broadcast_count,
+            'paused': self.paused,
+            'tick_interval': self.tick_interval,
+            'broadcast_interval': self.broadcast_interval,
+        }
+
+    # --- Loop ---
+    def _broadcast_due(self):
+        now = self.clock()
+        if self._last_broadcast is None or now - self._last_broadcast >= self.broadcast_interval:
+            self._last_broadcast = now
+            return True
+        return False
+
+    def _answer_history_requests(self):
+        while self.history_requests:
+            request = self.history_requests.popleft()
+            agent_id = request.get('agent_id')
+            kind = request.get('kind', 'log')
+            try:
+                page = self.manager.get_agent_history(
+                    agent_id, kind, since=request.get('since'), before=request.get('before'),
+                    limit=request.get('limit', PAGE_SIZE),
+                )
+                if page is None:
+                    page = {'error': f"Unknown agent '{agent_id}'"}
+            except (TypeError, ValueError) as e:
+                page = {'error': str(e)}
+            page.update({'agent_id': agent_id, 'kind': kind, 'client_sid': request.get('client_sid')})
+            self.publisher.history(page)
+
+    def step(self):
+        """Applies pending client requests, then advances one tick unless paused."""
+        if self.watched_agent_ids is not None:
+            watched, self.watched_agent_ids = self.watched_agent_ids, None
+            self.manager.log_feed.set_watched(watched, self.manager.agents)
+        if self.observed_area is not None:
+            (rects,), self.observed_area = self.observed_area, None
+            if getattr(self.manager, 'lod', None) is not None:
+                self.manager.lod.set_observed(rects)
+        # Answered even while paused so agents can still be inspected
+        self._answer_history_requests()
+        if self.paused:
+            return None
+
+        broadcast = self._broadcast_due()
+        if broadcast and self.keyframe_requested:
+            self.keyframe_requested = False
+            self.manager.state_encoder.request_keyframe()
+        if self.skip_quiet:
+            self.tick_count += self.manager.skip_quiet()
+        commands, state_payload = self.manager.tick(encode=broadcast)
+        self.tick_count += 1
+        if self.checkpoint and self.manager.clock.now - self._checkpoint_tick >= self.checkpoint_interval:
+            self.save_checkpoint()
+        if not broadcast:
+            return None
+
+        self.broadcast_count += 1
+        if state_payload:
+            if self.binary_frames:
+                # Sent first so viewport filtering sees current positions
+                self.publisher.frame(encode_frame(self.manager.agents.values(), self.manager.world_state, state_payload['seq']))
+            self.publisher.state(state_payload)
+        for page in self.manager.log_feed.collect(self.manager.agents):
+            self.publisher.log_lines(page)
+        return state_payload
+
+    def save_checkpoint(self):
+        """Saves the town to the checkpoint file now."""
+        self._checkpoint_tick = self.manager.clock.now
+        try:
+            self.checkpoint.save()
+        except OSError as e:
+            print(f"Could not write checkpoint {self.checkpoint.path}: {e}")
+
+    def run(self):
+        """Runs the loop until stopped, interrupted or an error occurs."""
+        print("Starting simulation loop.")
+        next_tick = self.clock()
+        while self.running:
+            try:
+                self.step()
+                next_tick += self.tick_interval
+                delay = next_tick - self.clock()
+                if delay < 0:
+                    # Ticking slower than asked for: carry on from now instead of bursting to catch up
+                    next_tick = self.clock()
+                    delay = 0
+                self.sleep(delay)
+            except KeyboardInterrupt:
+                print("Simulation stopped by user.")
+                break
+            except Exception as e:
+                print(f"An error occurred in the simulation loop: {e}")
+                break
+        if self.checkpoint and not self.running:
+            # Stopped between ticks; an interrupted or failed tick keeps the last checkpoint instead
+            self.save_checkpoint()
+        if self.executor:
+            self.executor.shutdown()
+        self.manager.close()
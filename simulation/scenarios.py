@@ -0,0 +1,275 @@
+# simulation/scenarios.py
+# Scenario sweeps: one warmed-up base town forked into many variants that run headless side by
+# side on a process pool, with the outcome of every variant collected into one table.
+#
+#   python -m simulation.scenarios                     the default sweep (default x workaholic sleep windows)
+#   python -m simulation.scenarios sweep.json --csv results/sweep.csv
+#
+# A sweep file is a JSON object; every key is optional:
+#   {"base": {"seed": 7, "agents": 48, "warmup": 120, "map": "maps/town.json", "checkpoint": "town.ckpt"},
+#    "ticks": 720,
+#    "variants": [{"name": "baseline"},
+#                 {"name": "early birds", "sleep": {"default": [21, 5]}},
+#                 {"name": "no office", "schedules": {"office_worker_extrovert": {"weekdays": {"9-17": "socialize_at_park"}}}},
+#                 {"name": "roadworks", "map": "maps/town_roadworks.json"}],
+#    "grid": {"traits.extrovert.social_motivation": [1.0, 1.5, 2.0], "seed": [1, 2]}}
+#
+# The base town is generated with room for `agents` agents (see trajectory.town), or with a
+# "map" the bundled agents cloned to `agents` on that map, or the state saved in `checkpoint`;
+# it is ticked `warmup` ticks. Every variant is crossed with every combination of the grid
+# values, each a dotted path into the variant. A variant can override personality traits
+# ("traits", merged into PERSONALITY_TRAITS), schedule templates ("schedules", hours written
+# "start-end") and sleep windows ("sleep"), reseed the random streams ("seed") or swap in another
+# map with the same size and place names as the base's map file ("map"). Relative paths are
+# resolved against the file.
+#
+# Where the platform can fork, each variant runs in a fresh fork of the parent, which starts
+# from the base town in memory, copy-on-write. Elsewhere, and for map variants, workers rebuild
+# the base town from a checkpoint blob. Variants keep the base's random streams unless they
+# reseed, so two variants differ only by their overrides. Diaries and daily stories are not
+# written: they need the LLM, so runs may cross 3 AM.
+
+import argparse
+import contextlib
+import copy
+import csv
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import time
+import numpy as np
+from simulation.activities import ACTIVITIES
+from simulation.checkpoint import encode_checkpoint, load_manager
+from simulation.config import PERSONALITY_TRAITS, SCHEDULE_TEMPLATES, SLEEP_SCHEDULES
+from simulation.manager import AgentManager
+from simulation.rng import RandomStream, derive_seed
+from simulation.trajectory import population, town
+from simulation.world import MAP_DATA_PATH, load_map_data
+
+SWEEP_TICKS = 720      # One simulated day
+SAMPLE_INTERVAL = 10   # Ticks between samples of every agent's needs
+BASE_SEED = 20240601
+BASE_AGENTS = 48
+DEFAULT_GRID = {
+    'sleep.default': [[22, 6], [23, 8], [1, 9]],
+    'sleep.workaholic': [[1, 6], [23, 7], [2, 5]],
+}
+NEEDS = ('hunger', 'social', 'energy')
+COUNTERS = ('conversations', 'replans', 'no_path', 'no_space')
+
+_worker = {}  # Set up in each worker process by _init_worker
+
+class SilentNarrative:
+    """Stands in for the NarrativeSystem in sweeps: no diaries and empty stories, so no LLM calls."""
+    def write_agent_diary(self, agent, day_name, day_number):
+        return ""
+
+    def compile_daily_story(self, agent_ids, day_name, day_number):
+        return ""
+
+    def reset_agent_diaries(self, agent_ids, day_name, day_number):
+        pass
+
+def expand_variants(variants, grid):
+    """Every variant crossed with every combination of grid values; each grid key is a dotted path into the variant."""
+    variants = variants or [{'name': 'base'}]
+    keys = sorted(grid or {})
+    expanded = []
+    for variant in variants:
+        for values in itertools.product(*(grid[key] for key in keys)):
+            combined = copy.deepcopy(variant)
+            labels = [variant['name']] if variant.get('name') and (len(variants) > 1 or not keys) else []
+            for key, value in zip(keys, values):
+                *parents, leaf = key.split('.')
+                target = combined
+                for parent in parents:
+                    target = target.setdefault(parent, {})
+                target[leaf] = value
+                labels.append(f"{key}={value}")
+            combined['name'] = ' '.join(labels)
+            expanded.append(combined)
+    return expanded
+
+def _parse_template(template):
+    """A schedule template from JSON, whose hour ranges are written "start-end", in the form of SCHEDULE_TEMPLATES."""
+    parsed = {}
+    for days, entries in template.items():
+        parsed[days] = {}
+        for hours, activity in entries.items():
+            start_hour, end_hour = (int(hour) for hour in hours.split('-'))
+            parsed[days][(start_hour, end_hour)] = activity
+    return parsed
+
+def apply_variant(manager, variant):
+    """Applies a variant's seed, trait and schedule overrides to a manager holding the base town."""
+    if 'seed' in variant:
+        manager.seed = variant['seed']
+        manager.rng = RandomStream(derive_seed(manager.seed, 'world'))
+        for agent in manager.agents.values():
+            agent.rng = RandomStream(derive_seed(manager.seed, 'agent', agent.id))
+    if variant.get('traits'):
+        traits = {name: dict(values) for name, values in PERSONALITY_TRAITS.items()}
+        for name, values in variant['traits'].items():
+            traits.setdefault(name, {}).update(values)
+        for agent in manager.agents.values():
+            agent.personality = {k: v for p in agent.personality_names for k, v in traits.get(p, {}).items()}
+    if variant.get('schedules') or variant.get('sleep'):
+        templates = dict(SCHEDULE_TEMPLATES)
+        templates.update((name, _parse_template(template)) for name, template in variant.get('schedules', {}).items())
+        sleep_schedules = dict(SLEEP_SCHEDULES)
+        sleep_schedules.update((trait, tuple(window)) for trait, window in variant.get('sleep', {}).items())
+        manager.set_schedules(templates, sleep_schedules)
+
+def run_variant(manager, ticks):
+    """Runs a manager `ticks` ticks headless; returns its metrics as a table row (without the name)."""
+    agents = list(manager.agents.values())
+    for agent in agents:
+        if agent.state == 'doing_action':
+            manager._settle_wages(agent)  # Wages earned before the fork are not the variant's
+    start_money = np.array([agent.money for agent in agents], dtype=np.float64)
+    manager.counters.clear()
+    samples = []
+    start = manager.clock.now
+    next_sample = start
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        while manager.clock.now - start < ticks:
+            if manager.clock.now >= next_sample:
+                samples.append([[manager.current_needs(agent)[need] for need in NEEDS] for agent in agents])
+                next_sample += SAMPLE_INTERVAL
+            manager.skip_quiet(max_ticks=min(ticks - (manager.clock.now - start), next_sample - manager.clock.now) - 1)
+            manager.tick(encode=False)
+    for agent in agents:
+        if agent.state == 'doing_action':
+            manager._settle_wages(agent)
+    money = np.array([agent.money for agent in agents], dtype=np.float64)
+
+    needs = np.array(samples, dtype=np.float64).reshape(-1, len(NEEDS))
+    row = {'agents': len(agents), 'ticks': ticks}
+    for i, need in enumerate(NEEDS):
+        row[f'{need}_mean'] = round(float(needs[:, i].mean()), 2)
+        row[f'{need}_p90'] = round(float(np.percentile(needs[:, i], 90)), 2)
+    row['money_mean'] = round(float(money.mean()), 2)
+    row['earned_mean'] = round(float((money - start_money).mean()), 2)
+    row['earned_min'] = round(float((money - start_money).min()), 2)
+    row.update((name, manager.counters[name]) for name in COUNTERS)
+    row['seconds'] = round(time.perf_counter() - started, 2)
+    return row
+
+def build_base(seed=BASE_SEED, agents=BASE_AGENTS, warmup=0, map_path=None, checkpoint=None):
+    """
+    The warmed-up base town as (manager, checkpoint blob, map data). Without a map or checkpoint
+    it is a town generated with room for `agents` agents (see trajectory.town); on a given map it
+    is the bundled agents cloned to `agents`.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        if checkpoint:
+            map_data = load_map_data(map_path or MAP_DATA_PATH)
+            with open(checkpoint, 'rb') as f:
+                manager = load_manager(f.read(), map_data['layout'], map_data['places'])
+        else:
+            if map_path:
+                map_data = load_map_data(map_path)
+                agent_config = population(agents, map_data)
+            else:
+                map_data, agent_config = town(agents, seed)
+            manager = AgentManager(map_data['layout'], map_data['places'], agent_config=agent_config, seed=seed)
+        manager.narrative_system = SilentNarrative()
+        for _ in range(warmup):
+            manager.tick(encode=False)
+    return manager, encode_checkpoint(manager), map_data
+
+def _init_worker(blob, map_data, manager):
+    _worker.update(blob=blob, map_data=map_data, manager=manager)
+
+def _run_one(task):
+    index, variant, ticks = task
+    manager = _worker.pop('manager', None)  # The forked base, used by this process's only variant
+    if manager is None or variant.get('map'):
+        map_data = load_map_data(variant['map']) if variant.get('map') else _worker['map_data']
+        with contextlib.redirect_stdout(io.StringIO()):
+            manager = load_manager(_worker['blob'], map_data['layout'], map_data['places'])
+        manager.narrative_system = SilentNarrative()
+    apply_variant(manager, variant)
+    return index, {'name': variant['name'], **run_variant(manager, ticks)}
+
+def run_sweep(base, variants, ticks=SWEEP_TICKS, processes=None, on_result=None):
+    """
+    Runs every variant from the base town (see build_base) on a process pool and returns the
+    rows in variant order. `on_result` is called with each row as it completes.
+    """
+    manager, blob, map_data = base
+    fork = 'fork' in multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if fork else 'spawn')
+    processes = min(processes or os.cpu_count() or 1, len(variants)) or 1
+    rows = [None] * len(variants)
+    with context.Pool(
+        processes, initializer=_init_worker, initargs=(blob, map_data, manager if fork else None),
+        maxtasksperchild=1 if fork else None,
+    ) as pool:
+        tasks = [(i, variant, ticks) for i, variant in enumerate(variants)]
+        for index, row in pool.imap_unordered(_run_one, tasks):
+            rows[index] = row
+            if on_result:
+                on_result(row)
+    return rows
+
+def format_table(rows):
+    """The rows as an aligned text table."""
+    columns = list(rows[0])
+    cells = [[str(row[column]) for column in columns] for row in rows]
+    widths = [max(len(column), *(len(line[i]) for line in cells)) for i, column in enumerate(columns)]
+    lines = ['  '.join(column.ljust(width) for column, width in zip(columns, widths))]
+    lines.extend('  '.join(cell.ljust(width) for cell, width in zip(line, widths)) for line in cells)
+    return '\n'.join(lines)
+
+def _resolve(base_dir, path):
+    return os.path.join(base_dir, path) if path else None
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs a scenario sweep and prints a table of per-variant metrics.")
+    parser.add_argument('spec', nargs='?', help="sweep file (JSON); without one, the default sweep is run")
+    parser.add_argument('--ticks', type=int, help=f"ticks per variant (default {SWEEP_TICKS})")
+    parser.add_argument('--processes', type=int, help="worker processes (default: one per core)")
+    parser.add_argument('--csv', help="also write the table to this CSV file")
+    args = parser.parse_args()
+
+    spec, base_dir = {'grid': DEFAULT_GRID}, os.getcwd()
+    if args.spec:
+        with open(args.spec, 'r') as f:
+            spec = json.load(f)
+        base_dir = os.path.dirname(os.path.abspath(args.spec))
+    base_spec = spec.get('base', {})
+    variants = expand_variants(spec.get('variants'), spec.get('grid'))
+    for variant in variants:
+        variant['map'] = _resolve(base_dir, variant.get('map'))
+    ticks = args.ticks or spec.get('ticks', SWEEP_TICKS)
+
+    started = time.perf_counter()
+    checkpoint = _resolve(base_dir, base_spec.get('checkpoint'))
+    base = build_base(
+        seed=base_spec.get('seed', BASE_SEED), agents=base_spec.get('agents', BASE_AGENTS),
+        warmup=base_spec.get('warmup', 0), map_path=_resolve(base_dir, base_spec.get('map')), checkpoint=checkpoint,
+    )
+    print(f"Base town: {len(base[0].agents)} agents, seed {base[0].seed}, "
+          f"{'restored from ' + checkpoint + ', ' if checkpoint else ''}{base_spec.get('warmup', 0)} warm-up ticks.")
+    print(f"Running {len(variants)} variants for {ticks} ticks each...")
+    done = []
+    rows = run_sweep(
+        base, variants, ticks=ticks, processes=args.processes,
+        on_result=lambda row: (done.append(row), print(f"  [{len(done)}/{len(variants)}] {row['name']} ({row['seconds']}s)")),
+    )
+    print(format_table(rows))
+    print(f"Sweep finished in {time.perf_counter() - started:.1f}s.")
+    if args.csv:
+        os.makedirs(os.path.dirname(os.path.abspath(args.csv)), exist_ok=True)
+        with open(args.csv, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"Wrote {args.csv}.")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# simulation/schedule.py
+# Compiles schedule templates and sleep rules into hour-by-day lookup tables.
+# Resolving an agent's scheduled activity becomes a single array index per tick.
+
+import numpy as np
+
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+WEEKEND_DAYS = {'Saturday', 'Sunday'}
+HOURS_PER_DAY = 24
+NO_ACTIVITY = -1
+SLEEP_ACTIVITY = "sleep_at_home"
+
+def hour_in_window(hour, start_hour, end_hour):
+    """Checks if an hour falls in [start_hour, end_hour), wrapping past midnight when end <= start."""
+    if start_hour < end_hour:
+        return start_hour <= hour < end_hour
+    return hour >= start_hour or hour < end_hour
+
+def sleep_window_for(personality_names, sleep_schedules):
+    """Returns the (start, end) sleep window of the first trait, in sleep_schedules order, that the agent has."""
+    for trait, window in sleep_schedules.items():
+        if trait != 'default' and trait in personality_names:
+            return window
+    return sleep_schedules['default']
+
+class CompiledSchedules:
+    """
+    Lookup tables of shape (7, 24) holding activity ids for every day of the week and hour.
+    Tables are compiled once per (schedule template, sleep window) pair and shared by agents.
+    Wrap-around entries such as (22, 1) cover the evening hours of their own day and the
+    early hours of the following day.
+    """
+    def __init__(self, schedule_templates, sleep_schedules, activities):
+        self.schedule_templates = schedule_templates
+        self.sleep_schedules = sleep_schedules
+        self.activities = activities
+        self._tables = {}
+
+    def _activity_id(self, name):
+        activity = self.activities.get(name)
+        if activity is None:
+            raise KeyError(f"Scheduled activity '{name}' is missing from ACTIVITY_DATA")
+        return activity.id
+
+    def table_for(self, template_name, personality_names):
+        """Returns the compiled table for a template and an agent's sleep rules."""
+        sleep_window = sleep_window_for(personality_names, self.sleep_schedules)
+        key = (template_name, sleep_window)
+        if key not in self._tables:
+            self._tables[key] = self._compile(self.schedule_templates[template_name], sleep_window)
+        return self._tables[key]
+
+    def _compile(self, template, sleep_window):
+        table = np.full((len(DAYS), HOURS_PER_DAY), NO_ACTIVITY, dtype=np.int16)
+
+        # Each day's own entries first, in template order, so earlier entries win overlaps.
+        spillover = []
+        for day_index, day_name in enumerate(DAYS):
+            entries = template.get('weekends' if day_name in WEEKEND_DAYS else 'weekdays', {})
+            for (start_hour, end_hour), activity in entries.items():
+                activity_id = self._activity_id(activity)
+                for hour in range(start_hour, end_hour if start_hour < end_hour else HOURS_PER_DAY):
+                    if table[day_index, hour] == NO_ACTIVITY:
+                        table[day_index, hour] = activity_id
+                if end_hour <= start_hour:
+                    spillover.append(((day_index + 1) % len(DAYS), end_hour, activity_id))
+
+        # Wrapped entries continue into the next morning where that day has nothing scheduled.
+        for day_index, end_hour, activity_id in spillover:
+            for hour in range(end_hour):
+                if table[day_index, hour] == NO_ACTIVITY:
+                    table[day_index, hour] = activity_id
+
+        # Sleep takes precedence over everything else.
+        start_hour, end_hour = sleep_window
+        for hour in range(HOURS_PER_DAY):
+            if hour_in_window(hour, start_hour, end_hour):
+                table[:, hour] = self._activity_id(SLEEP_ACTIVITY)
+        return table
+
+    def activity_name(self, activity_id):
+        """Maps a table entry back to an activity name, or None."""
+        return self.activities[activity_id].name if activity_id != NO_ACTIVITY else None
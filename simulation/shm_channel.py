@@ -0,0 +1,130 @@
+# simulation/shm_channel.py
+# Shared-memory ring buffer carrying per-tick binary agent frames (see frame_codec.py)
+# from a separate simulation process to the web server.
+#
+# Layout:
+#   header  24 bytes  magic b'TSHM', version u16, reserved u16, slots u32, slot_size u32,
+#                     latest committed seq u64
+#   slots   `slots` x (16-byte slot header: seq u64, length u32, padding; then slot_size payload bytes)
+#
+# The writer never waits for readers. Each slot works as a small seqlock: its seq is cleared
+# while the payload is written and set once the payload is complete, and the header seq is
+# published last. Readers always take the newest frame and skip anything older, so a slow
+# reader drops frames instead of slowing the simulation down.
+
+import struct
+from multiprocessing import shared_memory
+try:
+    import _posixshmem
+except ImportError:  # Windows, where a segment goes away with its last handle
+    _posixshmem = None
+
+DEFAULT_NAME = 'town_sim_frames'
+DEFAULT_SLOTS = 8
+RING_MAGIC = b'TSHM'
+RING_VERSION = 1
+HEADER = struct.Struct('<4sHHIIQ')
+SLOT_HEADER = struct.Struct('<QI4x')
+LATEST_SEQ = struct.Struct('<Q')
+LATEST_SEQ_OFFSET = HEADER.size - LATEST_SEQ.size
+
+def _attach(name):
+    """Attaches to an existing segment without letting this process's resource tracker own it."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 always tracks; unregister so exiting does not unlink the writer's segment
+        from multiprocessing import resource_tracker
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+class FrameRingWriter:
+    """
+    Creates the ring and writes frames into it; used by the simulation process.
+    `slot_size` must fit the largest frame, e.g. frame_codec.frame_size(agent_count).
+    """
+    def __init__(self, slot_size, name=DEFAULT_NAME, slots=DEFAULT_SLOTS):
+        self.slots = slots
+        self.slot_size = slot_size
+        self.stride = SLOT_HEADER.size + slot_size
+        size = HEADER.size + slots * self.stride
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # Left behind by a simulation that did not shut down cleanly
+            stale = _attach(name)
+            stale.close()
+            # Not stale.unlink(): _attach has already taken it off this process's resource tracker
+            if _posixshmem is not None:
+                _posixshmem.shm_unlink(stale._name)
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self.buf = self.shm.buf
+        HEADER.pack_into(self.buf, 0, RING_MAGIC, RING_VERSION, 0, slots, slot_size, 0)
+        self.seq = 0
+
+    def write(self, data):
+        """Publishes one frame and returns its sequence number."""
+        length = len(data)
+        if length > self.slot_size:
+            raise ValueError(f"Frame of {length} bytes does not fit a {self.slot_size}-byte slot")
+        self.seq += 1
+        offset = HEADER.size + (self.seq % self.slots) * self.stride
+        SLOT_HEADER.pack_into(self.buf, offset, 0, length)
+        payload = offset + SLOT_HEADER.size
+        self.buf[payload:payload + length] = data
+        SLOT_HEADER.pack_into(self.buf, offset, self.seq, length)
+        LATEST_SEQ.pack_into(self.buf, LATEST_SEQ_OFFSET, self.seq)
+        return self.seq
+
+    def close(self):
+        """Releases and removes the segment."""
+        self.buf = None
+        self.shm.close()
+        self.shm.unlink()
+
+class FrameRingReader:
+    """
+    Attaches to a ring created by FrameRingWriter and reads the newest frame in place.
+    Raises FileNotFoundError if the simulation has not created the ring yet.
+    """
+    def __init__(self, name=DEFAULT_NAME):
+        self.shm = _attach(name)
+        self.buf = self.shm.buf
+        magic, version, _, self.slots, self.slot_size, _ = HEADER.unpack_from(self.buf, 0)
+        if magic != RING_MAGIC or version != RING_VERSION:
+            self.close()
+            raise ValueError(f"Unsupported shared memory ring (magic={magic!r}, version={version})")
+        self.stride = SLOT_HEADER.size + self.slot_size
+        self.last_seq = 0
+        self.skipped = 0  # Frames overwritten before this reader got to them
+
+    def _slot_offset(self, seq):
+        return HEADER.size + (seq % self.slots) * self.stride
+
+    def read_latest(self):
+        """
+        Returns (seq, memoryview) for the newest frame not read yet, or None.
+        The view points into shared memory; call is_current(seq) after using it to make
+        sure the writer has not reused the slot in the meantime.
+        """
+        seq = LATEST_SEQ.unpack_from(self.buf, LATEST_SEQ_OFFSET)[0]
+        if seq <= self.last_seq:
+            return None
+        offset = self._slot_offset(seq)
+        slot_seq, length = SLOT_HEADER.unpack_from(self.buf, offset)
+        if slot_seq != seq:
+            return None  # Overwritten while we looked; the next call picks up the newer frame
+        if self.last_seq:
+            self.skipped += seq - self.last_seq - 1
+        self.last_seq = seq
+        payload = offset + SLOT_HEADER.size
+        return seq, self.buf[payload:payload + length]
+
+    def is_current(self, seq):
+        """Checks that the slot holding `seq` has not been overwritten since it was read."""
+        return SLOT_HEADER.unpack_from(self.buf, self._slot_offset(seq))[0] == seq
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
@@ -0,0 +1,73 @@
+# simulation/snapshot.py
+# Late-joiner snapshot cache for the web server.
+# Keeps what a newly connected browser needs (static map, latest world state, story history)
+# and serves it as one zlib-compressed JSON message, rebuilt only when something changed.
+
+import json
+import zlib
+
+COMPRESSION_LEVEL = 6
+
+class SnapshotCache:
+    """
+    Latest world snapshot built from the state the server already relays.
+    Agent records come from the InterestManager mirror, which is kept current by keyframes,
+    deltas and binary frames; world time, day and occupancy come from the last state payload.
+    The compressed message is cached per version, so any number of joiners between two
+    updates cost a single compression.
+    """
+    def __init__(self, interest, map_data):
+        self.interest = interest
+        self.map_data = map_data
+        self.stories = []
+        self.world = None  # seq, time, day_of_week and occupancy of the latest payload
+        self._version = 0
+        self._cached_version = None
+        self._cached = None
+
+    def record_state(self, payload):
+        """Notes world-level fields from a state payload (agents are read from the mirror)."""
+        world = dict(self.world or {})
+        world.update({key: payload[key] for key in ('seq', 'time', 'day_of_week') if key in payload})
+        if 'occupancy' in payload:
+            world['occupancy'] = payload['occupancy']
+        self.world = world
+        self._version += 1
+
+    def set_map(self, map_data):
+        """Replaces the static map, e.g. when the simulation registers its towns' maps."""
+        self.map_data = map_data
+        self._version += 1
+
+    def record_frame(self):
+        """Binary frames update agent positions in the mirror, so the snapshot is stale."""
+        self._version += 1
+
+    def add_story(self, story):
+        if not any(existing['day'] == story['day'] for existing in self.stories):
+            self.stories.append(story)
+            self._version += 1
+
+    def set_stories(self, stories):
+        """Replaces the history, e.g. with the full list from a reconnecting simulation."""
+        if len(stories) >= len(self.stories):
+            self.stories = list(stories)
+            self._version += 1
+
+    def state(self):
+        """The latest world state as a keyframe payload, or None before the first keyframe."""
+        if self.world is None or not self.interest.agents:
+            return None
+        return {
+            **self.world,
+            'keyframe': True,
+            'agents': list(self.interest.agents.values()),
+        }
+
+    def message(self):
+        """The compressed snapshot message for a new client."""
+        if self._cached_version != self._version:
+            snapshot = {'map': self.map_data, 'state': self.state(), 'stories': self.stories}
+            self._cached = zlib.compress(json.dumps(snapshot, separators=(',', ':')).encode(), COMPRESSION_LEVEL)
+            self._cached_version = self._version
+        return self._cached
@@ -0,0 +1,85 @@
+# simulation/state_encoder.py
+# Delta encoder for simulation state broadcasts.
+# Tracks the last snapshot sent and emits only changed agent fields, with periodic keyframes.
+
+# Display precision used by the frontend; smaller changes are not worth sending
+NEEDS_PRECISION = 0
+MONEY_PRECISION = 2
+
+class StateDeltaEncoder:
+    """
+    Builds state payloads for the frontend.
+    A keyframe carries every agent in full; a delta carries only the agents whose visible
+    state changed, with only the changed fields. Logs are served separately on demand.
+    Keyframes are sent every `keyframe_interval` frames and whenever one is requested,
+    for example when a new client connects.
+    Fields listed in `skip_fields` are left out of deltas because another channel
+    (binary frames, see frame_codec.py) already carries them.
+    """
+    def __init__(self, keyframe_interval=50, skip_fields=()):
+        self.keyframe_interval = keyframe_interval
+        self.skip_fields = frozenset(skip_fields)
+        self.seq = 0
+        self._frames_since_keyframe = 0
+        self._keyframe_requested = True
+        self._last_fields = {}     # Agent id -> dict of last sent dynamic fields
+        self._last_occupancy = None
+
+    def request_keyframe(self):
+        """Forces the next payload to be a full keyframe."""
+        self._keyframe_requested = True
+
+    @staticmethod
+    def dynamic_fields(agent):
+        """Fields that change during the simulation, rounded to display precision."""
+        return {
+            'x': agent.x,
+            'y': agent.y,
+            'state': agent.state,
+            'current_goal': agent.current_goal,
+            'current_action': agent.current_action,
+            'needs': {need: round(value, NEEDS_PRECISION) for need, value in agent.needs.items()},
+            'money': round(agent.money, MONEY_PRECISION),
+            'interacting_with': agent.interacting_with,
+        }
+
+    def encode(self, agents, world_state, occupancy):
+        """Returns the next payload: a keyframe or a delta against the previous payload."""
+        self.seq += 1
+        keyframe = self._keyframe_requested or self._frames_since_keyframe >= self.keyframe_interval
+        if keyframe:
+            self._keyframe_requested = False
+            self._frames_since_keyframe = 0
+        else:
+            self._frames_since_keyframe += 1
+
+        agent_payloads = []
+        for index, agent in enumerate(agents):
+            fields = self.dynamic_fields(agent)
+            if keyframe:
+                payload = agent.to_dict()
+                payload.update(fields)
+                payload['index'] = index  # Stable position used by binary frames and filtered views
+            else:
+                last = self._last_fields.get(agent.id, {})
+                payload = {
+                    key: value for key, value in fields.items()
+                    if key not in self.skip_fields and last.get(key) != value
+                }
+                if not payload:
+                    continue
+                payload['id'] = agent.id
+            self._last_fields[agent.id] = fields
+            agent_payloads.append(payload)
+
+        state_payload = {
+            'keyframe': keyframe,
+            'seq': self.seq,
+            'agents': agent_payloads,
+            'time': world_state['time'],
+            'day_of_week': world_state['day_of_week'],
+        }
+        if keyframe or occupancy != self._last_occupancy:
+            state_payload['occupancy'] = dict(occupancy)
+            self._last_occupancy = dict(occupancy)
+        return state_payload
@@ -0,0 +1,81 @@
+# simulation/timers.py
+# Tick clock and hierarchical timer wheel for action and conversation completions.
+# Busy agents are not visited by the tick until their timer fires; their remaining duration is
+# derived from the shared clock instead of being counted down.
+
+SLOT_BITS = 6
+SLOTS = 1 << SLOT_BITS  # Slots per wheel level
+LEVELS = 4              # Timers further out than SLOTS ** LEVELS ticks wait in an overflow list
+
+class TickClock:
+    """Number of the current tick, shared by a manager and its agents."""
+    __slots__ = ('now',)
+
+    def __init__(self, now=0):
+        self.now = now
+
+class TimerWheel:
+    """
+    Hierarchical timing wheel keyed by agent id, one timer per key.
+    Level 0 has one slot per tick for the next SLOTS ticks, level 1 one slot per SLOTS ticks,
+    and so on; whenever level 0 wraps, the next level's current slot is cascaded down.
+    Scheduling and cancelling are O(1) and advancing only touches timers that are due or
+    cascading. Rescheduling a key replaces its timer; superseded entries are skipped when
+    their slot comes up.
+    """
+    def __init__(self, now=0):
+        self.now = now
+        self.wheels = [[[] for _ in range(SLOTS)] for _ in range(LEVELS)]
+        self.overflow = []
+        self.due = {}  # Key -> tick its live timer fires at
+
+    def __len__(self):
+        return len(self.due)
+
+    def _insert(self, key, due):
+        delta = due - self.now
+        for level in range(LEVELS):
+            if delta < SLOTS << (SLOT_BITS * level):
+                self.wheels[level][(due >> (SLOT_BITS * level)) & (SLOTS - 1)].append((key, due))
+                return
+        self.overflow.append((key, due))
+
+    def schedule(self, key, due):
+        """Sets the key's timer to fire at tick `due` (the next tick at the earliest)."""
+        due = max(due, self.now + 1)
+        if self.due.get(key) == due:
+            return
+        self.due[key] = due
+        self._insert(key, due)
+
+    def cancel(self, key):
+        self.due.pop(key, None)
+
+    def _cascade(self):
+        for level in range(1, LEVELS):
+            slot = (self.now >> (SLOT_BITS * level)) & (SLOTS - 1)
+            entries, self.wheels[level][slot] = self.wheels[level][slot], []
+            for key, due in entries:
+                if self.due.get(key) == due:
+                    self._insert(key, due)
+            if slot:
+                return
+        entries, self.overflow = self.overflow, []
+        for key, due in entries:
+            if self.due.get(key) == due:
+                self._insert(key, due)
+
+    def advance(self, now):
+        """Moves the wheel to tick `now`; returns the keys whose timers fired on the way, in order."""
+        fired = []
+        while self.now < now:
+            self.now += 1
+            if not self.now & (SLOTS - 1):
+                self._cascade()
+            slot = self.now & (SLOTS - 1)
+            entries, self.wheels[0][slot] = self.wheels[0][slot], []
+            for key, due in entries:
+                if self.due.get(key) == due:
+                    del self.due[key]
+                    fired.append(key)
+        return fired
@@ -0,0 +1,263 @@
+# simulation/towns.py
+# Hosts many independent towns from one service.
+# Towns are packed onto a pool of worker processes; each worker ticks its towns in one loop
+# and hands their output, tagged with the town id, back to the supervisor through a queue.
+# Per-town tick timings are reported so towns can be packed onto cores by measured cost.
+
+import os
+import json
+import time
+import queue
+import multiprocessing
+from simulation.config import AGENT_CONFIG
+from simulation.rng import derive_seed
+from simulation.runner import BROADCAST_HZ, TICK_INTERVAL, SimulationPublisher, SimulationRunner
+from simulation.world import MAP_DATA_PATH, load_map_data
+
+DEFAULT_TOWN = 'main'      # Town id used when only one town is hosted
+STATS_INTERVAL = 5.0       # Seconds between per-town metric reports
+CONTROL_POLL_INTERVAL = 0.05
+
+def town_room(town_id):
+    """SocketIO room joined by the browsers watching a town."""
+    return f'town:{town_id}'
+
+def load_town_specs(spec):
+    """
+    Reads town definitions, each a dict with 'id', 'map_data' and 'agent_config'.
+    `spec` is either a number of copies of the default town (ids town1, town2, ...) or the
+    path of a JSON list like [{"id": "harbor", "map": "maps/harbor.json", "agents": "harbor_agents.json"}].
+    "map" and "agents" are optional and default to the bundled map and agents; relative paths
+    are resolved against the JSON file.
+    """
+    if str(spec).isdigit():
+        return [
+            {'id': f'town{i + 1}', 'map_data': load_map_data(), 'agent_config': AGENT_CONFIG}
+            for i in range(int(spec))
+        ]
+    base = os.path.dirname(os.path.abspath(spec))
+    with open(spec, 'r') as f:
+        entries = json.load(f)
+    specs = []
+    for entry in entries:
+        agent_config = AGENT_CONFIG
+        if entry.get('agents'):
+            with open(os.path.join(base, entry['agents']), 'r') as f:
+                agent_config = json.load(f)
+        map_path = os.path.join(base, entry['map']) if entry.get('map') else MAP_DATA_PATH
+        specs.append({'id': entry['id'], 'map_data': load_map_data(map_path), 'agent_config': agent_config})
+    if len({spec['id'] for spec in specs}) != len(specs):
+        raise ValueError("Town ids must be unique")
+    return specs
+
+def pack_towns(costs, workers):
+    """
+    Assigns towns to `workers` bins so the most loaded bin is as light as possible.
+    Greedy longest-processing-time packing: towns are placed heaviest first, each on the
+    currently lightest worker. `costs` maps town id -> cost (e.g. CPU share per tick).
+    """
+    bins = [[] for _ in range(max(1, workers))]
+    loads = [0.0] * len(bins)
+    for town_id, cost in sorted(costs.items(), key=lambda item: (-item[1], item[0])):
+        lightest = loads.index(min(loads))
+        bins[lightest].append(town_id)
+        loads[lightest] += cost
+    return [towns for towns in bins if towns]
+
+class QueuePublisher(SimulationPublisher):
+    """Forwards one town's output to the supervisor as (town_id, event, data, reliable) tuples."""
+    def __init__(self, town_id, output):
+        self.town_id = town_id
+        self.output = output
+
+    def _put(self, event, data, reliable=False):
+        self.output.put((self.town_id, event, data, reliable))
+
+    def state(self, payload):
+        self._put('simulation_state_update', payload)
+
+    def frame(self, data):
+        self._put('simulation_frame', data)
+
+    def log_lines(self, page):
+        self._put('agent_log_lines', page, reliable=True)
+
+    def history(self, page):
+        self._put('agent_history', page, reliable=True)
+
+    def daily_story(self, story):
+        self._put('new_daily_story', story, reliable=True)
+
+class TownMetrics:
+    """Tick timings of one town over the current reporting interval."""
+    def __init__(self):
+        self.ticks = 0
+        self.busy = 0.0      # Seconds spent stepping the town
+        self.max_tick = 0.0
+        self.total_ticks = 0
+
+    def record(self, seconds):
+        self.ticks += 1
+        self.total_ticks += 1
+        self.busy += seconds
+        self.max_tick = max(self.max_tick, seconds)
+
+    def report(self, elapsed):
+        """Returns the interval's metrics and starts a new interval."""
+        report = {
+            'ticks': self.total_ticks,
+            'tick_ms_mean': round(self.busy / self.ticks * 1e3, 3) if self.ticks else 0.0,
+            'tick_ms_max': round(self.max_tick * 1e3, 3),
+            'ticks_per_second': round(self.ticks / elapsed, 2) if elapsed else 0.0,
+            'cpu_share': round(self.busy / elapsed, 4) if elapsed else 0.0,  # Fraction of one core
+        }
+        self.ticks, self.busy, self.max_tick = 0, 0.0, 0.0
+        return report
+
+def _apply_control(runners, message):
+    """Applies a (town_id, command, data) message from the supervisor; town_id None means every town."""
+    town_id, command, data = message
+    targets = runners.values() if town_id is None else [runners[town_id]] if town_id in runners else []
+    for runner in targets:
+        if command == 'pause':
+            runner.pause()
+        elif command == 'resume':
+            runner.resume()
+        elif command == 'request_keyframe':
+            runner.request_keyframe()
+        elif command == 'request_history':
+            runner.request_history(data)
+        elif command == 'set_watched_agents':
+            runner.set_watched_agents(data)
+        elif command == 'set_observed':
+            runner.set_observed(data)
+        elif command == 'stop':
+            runner.stop()
+
+def run_town_worker(worker_id, specs, output, control, options):
+    """
+    Worker process: ticks every town in `specs`, each on its own schedule, in a single loop.
+    A town that falls behind carries on from now instead of bursting to catch up. Control
+    messages from the supervisor are applied between ticks.
+    """
+    runners, metrics, next_tick = {}, {}, {}
+    options = dict(options)
+    seed = options.pop('seed', None)
+    for spec in specs:
+        runner = SimulationRunner(
+            QueuePublisher(spec['id'], output), spec['map_data']['layout'], spec['map_data']['places'],
+            agent_config=spec['agent_config'], seed=None if seed is None else derive_seed(seed, 'town', spec['id']),
+            **options,
+        )
+        runners[spec['id']] = runner
+        metrics[spec['id']] = TownMetrics()
+        next_tick[spec['id']] = time.monotonic()
+    output.put((None, 'towns_ready', {'worker': worker_id, 'towns': list(runners)}, True))
+
+    last_report = time.monotonic()
+    while any(runner.running for runner in runners.values()):
+        town_id = min((t for t in runners if runners[t].running), key=next_tick.get)
+        delay = next_tick[town_id] - time.monotonic()
+        try:
+            # Waiting for the next tick doubles as waiting for control messages
+            message = control.get(timeout=min(max(delay, 0), CONTROL_POLL_INTERVAL)) if delay > 0 else control.get_nowait()
+            _apply_control(runners, message)
+            continue
+        except queue.Empty:
+            if delay > 0:
+                continue
+
+        runner = runners[town_id]
+        ticks = runner.tick_count
+        started = time.monotonic()
+        try:
+            runner.step()
+        except Exception as e:
+            print(f"Town '{town_id}' stopped after an error: {e}")
+            runner.stop()
+        finished = time.monotonic()
+        if runner.tick_count != ticks:  # Paused towns only answer requests
+            metrics[town_id].record(finished - started)
+        next_tick[town_id] += runner.tick_interval
+        if next_tick[town_id] < finished:
+            next_tick[town_id] = finished
+
+        if finished - last_report >= STATS_INTERVAL:
+            elapsed = finished - last_report
+            last_report = finished
+            output.put((None, 'town_stats', {
+                'worker': worker_id,
+                'towns': {
+                    t: {**metrics[t].report(elapsed), 'agents': len(runners[t].manager.agents), 'paused': runners[t].paused}
+                    for t in runners
+                },
+            }, True))
+    output.put((None, 'worker_stopped', {'worker': worker_id}, True))
+
+class TownSupervisor:
+    """
+    Runs many towns across a pool of worker processes.
+    Towns are packed onto `processes` workers by estimated cost (agent count) at start;
+    `suggest_packing()` repacks them using the CPU share each town was measured to need.
+    Town output arrives on `output` as (town_id, event, data, reliable); town_id is None for
+    supervisor events ('towns_ready', 'town_stats', 'worker_stopped'). With a `seed`, each town
+    runs with its own seed derived from it and the town id, so copies of a town still differ.
+    """
+    def __init__(self, specs, processes=None, tick_interval=TICK_INTERVAL, speed=1.0,
+                 broadcast_hz=BROADCAST_HZ, binary_frames=False, lod=False, skip_quiet=False, seed=None):
+        self.specs = {spec['id']: spec for spec in specs}
+        self.processes = processes or os.cpu_count() or 1
+        self.options = {
+            'tick_interval': tick_interval, 'speed': speed,
+            'broadcast_hz': broadcast_hz, 'binary_frames': binary_frames, 'lod': lod,
+            'skip_quiet': skip_quiet, 'seed': seed,
+        }
+        # Spawned, not forked: the supervisor may already hold sockets and threads
+        self.context = multiprocessing.get_context('spawn')
+        self.output = self.context.Queue()
+        self.workers = []        # (process, control queue, town ids)
+        self.town_worker = {}    # Town id -> index into self.workers
+        self.town_metrics = {}   # Town id -> latest metrics report
+
+    def start(self):
+        costs = {town_id: len(spec['agent_config']) for town_id, spec in self.specs.items()}
+        for worker_id, town_ids in enumerate(pack_towns(costs, self.processes)):
+            control = self.context.Queue()
+            process = self.context.Process(
+                target=run_town_worker, name=f'town-worker-{worker_id}', daemon=True,
+                args=(worker_id, [self.specs[t] for t in town_ids], self.output, control, self.options),
+            )
+            process.start()
+            self.workers.append((process, control, town_ids))
+            for town_id in town_ids:
+                self.town_worker[town_id] = worker_id
+        print(f"Started {len(self.specs)} towns on {len(self.workers)} worker processes.")
+
+    def send(self, town_id, command, data=None):
+        """Sends a control command to one town, or to every town if town_id is None."""
+        if town_id is None:
+            for _, control, _ in self.workers:
+                control.put((None, command, data))
+        elif town_id in self.town_worker:
+            self.workers[self.town_worker[town_id]][1].put((town_id, command, data))
+
+    def record_stats(self, report):
+        """Keeps the latest metrics from a 'town_stats' report."""
+        for town_id, metrics in report['towns'].items():
+            self.town_metrics[town_id] = {**metrics, 'worker': report['worker']}
+
+    def suggest_packing(self):
+        """Packing of towns onto workers based on measured CPU share, or None before any report."""
+        if not self.town_metrics:
+            return None
+        return pack_towns({t: m['cpu_share'] for t, m in self.town_metrics.items()}, self.processes)
+
+    def alive(self):
+        return any(process.is_alive() for process, _, _ in self.workers)
+
+    def stop(self, timeout=5.0):
+        self.send(None, 'stop')
+        for process, _, _ in self.workers:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
@@ -0,0 +1,156 @@
+# simulation/trajectory.py
+# Golden-trajectory regression check for changes that must not alter behavior, e.g. performance
+# refactors. Runs a generated town (see worldgen.py) headless from a fixed seed and compares
+# digests of every agent's state with the ones recorded in golden_trajectory.json, once with the
+# decide phase in the tick thread and once spread over a thread pool. Both runs must match the
+# recording. The town has room for every agent at every place's busiest hour, so the digests
+# follow the agents' decisions rather than queues for full places; a change to worldgen.py that
+# alters the town needs a new recording too. It also runs the bundled agents through a whole
+# night once tick by tick and once skipping quiet ticks (see AgentManager.skip_quiet); every
+# tick the skipping run does run must match.
+#
+#   python -m simulation.trajectory            check against the recording
+#   python -m simulation.trajectory --update   record new digests after an intended behavior change
+
+import argparse
+import contextlib
+import copy
+import hashlib
+import io
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from simulation.config import AGENT_CONFIG
+from simulation.manager import AgentManager
+from simulation.world import WorldIndex, load_map_data
+from simulation.worldgen import generate_map, generate_population, town_size
+
+GOLDEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden_trajectory.json')
+SEED = 20240601
+AGENTS = 48     # More than one decide chunk, so the thread pool really runs agents in parallel
+TICKS = 540     # 08:00 to 02:00; the 3 AM diaries would need the LLM
+WINDOW = 30     # Ticks per recorded digest
+WORKERS = 4
+NIGHT_TICKS = 750  # 08:00 to 09:00 the next day, diaries included
+
+def population(count, map_data):
+    """The bundled agents cloned up to `count`, each clone with its own id and home cell in its original's home area."""
+    world_index = WorldIndex(map_data['layout'], map_data['places'])
+    used = set()
+    agents = []
+    for i in range(count):
+        config = copy.deepcopy(AGENT_CONFIG[i % len(AGENT_CONFIG)])
+        if i >= len(AGENT_CONFIG):
+            config['id'] = f"{config['id']}_{i}"
+            config['name'] = f"{config['name']} {i}"
+        place = world_index.place_at(*config['home_pos'])
+        free = [cell for cell in world_index.place_cells[place] if cell not in used] if place else []
+        if free:
+            config['home_pos'] = free[i % len(free)]
+        used.add(tuple(config['home_pos']))
+        agents.append(config)
+    return agents
+
+def town(agents, seed=SEED):
+    """(map_data, agent configs) of a generated town just big enough for `agents` (see worldgen.town_size)."""
+    map_data = generate_map(*town_size(agents), seed, agents)
+    return map_data, generate_population(map_data, agents, seed)
+
+def _agent_digest_fields(manager, agent):
+    """What is compared per agent. Needs are settled lazily, so they are compared as if settled."""
+    settled = manager.current_needs(agent)
+    return (
+        agent.id, agent.x, agent.y, agent.state, agent.current_activity, agent.interacting_with,
+        agent.destination_name, agent.log_count,
+        tuple(round(value, 6) for value in settled.values()),
+        # Wages of a running action are paid lazily too; the balance is compared once it is paid
+        None if agent.state == 'doing_action' else round(agent.money, 6),
+    )
+
+def run_digests(seed=SEED, agents=AGENTS, ticks=TICKS, window=WINDOW, workers=0):
+    """Digests of the town's state, one per `window` ticks, each covering every tick of its window."""
+    map_data, agent_config = town(agents, seed)
+    executor = ThreadPoolExecutor(workers) if workers > 1 else None
+    with contextlib.redirect_stdout(io.StringIO()):
+        manager = AgentManager(
+            map_data['layout'], map_data['places'], agent_config=agent_config, executor=executor, seed=seed,
+        )
+    digests = []
+    digest = hashlib.sha256()
+    try:
+        for tick in range(1, ticks + 1):
+            with contextlib.redirect_stdout(io.StringIO()):
+                manager.tick(encode=False)
+            for agent in manager.agents.values():
+                digest.update(repr(_agent_digest_fields(manager, agent)).encode())
+            if tick % window == 0:
+                digests.append(digest.hexdigest()[:16])
+                digest = hashlib.sha256()
+    finally:
+        if executor:
+            executor.shutdown()
+    return digests
+
+def night_check(seed=SEED, agents=len(AGENT_CONFIG), ticks=NIGHT_TICKS):
+    """
+    Runs the town tick by tick and again skipping quiet ticks, comparing every agent after each
+    tick the skipping run ran. Returns (ticks skipped, first mismatching tick or None).
+    """
+    from simulation.scenarios import SilentNarrative  # Diaries would need the LLM
+    map_data = load_map_data()
+    config = population(agents, map_data)
+    expected = {}
+    skipped = 0
+    for skip in (False, True):
+        with contextlib.redirect_stdout(io.StringIO()):
+            manager = AgentManager(map_data['layout'], map_data['places'], agent_config=config, seed=seed)
+            manager.narrative_system = SilentNarrative()
+            while manager.clock.now < ticks:
+                if skip:
+                    skipped += manager.skip_quiet(ticks - 1 - manager.clock.now)
+                manager.tick(encode=False)
+                state = [_agent_digest_fields(manager, agent) for agent in manager.agents.values()]
+                if not skip:
+                    expected[manager.clock.now] = state
+                elif state != expected[manager.clock.now]:
+                    return skipped, manager.clock.now
+    return skipped, None
+
+def _first_mismatch(expected, actual, window):
+    for i, (want, got) in enumerate(zip(expected, actual)):
+        if want != got:
+            return f"ticks {i * window + 1}-{(i + 1) * window}"
+    return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--update', action='store_true', help="record new digests instead of checking")
+    args = parser.parse_args()
+
+    serial = run_digests()
+    threaded = run_digests(workers=WORKERS)
+    mismatch = _first_mismatch(serial, threaded, WINDOW)
+    if mismatch:
+        raise SystemExit(f"Threaded decide phase diverged from the serial one in {mismatch}.")
+    skipped, tick = night_check()
+    if tick is not None:
+        raise SystemExit(f"Skipping quiet ticks diverged from ticking every tick at tick {tick}.")
+    if args.update:
+        with open(GOLDEN_PATH, 'w') as f:
+            json.dump({'seed': SEED, 'agents': AGENTS, 'ticks': TICKS, 'window': WINDOW, 'digests': serial}, f, indent=2)
+            f.write('\n')
+        print(f"Recorded {len(serial)} digests to {GOLDEN_PATH}.")
+        return
+    with open(GOLDEN_PATH, 'r') as f:
+        golden = json.load(f)
+    if (golden['seed'], golden['agents'], golden['ticks'], golden['window']) != (SEED, AGENTS, TICKS, WINDOW):
+        raise SystemExit("The recording was made with other settings; run with --update.")
+    mismatch = _first_mismatch(golden['digests'], serial, WINDOW)
+    if mismatch:
+        raise SystemExit(f"Trajectory diverged from the recording in {mismatch}.")
+    print(f"Trajectory matches the recording ({TICKS} ticks, {AGENTS} agents, serial and {WORKERS} threads).")
+    print(f"Skipping quiet ticks matches ticking every tick ({skipped} of {NIGHT_TICKS} ticks skipped, "
+          f"{len(AGENT_CONFIG)} agents, 08:00 to 09:00 the next day).")
+
+if __name__ == '__main__':
+    main()
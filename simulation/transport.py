@@ -0,0 +1,130 @@
+# simulation/transport.py
+# Bounded, non-blocking outgoing message queues for SocketIO peers.
+# Producers (the simulation loop, server handlers) only ever enqueue; a sender task per peer
+# delivers messages at whatever pace the peer accepts, so slow peers never block producers.
+
+import threading
+from collections import deque
+
+DEFAULT_QUEUE_SIZE = 8  # State frames buffered per peer before the oldest is dropped
+STATE_UPDATE = 'simulation_state_update'
+FRAME = 'simulation_frame'
+
+def _merge_interest(entered, left, agents, newer):
+    """Applies a newer payload's entered/left lists on top of accumulated ones."""
+    for record in newer.get('entered', []):
+        entered[record['id']] = dict(record)
+        left.discard(record['id'])
+        agents.pop(record['id'], None)
+    for agent_id in newer.get('left', []):
+        agents.pop(agent_id, None)
+        if entered.pop(agent_id, None) is None:
+            left.add(agent_id)
+
+def merge_state_payloads(older, newer):
+    """
+    Combines two consecutive state payloads into one that leaves a client in the same state
+    as applying both in order. Used instead of dropping a delta, which would leave the
+    client out of sync until the next keyframe. Neither input is modified.
+    """
+    if newer.get('keyframe'):
+        return newer
+    merged = {key: value for key, value in newer.items() if key not in ('agents', 'entered', 'left')}
+    if 'occupancy' not in newer and 'occupancy' in older:
+        merged['occupancy'] = older['occupancy']
+
+    agents = {record['id']: dict(record) for record in older['agents']}
+    entered = {record['id']: dict(record) for record in older.get('entered', [])}
+    left = set(older.get('left', []))
+    _merge_interest(entered, left, agents, newer)
+    for delta in newer['agents']:
+        target = entered.get(delta['id'])
+        if target is None:
+            target = agents.setdefault(delta['id'], {})
+        target.update(delta)
+
+    if older.get('keyframe'):
+        # Still a keyframe: it lists every agent the client should hold
+        merged['keyframe'] = True
+        agents.update(entered)
+        merged['agents'] = [record for agent_id, record in agents.items() if agent_id not in left]
+        return merged
+    merged['agents'] = list(agents.values())
+    if 'entered' in older or 'entered' in newer:
+        merged['entered'] = list(entered.values())
+        merged['left'] = sorted(left)
+    return merged
+
+class OutboundQueue:
+    """
+    Outgoing messages for one peer.
+    State updates and binary frames are droppable: once `maxsize` of them are queued, the
+    oldest binary frame is discarded (each frame is complete on its own) or the oldest
+    state update is merged into the next one. Everything else (daily stories, history
+    pages, log lines, interest changes) is reliable and never dropped; those are rare.
+    """
+    def __init__(self, maxsize=DEFAULT_QUEUE_SIZE):
+        self.maxsize = maxsize
+        self.messages = deque()  # (event, data, reliable)
+        self.cond = threading.Condition()
+        self.closed = False
+        self.sent = 0
+        self.dropped = 0  # State messages dropped or merged away
+        self.high_water = 0
+
+    def __len__(self):
+        return len(self.messages)
+
+    def put(self, event, data, reliable=False):
+        """Enqueues a message without ever blocking."""
+        with self.cond:
+            if self.closed:
+                return
+            if not reliable:
+                data = self._make_room(event, data)
+            self.messages.append((event, data, reliable))
+            self.high_water = max(self.high_water, len(self.messages))
+            self.cond.notify()
+
+    def _make_room(self, event, data):
+        """Drops the oldest queued message of this kind if the queue is full; returns `data` to enqueue."""
+        queued = [i for i, (queued_event, _, reliable) in enumerate(self.messages) if not reliable and queued_event == event]
+        if len(queued) < self.maxsize:
+            return data
+        oldest = queued[0]
+        _, oldest_data, _ = self.messages[oldest]
+        if event == STATE_UPDATE:
+            if len(queued) > 1:
+                following = queued[1]
+                next_event, next_data, next_reliable = self.messages[following]
+                self.messages[following] = (next_event, merge_state_payloads(oldest_data, next_data), next_reliable)
+            else:
+                data = merge_state_payloads(oldest_data, data)
+        del self.messages[oldest]
+        self.dropped += 1
+        return data
+
+    def get(self, timeout=None):
+        """Returns the next (event, data) pair, or None if none arrived within `timeout`."""
+        with self.cond:
+            if not self.messages and not self.closed:
+                self.cond.wait(timeout)
+            if not self.messages:
+                return None
+            event, data, _ = self.messages.popleft()
+            self.sent += 1
+            return event, data
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.messages.clear()
+            self.cond.notify_all()
+
+    def stats(self):
+        return {
+            'depth': len(self.messages),
+            'high_water': self.high_water,
+            'sent': self.sent,
+            'dropped': self.dropped,
+        }
@@ -0,0 +1,93 @@
+# simulation/world.py
+# Precompiled world geometry index built once from the map layout and place data.
+# Provides O(1) place membership tests, cell-to-place lookups and agent home areas.
+
+import os
+import json
+import numpy as np
+
+NO_PLACE = -1
+MAP_DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static', 'map_data.json')
+
+def load_map_data(path=MAP_DATA_PATH):
+    """
+    Reads the town map (layout, cell types and places) from map_data.json.
+    Place coordinates are converted to tuples for hashability. Used by both the server and
+    the standalone simulation, so loading a world never needs the web app.
+    """
+    with open(path, 'r') as f:
+        map_data = json.load(f)
+    for place_data in map_data['places'].values():
+        place_data['coords'] = [tuple(coord) for coord in place_data['coords']]
+    return map_data
+
+class WorldIndex:
+    """
+    Static geometry index for the town map.
+    Holds a cell -> place-id NumPy grid (place masks are derived from it on demand),
+    per-place coordinate sets, and the home area of every registered agent.
+    """
+    def __init__(self, world_layout, places_data):
+        self.rows = len(world_layout)
+        self.cols = len(world_layout[0]) if self.rows else 0
+
+        self.place_names = list(places_data.keys())
+        self.place_ids = {name: i for i, name in enumerate(self.place_names)}
+
+        self.place_grid = np.full((self.rows, self.cols), NO_PLACE, dtype=np.int16)
+        self.place_cells = {}   # Ordered cells, in map_data.json order
+        self.place_coords = {}  # Same cells as a set for membership tests
+        for name, place_data in places_data.items():
+            cells = tuple(tuple(coord) for coord in place_data.get('coords', []))
+            self.place_cells[name] = cells
+            self.place_coords[name] = frozenset(cells)
+            if cells:
+                xs, ys = np.array(cells, dtype=np.int64).T
+                inside = (ys >= 0) & (ys < self.rows) & (xs >= 0) & (xs < self.cols)
+                self.place_grid[ys[inside], xs[inside]] = self.place_ids[name]
+
+        # Plain Python copy of the grid for fast scalar lookups inside the tick
+        self._cell_place = self.place_grid.tolist()
+
+        self.agent_home_place = {}
+        self.agent_home_cells = {}
+        self.agent_home_coords = {}
+
+    def place_mask(self, name):
+        """Boolean (rows, cols) mask of a place's cells."""
+        return self.place_grid == self.place_ids[name]
+
+    def place_id_at(self, x, y):
+        """Returns the place id of a cell, or NO_PLACE."""
+        if 0 <= y < self.rows and 0 <= x < self.cols:
+            return self._cell_place[y][x]
+        return NO_PLACE
+
+    def place_at(self, x, y):
+        """Returns the name of the place covering a cell, or None."""
+        place_id = self.place_id_at(x, y)
+        return self.place_names[place_id] if place_id != NO_PLACE else None
+
+    def is_in_place(self, pos, place_name):
+        """Checks whether a position lies inside the named place."""
+        coords = self.place_coords.get(place_name)
+        return coords is not None and pos in coords
+
+    def register_home(self, agent_id, home_pos):
+        """Resolves and stores the home area for an agent from its home position."""
+        home_pos = tuple(home_pos)
+        place_name = self.place_at(*home_pos)
+        self.agent_home_place[agent_id] = place_name
+        # Fallback to the exact home position when it is not inside a known place
+        cells = self.place_cells[place_name] if place_name else (home_pos,)
+        self.agent_home_cells[agent_id] = cells
+        self.agent_home_coords[agent_id] = frozenset(cells)
+        return place_name
+
+    def home_cells(self, agent_id):
+        """Returns the ordered cells that count as home for an agent."""
+        return self.agent_home_cells[agent_id]
+
+    def is_at_home(self, agent):
+        """Checks whether an agent is standing inside its home area."""
+        return (agent.x, agent.y) in self.agent_home_coords[agent.id]
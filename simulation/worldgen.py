@@ -0,0 +1,361 @@
+# simulation/worldgen.py
+# Procedural towns and populations, for measuring how the simulation scales.
+# Maps of any size get the bundled map's road grid: 3x3 blocks of place cells between one-cell
+# roads. Blocks are grouped into neighbourhoods, each a core of services ringed by houses; the
+# houses of a neighbourhood form one home area. Activities name one place per kind (e.g.
+# 'downtown_cafe'), so the cafes of every neighbourhood are cells of that one place.
+# Populations are sampled from archetypes modelled on the bundled agents, with homes in the
+# generated home areas and a sparse relationship graph of neighbours, colleagues and friends.
+# The output uses the schema the manager loads: map_data.json and an AGENT_CONFIG-style list.
+#
+#   python -m simulation.worldgen --agents 2000 --out worlds/big
+#
+# writes worlds/big/map.json, agents.json and towns.json; run it with TOWNS=worlds/big/towns.json.
+# Generating 100,000 agents takes seconds, but running them does not fit: each agent takes about
+# AGENT_MEMORY_KB once initialised, and every route is a BFS over the whole map.
+
+import argparse
+import json
+import math
+import os
+import time
+import numpy as np
+from simulation.activities import ACTIVITIES
+from simulation.config import SCHEDULE_TEMPLATES, SLEEP_SCHEDULES
+from simulation.rng import derive_seed
+from simulation.schedule import DAYS, HOURS_PER_DAY, CompiledSchedules
+from simulation.world import MAP_DATA_PATH
+
+BLOCK = 3              # Side of a block of place cells
+PITCH = BLOCK + 1      # A block and the road after it
+NEIGHBOURHOOD = 10     # Blocks along each side of a neighbourhood, before the borders are jittered
+MIN_SIDE = 4           # Blocks along each side of the smallest town town_size suggests
+HOUSES_TYPE = 'Residential Houses'
+STUDENT_HOME = 'student_accommodation'
+
+GRASS_SHARE = 0.04     # Blocks left as open grass
+MIN_SHARE = 0.01       # Blocks of a place nobody is scheduled at, like the supply store
+CAPACITY_SLACK = 1.1   # Room over a kind's expected peak, for the archetypes actually drawn
+AGENT_MEMORY_KB = 50   # Memory of an initialised agent, measured in a 10,000-agent town
+
+# Place kind -> (cell type, place type). Houses are the kind 'houses'; None is open grass.
+PLACE_KINDS = {
+    'houses': ('H', HOUSES_TYPE),
+    'business_office': ('O', 'Business Office'),
+    STUDENT_HOME: ('A', 'Student Accommodation'),
+    'college_campus': ('L', 'College Campus'),
+    'downtown_cafe': ('C', 'Downtown Cafe'),
+    'central_park': ('K', 'Central Park'),
+    'fitness_gym': ('Y', 'Fitness Gym'),
+    'nightlife_bar': ('B', 'Nightlife Bar'),
+    'grocery_store': ('F', 'Grocery Store'),
+    'supply_store': ('S', 'Supply Store'),
+    None: ('G', None),
+}
+
+# Archetypes modelled on the bundled agents: schedule template, work location, home, first trait, weight
+ARCHETYPES = [
+    ('office_worker_extrovert', 'business_office', 'houses', 'extrovert', 0.25),
+    ('workaholic_ambitious', 'business_office', 'houses', 'workaholic', 0.10),
+    ('fitness_enthusiast', 'business_office', 'houses', 'fitness_enthusiast', 0.12),
+    ('lazy_sleeper', 'business_office', 'houses', 'lazy', 0.08),
+    ('cafe_worker_social', 'downtown_cafe', 'houses', 'social_butterfly', 0.15),
+    ('student_conscientious', 'college_campus', STUDENT_HOME, 'conscientious', 0.30),
+]
+TRAITS = ['extrovert', 'introvert', 'agreeable', 'conscientious', 'curious', 'spontaneous',
+          'fitness_enthusiast', 'workaholic', 'lazy', 'social_butterfly']
+CONFLICTS = [('extrovert', 'introvert'), ('conscientious', 'spontaneous'), ('workaholic', 'lazy')]
+EXTRA_TRAITS = 2       # Traits sampled on top of the archetype's
+
+# Relationship type -> inclusive affinity range
+AFFINITY = {
+    'neighbor': (50, 70), 'roommate': (65, 90), 'colleague': (55, 80), 'classmate': (55, 75),
+    'friend': (70, 95), 'acquaintance': (40, 60),
+}
+FIRST_NAMES = ['Alex', 'Bella', 'Charlie', 'Diana', 'Ethan', 'Fiona', 'George', 'Hana', 'Ivan', 'Julia',
+               'Kofi', 'Lena', 'Mateo', 'Nora', 'Omar', 'Priya', 'Quinn', 'Rosa', 'Sami', 'Tara',
+               'Umar', 'Vera', 'Wei', 'Ximena', 'Yusuf', 'Zoe']
+LAST_NAMES = ['Rodriguez', 'Chen', 'Davis', 'Kim', 'Brooks', 'Walsh', 'Okafor', 'Novak', 'Haddad', 'Silva',
+              'Tanaka', 'Muller', 'Singh', 'Rossi', 'Larsen', 'Petrov', 'Nguyen', 'Garcia', 'Cohen', 'Ibrahim']
+COLORS = ['#FF6B6B', '#4ECDC4', '#45B7D1', '#96CEB4', '#FECA57', '#FF9FF3', '#54A0FF', '#5F27CD',
+          '#1DD1A1', '#FF9F43', '#C8D6E5', '#EE5253']
+
+def _generator(seed, name):
+    return np.random.default_rng(derive_seed(seed, 'worldgen', name))
+
+def peak_demand():
+    """
+    Place kind -> share of the population there at the kind's busiest hour of the week, from
+    the archetypes' schedules. Homes count for everyone, so houses and the student
+    accommodation hold their residents.
+    """
+    schedules = CompiledSchedules(SCHEDULE_TEMPLATES, SLEEP_SCHEDULES, ACTIVITIES)
+    demand = {kind: np.zeros((len(DAYS), HOURS_PER_DAY)) for kind in PLACE_KINDS if kind is not None}
+    for template, _, home, trait, weight in ARCHETYPES:
+        table = schedules.table_for(template, [trait])
+        locations = {a.id: home if a.location == 'home' else a.location for a in ACTIVITIES.activities}
+        for (day, hour), activity_id in np.ndenumerate(table):
+            location = locations.get(activity_id, home)  # Unscheduled hours are spent at home
+            if location in demand:
+                demand[location][day, hour] += weight
+        demand[home] += weight * (demand[home] == 0)
+    return {kind: float(hours.max()) for kind, hours in demand.items()}
+
+def block_shares():
+    """Place kind -> share of a town's blocks, proportional to peak demand."""
+    demand = {kind: max(peak, MIN_SHARE) for kind, peak in peak_demand().items()}
+    total = sum(demand.values())
+    shares = {kind: (1.0 - GRASS_SHARE) * peak / total for kind, peak in demand.items()}
+    shares[None] = GRASS_SHARE
+    return shares
+
+def minimum_blocks(agents=None):
+    """
+    Place kind -> blocks a town needs so that `agents` find a cell of the kind at its busiest
+    hour, with CAPACITY_SLACK to spare. Every kind gets a block; grass needs none.
+    """
+    minimum = {kind: 1 for kind in PLACE_KINDS}
+    minimum[None] = 0
+    for kind, peak in peak_demand().items():
+        minimum[kind] = max(1, math.ceil(peak * (agents or 0) * CAPACITY_SLACK / (BLOCK * BLOCK)))
+    return minimum
+
+def block_counts(blocks, agents=None):
+    """
+    Place kind -> blocks of a town with `blocks` blocks: each kind's minimum_blocks, and the
+    rest shared out by largest remainder so the counts come as close to block_shares as they can.
+    """
+    minimum = minimum_blocks(agents)
+    spare = blocks - sum(minimum.values())
+    if spare < 0:
+        raise ValueError(f"A town with {blocks} blocks cannot hold {agents} agents; it needs {blocks - spare} or more")
+    shares = block_shares()
+    # Micro-blocks, so the integer apportioning sees the shares' proportions
+    wanted = [max(0, round((shares[kind] * blocks - minimum[kind]) * 1_000_000)) for kind in PLACE_KINDS]
+    extra = _apportion(wanted, spare) if spare else [0] * len(wanted)
+    return {kind: minimum[kind] + int(count) for kind, count in zip(PLACE_KINDS, extra)}
+
+def _apportion(weights, total):
+    """Splits `total` in proportion to integer `weights` by largest remainder."""
+    weights = np.asarray(weights, dtype=np.int64)
+    counts, remainders = np.divmod(weights * total, weights.sum())
+    counts[np.argsort(-remainders, kind='stable')[:total - counts.sum()]] += 1
+    return counts
+
+def town_size(agents):
+    """(cols, rows) of a square town with a cell for everyone at every place's busiest hour."""
+    blocks = sum(minimum_blocks(agents).values()) / (1.0 - GRASS_SHARE)
+    side = max(MIN_SIDE, math.ceil(math.sqrt(blocks)))
+    return PITCH * side + 3, PITCH * side + 3
+
+def generate_map(cols, rows, seed=0, agents=None):
+    """
+    A map_data dict (layout, cell_types, places) for a cols x rows town, as load_map_data
+    returns it. Roads run along every fourth row and column inside a border of grass. With
+    `agents`, every kind of place has room for them at its busiest hour (see block_counts).
+    """
+    rng = _generator(seed, 'map')
+    bx, by = (cols - 3) // PITCH, (rows - 3) // PITCH
+    if bx * by < len(PLACE_KINDS):
+        raise ValueError(f"A {cols}x{rows} town has room for {bx * by} blocks; it needs {len(PLACE_KINDS)} or more")
+    layout = np.full((rows, cols), 'G', dtype='<U1')
+    layout[1:PITCH * by + 2:PITCH, 1:PITCH * bx + 2] = 'P'
+    layout[1:PITCH * by + 2, 1:PITCH * bx + 2:PITCH] = 'P'
+
+    # Neighbourhoods: every block joins the nearest of one jittered centre per NEIGHBOURHOOD x NEIGHBOURHOOD blocks
+    nx, ny = max(1, round(bx / NEIGHBOURHOOD)), max(1, round(by / NEIGHBOURHOOD))
+    centres = np.stack([
+        (np.arange(nx)[None, :].repeat(ny, 0).ravel() + rng.random(nx * ny)) * bx / nx,
+        (np.arange(ny)[:, None].repeat(nx, 1).ravel() + rng.random(nx * ny)) * by / ny,
+    ], axis=1)
+    block_x, block_y = np.meshgrid(np.arange(bx) + 0.5, np.arange(by) + 0.5)
+    block_x, block_y = block_x.ravel(), block_y.ravel()
+    distance = np.full(bx * by, np.inf)
+    hood = np.zeros(bx * by, dtype=np.int64)
+    for i, (x, y) in enumerate(centres):
+        d = np.hypot(block_x - x, block_y - y)
+        closer = d < distance
+        distance[closer], hood[closer] = d[closer], i
+
+    # Every neighbourhood gets the town's blocks of each kind in proportion to its size.
+    # Services take the blocks nearest its centre, houses and grass the rest.
+    kinds = list(PLACE_KINDS)
+    houses, grass = kinds.index('houses'), kinds.index(None)
+    service_kinds = [kinds.index(kind) for kind in kinds if kind not in ('houses', None)]
+    remaining = np.array(list(block_counts(bx * by, agents).values()), dtype=np.int64)  # Blocks per kind not yet placed
+    block_kind = np.full(bx * by, houses, dtype=np.int64)  # Index into `kinds`
+    for i in range(len(centres)):
+        members = np.flatnonzero(hood == i)
+        if not len(members):
+            continue
+        members = members[np.argsort(distance[members] + rng.random(len(members)))]
+        # The last neighbourhood takes whatever is left, so the town's counts come out exact
+        counts = _apportion(remaining, len(members))
+        remaining -= counts
+        services = np.repeat(service_kinds, counts[service_kinds])
+        rng.shuffle(services)
+        outskirts = np.repeat([houses, grass], counts[[houses, grass]])
+        rng.shuffle(outskirts)
+        block_kind[members] = np.concatenate([services, outskirts])
+    if agents:
+        capacity = np.bincount(block_kind, minlength=len(kinds)) * BLOCK * BLOCK
+        for kind, peak in peak_demand().items():
+            assert capacity[kinds.index(kind)] >= peak * agents, f"{capacity[kinds.index(kind)]} {kind} cells for {peak * agents:.0f} agents"
+
+    letters = np.array([PLACE_KINDS[kind][0] for kind in kinds])
+    block_letters = letters[block_kind].reshape(by, bx)
+    for dy in range(BLOCK):
+        for dx in range(BLOCK):
+            layout[2 + dy:PITCH * by + 2:PITCH, 2 + dx:PITCH * bx + 2:PITCH] = block_letters
+
+    # Place cells, block by block in row-major order
+    origin_x = 2 + PITCH * (np.arange(bx * by) % bx)
+    origin_y = 2 + PITCH * (np.arange(bx * by) // bx)
+    offset_y, offset_x = np.divmod(np.arange(BLOCK * BLOCK), BLOCK)
+    cell_x = (origin_x[:, None] + offset_x[None, :]).tolist()
+    cell_y = (origin_y[:, None] + offset_y[None, :]).tolist()
+    places = {kinds[kind]: {'type': PLACE_KINDS[kinds[kind]][1], 'coords': []} for kind in service_kinds}
+    for block, (kind, home_area) in enumerate(zip(block_kind.tolist(), hood.tolist())):
+        if kind == grass:
+            continue
+        name = kinds[kind] if kind != houses else f'houses_{home_area}'
+        if name not in places:
+            places[name] = {'type': HOUSES_TYPE, 'coords': []}
+        places[name]['coords'].extend(zip(cell_x[block], cell_y[block]))
+
+    with open(MAP_DATA_PATH, 'r') as f:
+        cell_types = json.load(f)['cell_types']
+    return {'layout': layout.tolist(), 'cell_types': cell_types, 'places': places}
+
+def _ring_edges(group, rng):
+    """Edges joining the members of every group in a random cycle: about two per member."""
+    order = np.lexsort((rng.random(len(group)), group))
+    keys = group[order]
+    same = keys[1:] == keys[:-1]
+    sources, targets = [order[:-1][same]], [order[1:][same]]
+    starts = np.flatnonzero(np.r_[True, ~same])
+    ends = np.r_[starts[1:], len(order)] - 1
+    closing = ends - starts >= 2  # Groups of three or more close their cycle
+    sources.append(order[ends[closing]])
+    targets.append(order[starts[closing]])
+    return np.concatenate(sources), np.concatenate(targets)
+
+def generate_population(map_data, count, seed=0):
+    """
+    `count` agent configs for a map, in the form of AGENT_CONFIG plus each agent's own
+    'relationships'. Residents live in the 'Residential Houses' places and students in the
+    student accommodation; a cell is only shared once every cell of its kind is taken.
+    """
+    rng = _generator(seed, 'population')
+    # Archetypes in the proportions of their weights, which is what the map's capacity is made for
+    archetype = rng.permutation(np.repeat(np.arange(len(ARCHETYPES)), _apportion([round(a[4] * 1000) for a in ARCHETYPES], count)))
+
+    # Homes: shuffled cells handed out in turn. A resident's home area is the houses place it lives in.
+    home = np.zeros((count, 2), dtype=np.int64)
+    area = np.full(count, -1, dtype=np.int64)  # Index into `houses`
+    houses = [place for place in map_data['places'].values() if place['type'] == HOUSES_TYPE]
+    for home_kind in ('houses', STUDENT_HOME):
+        if home_kind == 'houses':
+            places = houses
+        else:
+            places = [map_data['places'][STUDENT_HOME]] if STUDENT_HOME in map_data['places'] else []
+        cells = [cell for place in places for cell in place['coords']]
+        if not cells:
+            raise ValueError(f"The map has no {'houses' if home_kind == 'houses' else STUDENT_HOME}")
+        members = np.flatnonzero(np.isin(archetype, [i for i, a in enumerate(ARCHETYPES) if a[2] == home_kind]))
+        picks = rng.permutation(len(cells))[np.arange(len(members)) % len(cells)]
+        home[members] = np.array(cells)[picks]
+        if home_kind == 'houses':
+            area[members] = np.repeat(np.arange(len(places)), [len(place['coords']) for place in places])[picks]
+    # A student's home area is the one whose houses lie nearest its accommodation block, on average
+    students = np.flatnonzero(area < 0)
+    if len(students):
+        centres = np.array([np.mean(place['coords'], axis=0) for place in houses])
+        blocks, inverse = np.unique(home[students] // PITCH, axis=0, return_inverse=True)
+        offsets = (blocks * PITCH + PITCH / 2)[:, None, :] - centres[None, :, :]
+        area[students] = np.hypot(offsets[..., 0], offsets[..., 1]).argmin(axis=1)[inverse.ravel()]
+
+    # Traits: the archetype's first, then EXTRA_TRAITS others that do not contradict it
+    first = np.array([TRAITS.index(a[3]) for a in ARCHETYPES])[archetype]
+    allowed = np.ones((len(TRAITS), len(TRAITS)), dtype=bool)
+    np.fill_diagonal(allowed, False)
+    for a, b in CONFLICTS:
+        allowed[TRAITS.index(a), TRAITS.index(b)] = allowed[TRAITS.index(b), TRAITS.index(a)] = False
+    extra = np.argsort(np.where(allowed[first], rng.random((count, len(TRAITS))), 2.0), axis=1)[:, :EXTRA_TRAITS]
+    # A drawn pair can contradict itself; its second trait then goes
+    contradictory = ~allowed[extra[:, 0], extra[:, 1]]
+
+    # Relationships: neighbours and roommates share a home area, colleagues a work place too
+    ids = [f'p{i:0{len(str(count - 1))}d}' for i in range(count)]
+    hood = area
+    student = np.array([a[2] == STUDENT_HOME for a in ARCHETYPES])[archetype]
+    work = np.array([['business_office', 'downtown_cafe', 'college_campus'].index(a[1]) for a in ARCHETYPES])[archetype]
+    layers = [
+        (hood * 2 + student, np.where(student, 'roommate', 'neighbor')),
+        (hood * 3 + work, np.where(work == 2, 'classmate', 'colleague')),
+        (np.zeros(count, dtype=np.int64), None),
+    ]
+    relationships = [{} for _ in range(count)]
+    for group, kinds in layers:
+        sources, targets = _ring_edges(group, rng)
+        if kinds is None:
+            kinds = np.where(rng.random(count) < 0.5, 'friend', 'acquaintance')
+        kinds = kinds[sources]
+        low = np.array([AFFINITY[kind][0] for kind in kinds.tolist()], dtype=np.int64)
+        high = np.array([AFFINITY[kind][1] for kind in kinds.tolist()], dtype=np.int64)
+        affinity = rng.integers(low, high + 1) if len(low) else low
+        for a, b, kind, value in zip(sources.tolist(), targets.tolist(), kinds.tolist(), affinity.tolist()):
+            if ids[b] not in relationships[a]:
+                relationships[a][ids[b]] = relationships[b][ids[a]] = {'type': kind, 'affinity': value}
+
+    first_names = rng.integers(len(FIRST_NAMES), size=count).tolist()
+    last_names = rng.integers(len(LAST_NAMES), size=count).tolist()
+    colors = rng.integers(len(COLORS), size=count).tolist()
+    agents = []
+    for i, (kind, x, y, trait, (t1, t2), drop) in enumerate(zip(
+        archetype.tolist(), home[:, 0].tolist(), home[:, 1].tolist(), first.tolist(), extra.tolist(), contradictory.tolist()
+    )):
+        template, work_location, _, _, _ = ARCHETYPES[kind]
+        first_name, last_name = FIRST_NAMES[first_names[i]], LAST_NAMES[last_names[i]]
+        agents.append({
+            'id': ids[i], 'name': f'{first_name} {last_name}', 'icon': first_name[0] + last_name[0],
+            'color': COLORS[colors[i]], 'home_pos': (x, y),
+            'personality': [TRAITS[trait], TRAITS[t1]] if drop else [TRAITS[trait], TRAITS[t1], TRAITS[t2]],
+            'schedule_template': template, 'work_location': work_location,
+            'relationships': relationships[i],
+        })
+    return agents
+
+def main():
+    parser = argparse.ArgumentParser(description="Generates a town map and population.")
+    parser.add_argument('--agents', type=int, default=1000, help="number of agents (default 1000)")
+    parser.add_argument('--size', help="map size as COLSxROWS (default: just big enough to house everyone)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', required=True, help="directory for map.json, agents.json and towns.json")
+    args = parser.parse_args()
+
+    cols, rows = (int(n) for n in args.size.split('x')) if args.size else town_size(args.agents)
+    started = time.perf_counter()
+    try:
+        map_data = generate_map(cols, rows, args.seed, args.agents)
+    except ValueError as e:
+        parser.error(str(e))
+    mapped = time.perf_counter()
+    agents = generate_population(map_data, args.agents, args.seed)
+    populated = time.perf_counter()
+    print(f"Generated a {cols}x{rows} map with {len(map_data['places'])} places in {mapped - started:.2f}s "
+          f"and {len(agents)} agents with {sum(map(len, (a['relationships'] for a in agents))) // 2} relationships "
+          f"in {populated - mapped:.2f}s.")
+
+    os.makedirs(args.out, exist_ok=True)
+    with open(os.path.join(args.out, 'map.json'), 'w') as f:
+        json.dump(map_data, f, separators=(',', ':'))
+    with open(os.path.join(args.out, 'agents.json'), 'w') as f:
+        json.dump(agents, f, separators=(',', ':'))
+    with open(os.path.join(args.out, 'towns.json'), 'w') as f:
+        json.dump([{'id': 'generated', 'map': 'map.json', 'agents': 'agents.json'}], f, indent=2)
+    print(f"Wrote {args.out} in {time.perf_counter() - populated:.2f}s. Run it with "
+          f"TOWNS={os.path.join(args.out, 'towns.json')}; it needs about {len(agents) * AGENT_MEMORY_KB / 1024:.0f} MB.")
+
+if __name__ == '__main__':
+    main()
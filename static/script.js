@@ -11,16 +11,29 @@ let isEngineReady = false;
 let MAP_LAYOUT = [];
 let CELL_TYPES = {};
 let PLACES = {};
+let PLACE_OCCUPANCY = {};
+let hasKeyframe = false;
+let AGENT_ORDER = []; // Agent ids by keyframe index; binary frames refer to agents by this index
+const VIEWPORT_UPDATE_DELAY = 150; // ms to wait after scrolling before reporting the viewport
+let viewportTimer = null;
+const AGENT_LOG_LIMIT = 50;
+const LOG_PAGE_SIZE = 20;
+// Must match STATE_CODES and NEED_NAMES in simulation/frame_codec.py
+const STATE_CODES = ['idle', 'moving', 'doing_action', 'interacting'];
+const NEED_NAMES = ['hunger', 'social', 'energy'];
 
 const map_place_ids = [];
 let AGENTS = {};
 let selectedAgentId = null;
+let selectedLog = []; // Log entries ({seq, entry}, newest first) of the inspected agent, fetched on demand
+let selectedLogHasMore = false; // Whether older entries can be paged in
 let isSimulationPaused = true;
 let mainLog = [];
 let DAILY_STORIES = [];
 
 const dom = {
     grid: document.getElementById('game-grid-container'),
+    gridWrapper: document.getElementById('game-grid-wrapper'),
     log: document.getElementById('log-output'),
     logTitle: document.getElementById('main-log-title'),
     inspectorTitle: document.getElementById('inspector-title'),
@@ -32,18 +45,156 @@ const dom = {
     roster: document.getElementById('agent-selection-panel'),
 };
 
-const socket = io();
+// Town to watch when the server hosts several (?town=<id>); its map arrives with the world snapshot
+const TOWN_ID = new URLSearchParams(window.location.search).get('town') || 'main';
+const socket = io({ query: { town: TOWN_ID } });
 
 // --- Socket.IO Event Handlers ---
-socket.on('connect', () => logToMain('Successfully connected to simulation server.'));
+socket.on('connect', () => {
+    logToMain('Successfully connected to simulation server.');
+    // The server starts every connection with a world snapshot; deltas apply on top of it
+    hasKeyframe = false;
+    if (MAP_LAYOUT.length) sendViewport(); // The server forgets viewports on reconnect
+    if (selectedAgentId) followAgentLog(selectedAgentId);
+});
+socket.on('connect_error', (error) => {
+    logToMain(`Connection to town '${TOWN_ID}' failed: ${error.message}`);
+});
 socket.on('command_client_ready', () => {
     logToMain('Simulation engine is ready. Starting visualization.');
+    if (selectedAgentId) followAgentLog(selectedAgentId);
     isEngineReady = true;
     isSimulationPaused = false;
     dom.pauseBtn.disabled = false;
 });
 
-socket.on('simulation_state_update', (data) => {
+// addAgent / removeAgent: Track agents as they enter and leave this client's view.
+function addAgent(agentData) {
+    AGENTS[agentData.id] = agentData;
+    AGENT_ORDER[agentData.index] = agentData.id;
+}
+
+function removeAgent(agentId) {
+    delete AGENTS[agentId];
+    document.getElementById(`agent-${agentId}`)?.remove();
+}
+
+// applyInterestChange: Applies agents entering and leaving the viewport; returns whether anything changed.
+function applyInterestChange(change) {
+    (change.entered || []).forEach(addAgent);
+    (change.left || []).forEach(removeAgent);
+    return Boolean(change.entered?.length || change.left?.length);
+}
+
+// sendViewport: Reports the visible map rectangle (in cells) so the server only sends nearby agents.
+function sendViewport() {
+    const wrapper = dom.gridWrapper;
+    socket.emit('set_viewport', {
+        x: Math.floor(wrapper.scrollLeft / CELL_SIZE),
+        y: Math.floor(wrapper.scrollTop / CELL_SIZE),
+        width: Math.ceil(wrapper.clientWidth / CELL_SIZE) + 1,
+        height: Math.ceil(wrapper.clientHeight / CELL_SIZE) + 1,
+    });
+}
+
+function scheduleViewportUpdate() {
+    clearTimeout(viewportTimer);
+    viewportTimer = setTimeout(sendViewport, VIEWPORT_UPDATE_DELAY);
+}
+
+function applyInterestUpdate(change) {
+    if (!applyInterestChange(change)) return;
+    change.entered.forEach(updateAgentAvatar);
+    renderAgentSelectionPanel();
+}
+
+socket.on('interest_update', change => applyOrDefer(applyInterestUpdate, change));
+
+// applyAgentDelta: Merges changed fields into the known agent state.
+function applyAgentDelta(delta) {
+    const agent = AGENTS[delta.id];
+    if (!agent) return;
+    Object.assign(agent, delta);
+}
+
+// --- Agent Log (fetched on demand for the inspected agent only) ---
+// followAgentLog: Subscribes to an agent's new log lines and fetches its latest page; null unsubscribes.
+function followAgentLog(agentId) {
+    selectedLog = [];
+    selectedLogHasMore = false;
+    socket.emit('subscribe_agent_log', { agent_id: agentId });
+    if (agentId) requestAgentLog(agentId, { limit: AGENT_LOG_LIMIT });
+}
+
+function requestAgentLog(agentId, params) {
+    socket.emit('request_agent_history', { agent_id: agentId, kind: 'log', limit: LOG_PAGE_SIZE, ...params });
+}
+
+// mergeLogEntries: Adds fetched or pushed entries to the inspected agent's log, deduplicated by seq.
+function mergeLogEntries(entries) {
+    const bySeq = new Map(selectedLog.map(e => [e.seq, e]));
+    entries.forEach(e => bySeq.set(e.seq, e));
+    selectedLog = [...bySeq.values()].sort((a, b) => b.seq - a.seq);
+}
+
+function renderSelectedLog() {
+    renderLog(selectedLog.map(e => e.entry));
+}
+
+socket.on('agent_history', (page) => {
+    if (page.error) {
+        logToMain(`Could not load history for ${page.agent_id}: ${page.error}`);
+        return;
+    }
+    if (page.kind !== 'log' || page.agent_id !== selectedAgentId) return;
+    mergeLogEntries(page.entries);
+    if (page.since !== null && page.since !== undefined) {
+        // Catching up after a gap: keep going until we reach the newest line
+        if (page.has_more) requestAgentLog(page.agent_id, { since: page.newest });
+    } else {
+        selectedLogHasMore = page.has_more;
+    }
+    renderSelectedLog();
+});
+
+socket.on('agent_log_lines', (page) => {
+    if (page.agent_id !== selectedAgentId || page.entries.length === 0) return;
+    const newestKnown = selectedLog.length ? selectedLog[0].seq : null;
+    const oldestPushed = page.entries[page.entries.length - 1].seq;
+    if (newestKnown !== null && oldestPushed > newestKnown + 1) {
+        requestAgentLog(page.agent_id, { since: newestKnown });
+    }
+    mergeLogEntries(page.entries);
+    if (selectedLog.length > AGENT_LOG_LIMIT) {
+        selectedLog = selectedLog.slice(0, AGENT_LOG_LIMIT);
+        selectedLogHasMore = true;
+    }
+    if (!(isSimulationPaused && isEngineReady)) renderSelectedLog();
+});
+
+// applyStateUpdate: Applies a keyframe or delta state payload and redraws what changed.
+function applyStateUpdate(data) {
+    // Always apply state so deltas stay consistent, even while rendering is paused
+    let rosterChanged = false;
+    if (data.keyframe) {
+        hasKeyframe = true;
+        rosterChanged = true;
+        // A keyframe lists every agent this client should know about (only those in view, if a viewport is set)
+        const present = new Set(data.agents.map(agentData => agentData.id));
+        Object.keys(AGENTS).filter(agentId => !present.has(agentId)).forEach(removeAgent);
+        AGENT_ORDER = [];
+        data.agents.forEach(agentData => {
+            if (!AGENTS[agentData.id]) logToMain(`${agentData.name} has entered the simulation.`);
+            addAgent(agentData);
+        });
+    } else if (!hasKeyframe) {
+        return; // Deltas are meaningless until the first keyframe arrives
+    } else {
+        rosterChanged = applyInterestChange(data);
+        data.agents.forEach(applyAgentDelta);
+    }
+    if (data.occupancy) PLACE_OCCUPANCY = data.occupancy;
+
     if (isSimulationPaused && isEngineReady) return;
     
     const [hour, minute] = data.time;
@@ -55,16 +206,87 @@ socket.on('simulation_state_update', (data) => {
     // BUG FIX: Use the dayOfWeek variable instead of "Day 1"
     dom.time.textContent = `${dayOfWeek}, ${displayHour}:${displayMinute} ${ampm}`;
 
-    const serverAgents = data.agents;
-    serverAgents.forEach(agentData => {
-        if (!AGENTS[agentData.id]) logToMain(`${agentData.name} has entered the simulation.`);
-        AGENTS[agentData.id] = agentData;
-        updateAgentAvatar(agentData);
-    });
-    renderAgentSelectionPanel();
+    data.agents.forEach(agentData => updateAgentAvatar(AGENTS[agentData.id]));
+    (data.entered || []).forEach(updateAgentAvatar);
+    if (rosterChanged) renderAgentSelectionPanel();
+    if (selectedAgentId && AGENTS[selectedAgentId]) {
+        inspectAgent(selectedAgentId, false);
+    }
+}
+
+socket.on('simulation_state_update', data => applyOrDefer(applyStateUpdate, data));
+
+// decodeFrame: Reads a binary agent frame (see simulation/frame_codec.py) into typed array views.
+function decodeFrame(buffer) {
+    const view = new DataView(buffer);
+    if (view.getUint8(0) !== 0x54 || view.getUint8(1) !== 0x46 || view.getUint8(2) !== 1) {
+        throw new Error('Unsupported simulation frame');
+    }
+    const count = view.getUint32(8, true);
+    let offset = 16;
+    const index = new Uint32Array(buffer, offset, count); offset += 4 * count;
+    const x = new Uint16Array(buffer, offset, count); offset += 2 * count;
+    const y = new Uint16Array(buffer, offset, count); offset += 2 * count;
+    const state = new Uint8Array(buffer, offset, count); offset += count;
+    const needs = new Uint8Array(buffer, offset, 3 * count);
+    return { seq: view.getUint32(4, true), count, index, x, y, state, needs };
+}
+
+function applyFrame(buffer) {
+    if (!hasKeyframe) return;
+    const frame = decodeFrame(buffer);
+    const changed = [];
+    for (let i = 0; i < frame.count; i++) {
+        const agent = AGENTS[AGENT_ORDER[frame.index[i]]];
+        if (!agent) continue;
+        agent.x = frame.x[i];
+        agent.y = frame.y[i];
+        agent.state = STATE_CODES[frame.state[i]];
+        NEED_NAMES.forEach((need, n) => { agent.needs[need] = frame.needs[3 * i + n]; });
+        changed.push(agent);
+    }
+    if (isSimulationPaused && isEngineReady) return;
+    changed.forEach(updateAgentAvatar);
     if (selectedAgentId && AGENTS[selectedAgentId]) {
         inspectAgent(selectedAgentId, false);
     }
+}
+
+socket.on('simulation_frame', buffer => applyOrDefer(applyFrame, buffer));
+
+// --- World Snapshot (sent once per connection) ---
+// Holds updates that arrive while the snapshot is being decompressed; they are applied after it.
+let pendingUpdates = null;
+
+function applyOrDefer(apply, data) {
+    if (pendingUpdates) pendingUpdates.push([apply, data]);
+    else apply(data);
+}
+
+// inflateSnapshot: Decompresses the zlib-compressed JSON snapshot sent by the server.
+async function inflateSnapshot(buffer) {
+    const stream = new Blob([buffer]).stream().pipeThrough(new DecompressionStream('deflate'));
+    return JSON.parse(await new Response(stream).text());
+}
+
+// world_snapshot: The static map, latest world state and story history in one message, so a
+// newly connected client renders immediately instead of waiting for the next keyframe.
+socket.on('world_snapshot', async (buffer) => {
+    pendingUpdates = [];
+    try {
+        const snapshot = await inflateSnapshot(buffer);
+        loadMapData(snapshot.map);
+        DAILY_STORIES = snapshot.stories.map(story => ({ day: story.day, text: story.text }));
+        renderFullDailyStories();
+        if (snapshot.state) applyStateUpdate(snapshot.state);
+        else socket.emit('request_keyframe', {}); // Nothing simulated yet or the server just restarted
+    } catch (error) {
+        console.error("Failed to read world snapshot:", error);
+        socket.emit('request_keyframe', {});
+    }
+    const pending = pendingUpdates;
+    pendingUpdates = null;
+    pending.forEach(([apply, data]) => apply(data));
 });
 
 // REMOVE OLD DAILY STORY PANEL
@@ -135,7 +357,10 @@ function createAgentAvatar(agent) {
 
 function updateAgentAvatar(agent) {
     let agentDiv = document.getElementById(`agent-${agent.id}`);
-    if (!agentDiv) createAgentAvatar(agent);
+    if (!agentDiv) {
+        createAgentAvatar(agent);
+        agentDiv = document.getElementById(`agent-${agent.id}`);
+    }
     agentDiv.style.left = `${agent.x * CELL_SIZE + 5}px`;
     agentDiv.style.top = `${agent.y * CELL_SIZE + 5}px`;
 
@@ -144,6 +369,7 @@ function updateAgentAvatar(agent) {
 }
 
 function inspectAgent(agentId, doLog = true) {
+    if (agentId !== selectedAgentId) followAgentLog(agentId);
     selectedAgentId = agentId;
     const agent = AGENTS[agentId];
     if (!agent) return;
@@ -162,7 +388,7 @@ function inspectAgent(agentId, doLog = true) {
     dom.inspectorNeeds.innerHTML = needsHTML;
     
     dom.logTitle.textContent = `${agent.name}'s Log`;
-    renderLog(agent.log);
+    renderSelectedLog();
     
     highlightSelection(agentId);
 }
@@ -170,13 +396,14 @@ function inspectAgent(agentId, doLog = true) {
 function inspectMapCell(x, y) {
     if (selectedAgentId) {
         logToMain("Switched back to main simulation log.");
+        followAgentLog(null);
     }
     selectedAgentId = null;
     const placeId = map_place_ids[y]?.[x];
     if (placeId && PLACES[placeId]) {
         const place = PLACES[placeId];
         dom.inspectorTitle.textContent = `Inspector: Location`;
-        dom.inspectorOutput.innerHTML = `<p><span class="font-semibold">Name:</span> ${place.type}</p>`;
+        dom.inspectorOutput.innerHTML = `<p><span class="font-semibold">Name:</span> ${place.type}</p><p><span class="font-semibold">People here:</span> ${PLACE_OCCUPANCY[placeId] || 0}</p>`;
         dom.inspectorGoal.innerHTML = '';
         dom.inspectorNeeds.innerHTML = '';
     } else {
@@ -281,41 +508,60 @@ dom.pauseBtn.addEventListener('click', () => {
     dom.pauseBtn.classList.toggle('hover:bg-yellow-600', !isSimulationPaused);
     dom.pauseBtn.classList.toggle('bg-green-500', isSimulationPaused);
     dom.pauseBtn.classList.toggle('hover:bg-green-600', isSimulationPaused);
+    if (!isSimulationPaused) Object.values(AGENTS).forEach(updateAgentAvatar);
     logToMain(`Simulation ${isSimulationPaused ? 'paused' : 'resumed'}.`);
 });
 
+// Scrolling or resizing the map changes which agents the server sends.
+dom.gridWrapper.addEventListener('scroll', scheduleViewportUpdate);
+window.addEventListener('resize', scheduleViewportUpdate);
+
+// Scrolling to the end of an agent's log pages in older entries.
+dom.log.addEventListener('scroll', () => {
+    if (!selectedAgentId || !selectedLogHasMore || selectedLog.length === 0) return;
+    if (dom.log.scrollTop + dom.log.clientHeight >= dom.log.scrollHeight - 10) {
+        selectedLogHasMore = false; // Only one page request in flight
+        requestAgentLog(selectedAgentId, { before: selectedLog[selectedLog.length - 1].seq });
+    }
+});
+
 // --- Initialization ---
 // initialize: Loads map data and sets up the frontend UI.
-async function initialize() {
-    logToMain('Frontend loaded. Fetching map data...');
-    try {
-        const response = await fetch('/map_data.json');
-        const data = await response.json();
+// loadMapData: Builds the map from map_data.json contents; later calls are ignored.
+function loadMapData(data) {
+    if (MAP_LAYOUT.length) return;
+    MAP_LAYOUT = data.layout;
+    CELL_TYPES = data.cell_types;
+    PLACES = data.places;
+    
+    const MAP_ROWS = MAP_LAYOUT.length;
+    const MAP_COLS = MAP_LAYOUT[0].length;
 
-        MAP_LAYOUT = data.layout;
-        CELL_TYPES = data.cell_types;
-        PLACES = data.places;
-        
-        const MAP_ROWS = MAP_LAYOUT.length;
-        const MAP_COLS = MAP_LAYOUT[0].length;
+    for (let i = 0; i < MAP_ROWS; i++) {
+        map_place_ids.push(Array(MAP_COLS).fill(null));
+    }
 
-        for (let i = 0; i < MAP_ROWS; i++) {
-            map_place_ids.push(Array(MAP_COLS).fill(null));
-        }
+    for (const placeId in PLACES) {
+        PLACES[placeId].coords.forEach(coord => {
+            const [x, y] = coord;
+            if (y >= 0 && y < MAP_ROWS && x >= 0 && x < MAP_COLS) {
+                map_place_ids[y][x] = placeId;
+            }
+        });
+    }
 
-        for (const placeId in PLACES) {
-            PLACES[placeId].coords.forEach(coord => {
-                const [x, y] = coord;
-                if (y >= 0 && y < MAP_ROWS && x >= 0 && x < MAP_COLS) {
-                    map_place_ids[y][x] = placeId;
-                }
-            });
-        }
-        
-        renderMap();
-        logToMain('Map data loaded. Waiting for simulation engine...');
-        dom.pauseBtn.disabled = true;
+    renderMap();
+    sendViewport();
+    logToMain('Map data loaded. Waiting for simulation engine...');
+}
 
+async function initialize() {
+    dom.pauseBtn.disabled = !isEngineReady;
+    if (MAP_LAYOUT.length || TOWN_ID !== 'main') return; // Delivered with the world snapshot
+    logToMain('Frontend loaded. Fetching map data...');
+    try {
+        const response = await fetch('/map_data.json');
+        loadMapData(await response.json());
     } catch (error) {
         console.error("Failed to load map data:", error);
         logToMain("Error: Could not load map data. Please check the console.");